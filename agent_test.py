@@ -3,13 +3,34 @@ tests to run and debug your minimax and alphabeta agents locally.  The test
 cases used by the project assistant are not public.
 """
 
+import array
+import contextlib
+import io
+import pickle
+import os
+import random
+import tempfile
+import timeit
 import unittest
 
+import batch_scores
+import benchmark
 import isolation
+import compiled_model
+import competition_agent
+import endgame
 import game_agent
+import game_records
+import opening_book
+import sample_players
+import score_model
+import selfplay
+import tournament
 
 from importlib import reload
 
+import numpy
+
 
 class IsolationTest(unittest.TestCase):
     """Unit tests for isolation agents"""
@@ -25,8 +46,1005 @@ class IsolationTest(unittest.TestCase):
         self.game.apply_move((2, 3))
         self.game.apply_move((0, 5))
         print(self.game.to_string())
+        self.player1.time_left = lambda: 1000.
         self.player1.minimax( self.game, depth=1)
-        
+
+
+class BitBoardTest(unittest.TestCase):
+    """BitBoard must agree with Board on every public query"""
+
+    def setUp(self):
+        self.player1 = "Player1"
+        self.player2 = "Player2"
+
+    def test_matches_board(self):
+        for width, height in [(7, 7), (5, 8)]:
+            rng = random.Random(width)
+            board = isolation.Board(self.player1, self.player2, width, height)
+            bitboard = isolation.BitBoard(self.player1, self.player2, width, height)
+            while True:
+                for player in (self.player1, self.player2):
+                    self.assertEqual(sorted(board.get_legal_moves(player)),
+                                     sorted(bitboard.get_legal_moves(player)))
+                    self.assertEqual(board.get_player_location(player),
+                                     bitboard.get_player_location(player))
+                    self.assertEqual(board.utility(player), bitboard.utility(player))
+                    self.assertEqual(len(board.get_legal_moves(player)),
+                                     board.count_legal_moves(player))
+                    self.assertEqual(board.count_legal_moves(player),
+                                     bitboard.count_legal_moves(player))
+                self.assertEqual(board._board_state, bitboard._board_state)
+                self.assertEqual(len(board.get_blank_spaces()), board.blank_count())
+                self.assertEqual(board.blank_count(), bitboard.blank_count())
+                self.assertEqual(board.is_partitioned(), bitboard.is_partitioned())
+                for player in (self.player1, self.player2):
+                    self.assertEqual(board.reachable_cells(player),
+                                     bitboard.reachable_cells(player))
+                moves = board.get_legal_moves()
+                if not moves:
+                    break
+                move = rng.choice(moves)
+                board.apply_move(move)
+                bitboard = bitboard.forecast_move(move)
+
+
+    def test_shared_tables(self):
+        for width, height in [(7, 7), (5, 8)]:
+            board = isolation.Board(self.player1, self.player2, width, height)
+            other = isolation.BitBoard(self.player1, self.player2, width, height)
+            self.assertIs(board._neighbors, other.copy()._neighbors)
+            neighbors, cells, cell_index = isolation.knight_tables(width, height)
+            self.assertEqual(width * height, len(neighbors))
+            for idx, (r, c) in enumerate(cells):
+                self.assertEqual(idx, cell_index[(r, c)])
+                self.assertEqual(sorted(cell_index[move] for move in
+                                        [(r + dr, c + dc) for dr, dc in
+                                         [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                                          (1, -2), (1, 2), (2, -1), (2, 1)]]
+                                        if move in cell_index),
+                                 sorted(neighbors[idx]))
+            self.assertFalse(board.move_is_legal((height, 0)))
+            self.assertFalse(board.move_is_legal((0, -1)))
+
+
+class PushPopTest(unittest.TestCase):
+    """push_move()/pop_move() and the inplace search mode built on them"""
+
+    def setUp(self):
+        self.player1 = "Player1"
+        self.player2 = "Player2"
+
+    def test_push_pop_move(self):
+        for board_class in (isolation.Board, isolation.BitBoard):
+            game = board_class(self.player1, self.player2)
+            game.apply_move((2, 3))
+            game.apply_move((0, 5))
+            counts = lambda: (game.blank_count(), game.count_legal_moves(self.player1),
+                              game.count_legal_moves(self.player2))
+            before = (game.to_string(), game.move_count, game.active_player, counts())
+            for move in game.get_legal_moves():
+                forecast = game.forecast_move(move)
+                game.push_move(move)
+                self.assertEqual(forecast._board_state, game._board_state)
+                for reply in game.get_legal_moves():
+                    game.push_move(reply)
+                    self.assertEqual(forecast.forecast_move(reply)._board_state,
+                                     game._board_state)
+                    self.assertEqual((forecast.forecast_move(reply).blank_count(),
+                                      forecast.forecast_move(reply).count_legal_moves(self.player1)),
+                                     counts()[:2])
+                    game.pop_move()
+                game.pop_move()
+                self.assertEqual(before, (game.to_string(), game.move_count,
+                                          game.active_player, counts()))
+
+    def test_inplace_search(self):
+        for board_class in (isolation.Board, isolation.BitBoard):
+            for player in (game_agent.MinimaxPlayer(inplace=True),
+                           game_agent.AlphaBetaPlayer(inplace=True)):
+                game = board_class(player, self.player2)
+                game.apply_move((2, 3))
+                game.apply_move((0, 5))
+                before = game.to_string()
+                start = timeit.default_timer()
+                time_left = lambda: 100. - 1000 * (timeit.default_timer() - start)
+                move = player.get_move(game, time_left)
+                self.assertIn(move, game.get_legal_moves())
+                self.assertEqual(before, game.to_string())
+                self.assertEqual(2, game.move_count)
+
+    def test_inplace_timeout_unwinds(self):
+        for board_class in (isolation.Board, isolation.BitBoard):
+            for player in (game_agent.MinimaxPlayer(search_depth=4, inplace=True),
+                           game_agent.AlphaBetaPlayer(inplace=True)):
+                game = board_class(player, self.player2)
+                game.apply_move((2, 3))
+                game.apply_move((0, 5))
+                before = game.to_string()
+                calls = []
+
+                def time_left():
+                    # time out deep inside the tree after a few nodes
+                    calls.append(1)
+                    return 100. if len(calls) < 20 else 0.
+
+                player.get_move(game, time_left)
+                self.assertGreaterEqual(len(calls), 20)
+                self.assertEqual(before, game.to_string())
+                self.assertEqual(2, game.move_count)
+
+
+class TranspositionTableTest(unittest.TestCase):
+    """Zobrist hashing and the alpha-beta transposition table"""
+
+    def test_incremental_hash(self):
+        for board_class in (isolation.Board, isolation.BitBoard):
+            rng = random.Random(3)
+            game = board_class("Player1", "Player2")
+            hashes = []
+            while game.get_legal_moves():
+                self.assertEqual(game.zobrist_hash(), game.hash())
+                hashes.append(game.hash())
+                game.push_move(rng.choice(sorted(game.get_legal_moves())))
+            self.assertEqual(len(hashes), len(set(hashes)))
+            while hashes:
+                game.pop_move()
+                self.assertEqual(hashes.pop(), game.hash())
+
+    def test_transposition(self):
+        game = isolation.Board("Player1", "Player2")
+        for move in [(0, 0), (6, 6), (1, 2), (5, 4), (3, 3)]:
+            game.apply_move(move)
+        other = isolation.Board("Player1", "Player2")
+        for move in [(0, 0), (6, 6), (2, 1), (5, 4), (3, 3)]:
+            other.apply_move(move)
+        self.assertNotEqual(game.hash(), other.hash())
+        # player 1 visits the same cells in a different order
+        other = isolation.Board("Player1", "Player2")
+        for move in [(1, 2), (6, 6), (0, 0), (5, 4), (3, 3)]:
+            other.apply_move(move)
+        self.assertEqual(game.to_string(), other.to_string())
+        self.assertEqual(game.hash(), other.hash())
+
+    def test_search_value_unchanged(self):
+        inf = float("inf")
+        for seed in range(4):
+            rng = random.Random(seed)
+            plain = game_agent.AlphaBetaPlayer(inplace=True)
+            cached = game_agent.AlphaBetaPlayer(inplace=True, tt_size=1024)
+            for player in (plain, cached):
+                player.time_left = lambda: 1000.
+            plain_game = isolation.BitBoard(plain, "Player2")
+            cached_game = isolation.BitBoard(cached, "Player2")
+            for move in [(3, 3), (2, 3)]:
+                plain_game.apply_move(move)
+                cached_game.apply_move(move)
+            for _ in range(2 * seed):
+                move = rng.choice(sorted(plain_game.get_legal_moves()))
+                plain_game.apply_move(move)
+                cached_game.apply_move(move)
+            for depth in range(1, 5):
+                cached.alphabeta(cached_game, depth)
+                self.assertEqual(plain.max_value(plain_game, depth, -inf, inf),
+                                 cached.max_value(cached_game, depth, -inf, inf))
+
+    def test_canonical_form(self):
+        cells, cell_index = isolation.knight_tables(7, 7)[1:]
+        moves = [(0, 1), (6, 6), (2, 0), (4, 5), (3, 2)]
+        game = isolation.Board("Player1", "Player2")
+        for move in moves:
+            game.apply_move(move)
+        state, symmetry = game.canonical_form()
+        for index, perm in enumerate(isolation.symmetry_tables(7, 7)):
+            other = isolation.BitBoard("Player1", "Player2")
+            for move in moves:
+                other.apply_move(cells[perm[cell_index[move]]])
+            self.assertEqual(state, other.canonical_form()[0])
+            self.assertEqual(game.canonical_hash()[0], other.canonical_hash()[0])
+            if index == symmetry:
+                self.assertEqual(state, tuple(other._board_state))
+                self.assertEqual(other.hash(), game.canonical_hash()[0])
+
+    def test_symmetric_table(self):
+        inf = float("inf")
+        plain = game_agent.AlphaBetaPlayer(
+            score_fn=sample_players.improved_score, inplace=True, tt_size=2**12)
+        symmetric = game_agent.AlphaBetaPlayer(
+            score_fn=sample_players.improved_score, inplace=True, tt_size=2**12,
+            tt_symmetry_plies=2)
+        for player in (plain, symmetric):
+            player.time_left = lambda: 1000.
+        plain_game = isolation.Board(plain, "Player2", 5, 5)
+        symmetric_game = isolation.Board(symmetric, "Player2", 5, 5)
+        for depth in range(1, 4):
+            move = symmetric.alphabeta(symmetric_game, depth)
+            self.assertIn(move, symmetric_game.get_legal_moves())
+            self.assertEqual(plain.max_value(plain_game, depth, -inf, inf),
+                             symmetric.max_value(symmetric_game, depth, -inf, inf))
+
+    def test_asymmetric_score(self):
+        def root_value(score_fn, move):
+            player = game_agent.AlphaBetaPlayer(score_fn=score_fn, inplace=True, tt_size=2**12)
+            player.time_left = isolation.TurnTimer(float("inf"))
+            game = isolation.BitBoard("Player1", player)
+            game.apply_move(move)
+            return player.deepen(game, 3)[-1][2]
+
+        # (2, 2) is the mirror image of (2, 4): a symmetric table gives both
+        # the same value, which is wrong for custom_score
+        self.assertEqual(root_value(sample_players.improved_score, (2, 4)),
+                         root_value(sample_players.improved_score, (2, 2)))
+        self.assertNotEqual(root_value(game_agent.custom_score, (2, 4)),
+                            root_value(game_agent.custom_score, (2, 2)))
+        for score_fn in (game_agent.custom_score, sample_players.center_score):
+            with self.assertRaises(ValueError):
+                game_agent.AlphaBetaPlayer(score_fn=score_fn, tt_symmetry_plies=4)
+
+    def test_replacement(self):
+        table = game_agent.TranspositionTable(4)
+        table.store(1, 5, 1., -10., 10., (0, 0))
+        table.store(5, 2, 2., -10., 10., (1, 1))
+        self.assertEqual((0, 0), table.get(1).move)
+        self.assertIsNone(table.get(5))
+        table.new_search()
+        table.store(5, 2, 2., -10., 10., (1, 1))
+        self.assertEqual((1, 1), table.get(5).move)
+        self.assertEqual((2., (1, 1)), table.probe(5, 2, -10., 10.))
+        table.store(2, 1, 3., 5., 10., (2, 2))
+        self.assertEqual((None, (2, 2)), table.probe(2, 1, 0., 2.))
+        self.assertEqual((3., (2, 2)), table.probe(2, 1, 4., 8.))
+
+
+class ParallelSearchTest(unittest.TestCase):
+    """Root-split search across worker processes"""
+
+    def test_matches_serial(self):
+        for seed in range(3):
+            rng = random.Random(seed)
+            moves = []
+            game = isolation.BitBoard("Player1", "Player2", 5, 5)
+            # random moves up to a position with player 1 to move and a choice
+            while len(moves) < 6 or len(moves) % 2 or len(game.get_legal_moves()) < 2:
+                moves.append(rng.choice(sorted(game.get_legal_moves())))
+                game.apply_move(moves[-1])
+            serial = game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score)
+            parallel = game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score,
+                                                  processes=2)
+            games = []
+            for player in (serial, parallel):
+                games.append(isolation.BitBoard(player, "Player2", 5, 5))
+                for move in moves:
+                    games[-1].apply_move(move)
+            with parallel:
+                self.assertIsNotNone(parallel._pool)
+                # no time limit: both search to the end of the game
+                serial.get_move(games[0], lambda: 1e6)
+                move = parallel.get_move(games[1], lambda: 1e6)
+            self.assertIn(move, games[1].get_legal_moves())
+            self.assertEqual(serial.root_score, parallel.root_score)
+            # a closed player searches alone instead of starting a pool
+            parallel.get_move(games[1], lambda: 1e6)
+            self.assertIsNone(parallel._pool)
+            self.assertEqual(serial.root_score, parallel.root_score)
+
+
+class MoveOrderingTest(unittest.TestCase):
+    """PV, killer and history move ordering in AlphaBetaPlayer"""
+
+    def setUp(self):
+        self.player = game_agent.AlphaBetaPlayer(inplace=True, ordering=True)
+        self.player.time_left = lambda: 1000.
+        self.game = isolation.Board(self.player, "Player2")
+        for move in [(3, 3), (2, 3), (1, 2), (0, 5)]:
+            self.game.apply_move(move)
+
+    def test_deterministic(self):
+        moves = []
+        for _ in range(3):
+            game = self.game.copy()
+            self.player.start_search(game, 10)
+            moves.append([self.player.alphabeta(game, depth)
+                          for depth in range(1, 5)])
+            self.assertFalse(game.shuffle_moves)
+            self.assertEqual(game.get_legal_moves(), game.get_legal_moves())
+        self.assertEqual(moves[0], moves[1])
+        self.assertEqual(moves[0], moves[2])
+
+    def test_principal_variation(self):
+        inf = float("inf")
+        plain = game_agent.AlphaBetaPlayer()
+        plain.time_left = lambda: 1000.
+        self.player.start_search(self.game, 10)
+        for depth in range(1, 5):
+            move = self.player.alphabeta(self.game, depth)
+            pv = self.player.principal_variation
+            self.assertEqual(move, pv[0])
+            self.assertLessEqual(len(pv), depth)
+            # the PV move scores as well as the best move of a plain search
+            game = isolation.Board(plain, "Player2")
+            for past in [(3, 3), (2, 3), (1, 2), (0, 5)]:
+                game.apply_move(past)
+            self.assertEqual(
+                plain.max_value(game, depth, -inf, inf),
+                plain.min_value(game.forecast_move(move), depth - 1, -inf, inf))
+
+
+class PrincipalVariationSearchTest(unittest.TestCase):
+    """Null window (pvs) and aspiration window searches in AlphaBetaPlayer"""
+
+    def test_matches_full_window(self):
+        for seed in range(4):
+            rng = random.Random(seed)
+            moves = []
+            game = isolation.BitBoard("Player1", "Player2", 5, 5)
+            while len(moves) < 4 or len(moves) % 2:
+                moves.append(rng.choice(sorted(game.get_legal_moves())))
+                game.apply_move(moves[-1])
+            scores = []
+            for options in (dict(), dict(pvs=True), dict(pvs=True, aspiration=.5),
+                            dict(pvs=True, aspiration=1., tt_size=2**12, ordering=True)):
+                player = game_agent.AlphaBetaPlayer(
+                    score_fn=sample_players.improved_score, inplace=True,
+                    stats=True, **options)
+                player.time_left = lambda: 1e6
+                game = isolation.BitBoard(player, "Player2", 5, 5)
+                for move in moves:
+                    game.apply_move(move)
+                iterations = player.deepen(game, 5)
+                self.assertEqual(len(iterations), 5)
+                scores.append([score for _, _, score in iterations])
+            for other in scores[1:]:
+                self.assertEqual(scores[0], other)
+
+
+class TimeManagerTest(unittest.TestCase):
+    """Iteration time prediction and partial iterations in AlphaBetaPlayer"""
+
+    def test_predict_millis(self):
+        predict = game_agent.AlphaBetaPlayer.predict_millis
+        self.assertEqual(predict([5.]), 0.)
+        self.assertEqual(predict([.1, 20.]), 0.)
+        self.assertEqual(predict([1., 4.]), 16.)
+        self.assertEqual(predict([1., 9., 4.]), 8.)
+        self.assertEqual(predict([2., 1., 2.]), 2.)
+
+    def test_stops_early(self):
+        # a clock that advances with every check (one per POLL_NODES nodes),
+        # so iteration times grow with the number of nodes searched
+        clock = [300.]
+
+        def time_left():
+            clock[0] -= .01 * game_agent.POLL_NODES
+            return clock[0]
+
+        player = game_agent.AlphaBetaPlayer(
+            score_fn=sample_players.improved_score, inplace=True, tt_size=2**12,
+            ordering=True, time_manager=True, stats=True)
+        game = isolation.BitBoard(player, "Player2")
+        for move in [(3, 3), (2, 3), (1, 2), (0, 5)]:
+            game.apply_move(move)
+        move = player.get_move(game, time_left)
+        self.assertIn(move, game.get_legal_moves())
+        self.assertEqual(player.stats.early_stops, 1)
+        self.assertGreater(clock[0], player.TIMER_THRESHOLD)
+        self.assertEqual(game.move_count, 4)
+
+
+class TimerTest(unittest.TestCase):
+    """TurnTimer deadlines and node-count polling of the clock"""
+
+    def test_check_time(self):
+        timer = isolation.TurnTimer(100.)
+        self.assertTrue(0. < timer() <= 100.)
+        self.assertAlmostEqual(timer(), 1000. * (timer.deadline - timeit.default_timer()),
+                               places=1)
+        player = game_agent.AlphaBetaPlayer()
+        player.time_left = isolation.TurnTimer(100.)
+        player.check_time()
+        player.time_left = isolation.TurnTimer(player.TIMER_THRESHOLD / 2)
+        with self.assertRaises(game_agent.SearchTimeout):
+            player.check_time()
+
+    def test_poll_nodes(self):
+        for poll_nodes in (1, 8):
+            player = game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score,
+                                                stats=True, poll_nodes=poll_nodes)
+            calls = []
+            player.time_left = lambda: calls.append(1) or 1000.
+            game = isolation.Board(player, "Player2")
+            game.apply_move((2, 3))
+            game.apply_move((0, 5))
+            player.alphabeta(game, 3)
+            # one check at the root, then one per poll_nodes nodes
+            self.assertEqual(len(calls), 1 + player.stats.nodes // poll_nodes)
+
+
+class CompiledModelTest(unittest.TestCase):
+    """The flattened tree ensemble used by learned_score()"""
+
+    def test_predict(self):
+        L = compiled_model.LEAF
+        # tree 1 splits on the initiative column (49), tree 2 is a single leaf
+        model = compiled_model.CompiledForest(
+            [1, 2], [0, 3], [49, L, L, L], [0.5, 0., 0., 0.],
+            [1, L, L, L], [2, L, L, L],
+            [.5, .5, .9, .1, .2, .8, .5, .5])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "model.json")
+            model.save(path)
+            model = compiled_model.CompiledForest.load(path)
+        player = game_agent.AlphaBetaPlayer(score_fn=game_agent.learned_score)
+        game = isolation.BitBoard(player, "Player2")
+        game.apply_move((2, 3))
+        rows = [compiled_model.board_features(game.forecast_move(move))
+                for move in game.get_legal_moves()]
+        self.assertEqual(52, len(rows[0]))
+        # every child has player 1 to move: tree 1 predicts [.9, .1]
+        self.assertEqual([[.7, .3]] * len(rows),
+                         [[round(p, 6) for p in probs]
+                          for probs in model.predict_proba_batch(rows)])
+        self.assertAlmostEqual(.35, model.predict_proba(game._board_state[:-2] + [0, 0])[0])
+        self.assertEqual(model.predict_proba(rows[0])[1], model.predict_class(rows[0], 1))
+        game_agent._score_model = model
+        try:
+            # player 1 to move again after one move each: P(winner 1) = .7
+            child = game.forecast_move(game.get_legal_moves()[0])
+            self.assertAlmostEqual(.4, round(game_agent.learned_score(child, player), 1))
+            self.assertAlmostEqual(-.4, round(game_agent.learned_score(child, "Player2"), 1))
+        finally:
+            game_agent._score_model = None
+
+    def test_compile_forest(self):
+        from sklearn.ensemble import ExtraTreesClassifier
+        rng = random.Random(1)
+        x = [[rng.randrange(3) for _ in range(8)] for _ in range(200)]
+        y = [1 + (row[0] + row[3] > 2 or rng.random() < .2) for row in x]
+        estimator = ExtraTreesClassifier(n_estimators=5, random_state=0).fit(x, y)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "model.json")
+            with contextlib.redirect_stdout(io.StringIO()):
+                score_model.export_compiled_model(estimator, path)
+            model = compiled_model.CompiledForest.load(path)
+        self.assertEqual([1, 2], model.classes)
+        expected = estimator.predict_proba(x).tolist()
+        for probs, row in zip(expected, model.predict_proba_batch(x)):
+            self.assertEqual([round(p, 9) for p in probs], [round(p, 9) for p in row])
+
+
+class BatchScoreTest(unittest.TestCase):
+    """Batch score functions and batched frontier scoring in AlphaBetaPlayer"""
+
+    def setUp(self):
+        L = compiled_model.LEAF
+        # splits on the initiative column (49), then on a player 1 cell (8)
+        game_agent._score_model = compiled_model.CompiledForest(
+            [1, 2], [0], [49, 8, L, L, L], [0.5, 0.5, 0., 0., 0.],
+            [1, 3, L, L, L], [2, 4, L, L, L],
+            [.5, .5, .5, .5, .9, .1, .3, .7, .6, .4])
+
+    def tearDown(self):
+        game_agent._score_model = None
+
+    def test_matches_scalar(self):
+        score_fns = [sample_players.open_move_score, sample_players.improved_score,
+                     sample_players.center_score, game_agent.custom_score,
+                     game_agent.learned_score]
+        for seed in range(20):
+            rng = random.Random(seed)
+            for board_class in (isolation.Board, isolation.BitBoard):
+                game = board_class("Player1", "Player2")
+                for _ in range(rng.randint(2, 24)):
+                    if not game.get_legal_moves():
+                        break
+                    game.apply_move(rng.choice(sorted(game.get_legal_moves())))
+                moves = game.get_legal_moves()
+                for score_fn in score_fns:
+                    batch_score = batch_scores.batch_score_fn(score_fn)
+                    for player in ("Player1", "Player2"):
+                        expected = [score_fn(game.forecast_move(move), player)
+                                    for move in moves]
+                        for score, other in zip(batch_score(game, moves, player), expected):
+                            self.assertAlmostEqual(score, other)
+
+    def test_search_value_unchanged(self):
+        for score_fn in (sample_players.improved_score, game_agent.learned_score):
+            scores = []
+            for batch in (False, True):
+                player = game_agent.AlphaBetaPlayer(
+                    score_fn=score_fn, inplace=True, pvs=True, batch=batch)
+                player.time_left = lambda: 1e6
+                game = isolation.BitBoard(player, "Player2")
+                for move in [(3, 3), (2, 3), (1, 2), (0, 5)]:
+                    game.apply_move(move)
+                scores.append([score for _, _, score in player.deepen(game, 4)])
+            self.assertEqual(scores[0], scores[1])
+
+
+class SearchStatsTest(unittest.TestCase):
+    """Opt-in search statistics collected by players and Board.play()"""
+
+    def test_game_stats(self):
+        random.seed(0)
+        player1 = game_agent.AlphaBetaPlayer(inplace=True, ordering=True, stats=True)
+        player2 = game_agent.MinimaxPlayer(stats=True)
+        game = isolation.BitBoard(player1, player2)
+        for move in [(2, 3), (0, 5)]:
+            game.apply_move(move)
+        winner, history, termination, _ = game.play(time_limit=50)
+        stats1, stats2 = game.search_stats
+        # the loser's final get_move() call has no move in the history
+        self.assertEqual(len(history) + 1, stats1.moves + stats2.moves)
+        self.assertEqual(stats1.moves, len(stats1.margins))
+        self.assertEqual(stats1.moves, len(stats1.depths))
+        self.assertEqual(sum(stats1.iterations), sum(stats1.depths))
+        self.assertGreater(stats1.leaves, 0)
+        self.assertGreaterEqual(stats1.nodes, stats1.leaves)
+        self.assertGreater(sum(stats1.cutoffs), 0)
+        self.assertEqual([], stats2.cutoffs)
+        self.assertEqual([3] * stats2.moves, [d for d in stats2.depths if d])
+        # the copies kept on the board are unaffected by later resets
+        total = stats1.copy().merge(stats1)
+        player1.stats.reset()
+        self.assertEqual(2 * stats1.nodes, total.nodes)
+        self.assertEqual(2 * stats1.moves, total.summary()["moves"])
+        self.assertEqual((None, None), isolation.Board("Player1", "Player2").search_stats)
+
+
+class SeededTournamentTest(unittest.TestCase):
+    """Reproducible tournaments and the game result cache"""
+
+    def test_result_cache(self):
+        self.assertEqual(
+            tournament.config_hash(game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score)),
+            tournament.config_hash(game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score)))
+        self.assertNotEqual(
+            tournament.config_hash(game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score)),
+            tournament.config_hash(game_agent.AlphaBetaPlayer(score_fn=game_agent.custom_score)))
+        cpu_agents = [tournament.Agent(sample_players.RandomPlayer(), "Random")]
+        test_agents = [tournament.Agent(sample_players.RandomPlayer(), "Random_{}".format(i))
+                       for i in range(4)]
+        save_game = tournament.SAVE_GAME
+        tournament.SAVE_GAME = False
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "results.jsonl")
+                outputs = []
+                for _ in range(2):
+                    out = io.StringIO()
+                    with contextlib.redirect_stdout(out):
+                        tournament.play_matches(cpu_agents, test_agents, 2, num_processes=1,
+                                                seed=7, result_cache=path)
+                    lines = out.getvalue().splitlines()
+                    outputs.append([line for line in lines if "games read" not in line])
+                    outputs.append([line for line in lines if "games read" in line])
+                self.assertEqual(16, len(tournament.ResultCache(path)))
+        finally:
+            tournament.SAVE_GAME = save_game
+        self.assertEqual(outputs[0], outputs[2])
+        self.assertTrue(outputs[1][0].startswith("0 of 16 games"))
+        self.assertTrue(outputs[3][0].startswith("16 of 16 games"))
+
+    def test_termination_counts(self):
+        class ForfeitPlayer:
+            def get_move(self, game, time_left):
+                return (-1, -1)
+
+        cpu_agent = tournament.Agent(sample_players.RandomPlayer(), "Random")
+        test_agents = [tournament.Agent(sample_players.RandomPlayer(), "Random_2"),
+                       tournament.Agent(ForfeitPlayer(), "Forfeit")]
+        save_game = tournament.SAVE_GAME
+        tournament.SAVE_GAME = False
+        try:
+            random.seed(5)
+            serial = tournament.play_round(cpu_agent, test_agents, dict.fromkeys(
+                [cpu_agent.player] + [agent.player for agent in test_agents], 0), 3)
+            tournament._set_agents([cpu_agent], test_agents)
+            futures = tournament.submit_round(tournament.InlineExecutor(), 0, cpu_agent,
+                                              test_agents, 3, 5)
+            collected = tournament.collect_round(futures, cpu_agent, test_agents, dict.fromkeys(
+                [cpu_agent.player] + [agent.player for agent in test_agents], 0))
+        finally:
+            tournament.SAVE_GAME = save_game
+        # every game of the forfeiting agent counts, in both seats
+        self.assertEqual((0, 6), serial)
+        self.assertEqual(serial, collected[:2])
+
+
+class SPRTTest(unittest.TestCase):
+    """Sequential probability ratio tests and early stopping in tournaments"""
+
+    def test_sprt(self):
+        test = tournament.SPRT(delta=.15, alpha=.05, beta=.05)
+        for _ in range(20):
+            test.add(True, True)
+            test.add(False, False)
+        self.assertEqual((0, 0, None), (test.wins, test.losses, test.result))
+        while test.result is None:
+            test.add(True, False)
+        self.assertEqual("better", test.result)
+        test.add(False, True)
+        self.assertEqual(0, test.losses)
+        test = tournament.SPRT()
+        while test.result is None:
+            test.add(False, True)
+        self.assertEqual("not better", test.result)
+
+    def test_play_sprt(self):
+        cpu_agents = [tournament.Agent(sample_players.RandomPlayer(), "Random")]
+        test_agents = [tournament.Agent(sample_players.RandomPlayer(), "Random_2"),
+                       tournament.Agent(sample_players.GreedyPlayer(), "Greedy"),
+                       tournament.Agent(sample_players.RandomPlayer(), "Random_3")]
+        save_game = tournament.SAVE_GAME
+        tournament.SAVE_GAME = False
+        try:
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                results = tournament.play_sprt(cpu_agents, test_agents, 20, num_processes=1,
+                                               seed=3, result_cache=None)
+        finally:
+            tournament.SAVE_GAME = save_game
+        self.assertEqual({"Random_2": None, "Greedy": "better", "Random_3": None}, results)
+        # the games Greedy did not need went to Random_3
+        self.assertIn("120 of 120 games played", out.getvalue())
+        self.assertRegex(out.getvalue(), r"Random_3\s+48\s")
+
+
+class SelfPlayTest(unittest.TestCase):
+    """Self-play position files, resumed runs and their positions"""
+
+    def test_generate(self):
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+            path = os.path.join(tmp, "selfplay.pos")
+            self.assertEqual(4, selfplay.generate(path, 4, depth=2, processes=1, chunk_rows=40))
+            # a chunk cut short is dropped and the missing games played
+            with open(path, "ab") as f:
+                f.write(selfplay.CHUNK_HEADER.pack(10, 7, 7, 0) + b"\0" * 30)
+            self.assertEqual(2, selfplay.generate(path, 6, depth=2, processes=1, chunk_rows=40))
+            self.assertEqual(0, selfplay.generate(path, 6, depth=2, processes=1))
+            other = os.path.join(tmp, "other.pos")
+            selfplay.generate(other, 6, depth=2, processes=1, chunk_rows=40)
+            # each game is seeded, so replaying it gives the same positions
+            positions = []
+            for name in (path, other):
+                positions.append(sorted(
+                    (chunk.games[row], chunk.plies[row], chunk.scores[row])
+                    for chunk in selfplay.read_chunks(name) for row in range(len(chunk.plies))))
+            self.assertEqual(positions[0], positions[1])
+
+            chunks = list(selfplay.read_chunks(path))
+            self.assertEqual(set(range(6)), set().union(*(chunk.games for chunk in chunks)))
+            for chunk in chunks:
+                size = chunk.width * chunk.height + 3
+                for row, ply in enumerate(chunk.plies):
+                    state = chunk.states[row * size:(row + 1) * size]
+                    # every move blocks one cell; plies start after the opening
+                    self.assertEqual(ply, sum(state[:-3]))
+                    self.assertEqual(ply & 1, state[-3])
+                    self.assertGreaterEqual(ply, selfplay.OPENING_PLIES)
+                    self.assertEqual(2, chunk.depths[row])
+                self.assertLessEqual(set(chunk.winners), {1, 2})
+
+    def test_board_too_large(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaises(ValueError):
+                selfplay.generate(os.path.join(tmp, "selfplay.pos"), 1, depth=1,
+                                  processes=1, width=16, height=16)
+
+
+class ScoreModelTest(unittest.TestCase):
+    """Position loading and streaming training of score_model.py"""
+
+    def write_files(self, tmp, games=12):
+        """Write random 5x5 games to a position file and a record file;
+        player 2 wins every fourth game.  Returns (paths, positions).
+        """
+        rng = random.Random(0)
+        paths = [os.path.join(tmp, "games.pos"), os.path.join(tmp, "games.rec")]
+        positions = 0
+        with selfplay.PositionWriter(paths[0], 5, 5, chunk_rows=10) as positions_file, \
+                game_records.GameRecordWriter(paths[1]) as records:
+            for number in range(games):
+                game = isolation.Board("Player1", "Player2", 5, 5)
+                states, moves = bytearray(), []
+                while game.get_legal_moves():
+                    states.extend(game_records.NO_MOVE if value is None else value
+                                  for value in game._board_state)
+                    moves.append(rng.choice(sorted(game.get_legal_moves())))
+                    game.apply_move(moves[-1])
+                winner = 2 if number % 4 == 3 else 1
+                plies = len(moves)
+                positions_file.write((number, winner, bytes(states), array.array("f", [0.] * plies),
+                                      bytes(plies), bytes(range(plies))))
+                records.write(moves, winner, "forfeit", width=5, height=5)
+                positions += 2 * plies
+        return paths, positions
+
+    def test_position_blocks(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths, positions = self.write_files(tmp)
+            blocks = list(score_model.position_blocks(paths, 5, 5))
+            self.assertEqual(positions, sum(len(block) for block in blocks))
+            # both files hold the same games in the same layout
+            rows = numpy.concatenate(blocks)
+            self.assertEqual(rows[:positions // 2].tolist(), rows[positions // 2:].tolist())
+            self.assertEqual([], list(score_model.position_blocks(paths, 7, 7)))
+            # a saved cursor continues with the next block of the same file
+            state = {}
+            for count, block in enumerate(score_model.position_blocks(paths, 5, 5, state)):
+                if count == len(blocks) - 3:
+                    break
+            self.assertEqual(1, state["file"])
+            rest = list(score_model.position_blocks(paths, 5, 5, dict(state)))
+            self.assertEqual([block.tolist() for block in blocks[-2:]],
+                             [block.tolist() for block in rest])
+
+    def test_shuffled_chunks(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths, positions = self.write_files(tmp)
+            args = (paths, 16, 40, 3, 5, 5)
+            chunks = list(score_model.shuffled_chunks(*args))
+            self.assertEqual([16] * (positions // 16) + [positions % 16] * bool(positions % 16),
+                             [len(chunk) for chunk in chunks])
+            self.assertEqual(sorted(numpy.concatenate(list(score_model.position_blocks(
+                                 paths, 5, 5))).tolist()),
+                             sorted(numpy.concatenate(chunks).tolist()))
+            # resuming from a saved state gives the rest of the same sequence
+            state = {}
+            for count, chunk in enumerate(score_model.shuffled_chunks(*args, state=state)):
+                if count == 4:
+                    break
+            state = pickle.loads(pickle.dumps(state))
+            rest = list(score_model.shuffled_chunks(*args, state=state))
+            self.assertEqual([chunk.tolist() for chunk in chunks[5:]],
+                             [chunk.tolist() for chunk in rest])
+
+    def test_deduplicate_positions(self):
+        rows = []
+        for first in ((0, 0), (0, 4), (4, 4), (0, 0)):
+            game = isolation.Board("Player1", "Player2", 5, 5)
+            game.apply_move(first)
+            game.apply_move((2, 2))
+            rows.append([game_records.NO_MOVE if value is None else value
+                         for value in game._board_state] + [1])
+        rows[-1][-1] = 2
+        # mirrored and rotated positions with the same winner are one row
+        distinct = score_model.deduplicate_positions(numpy.array(rows, dtype=numpy.uint8), 5, 5)
+        self.assertEqual(2, len(distinct))
+        self.assertEqual([1, 2], sorted(distinct[:, -1].tolist()))
+
+    def test_train_streaming(self):
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()) as out:
+            paths, positions = self.write_files(tmp)
+            checkpoint = os.path.join(tmp, "checkpoint.joblib")
+            args = dict(checkpoint=checkpoint, chunk_rows=16, buffer_rows=40,
+                        trees_per_chunk=1, max_trees=5, checkpoint_every=2, width=5, height=5)
+            # chunks of 16 positions often hold a single winner; they are
+            # merged with the next, so every tree knows both classes
+            estimator = score_model.train_streaming(paths, **args)
+            self.assertEqual([1, 2], estimator.classes_.tolist())
+            self.assertEqual(5, len(estimator.estimators_))
+            for tree in estimator.estimators_:
+                self.assertEqual(2, tree.n_classes_)
+            # a finished run resumes with nothing left to read
+            reads = []
+            position_blocks = score_model.position_blocks
+            score_model.position_blocks = lambda *a: reads.append(a) or position_blocks(*a)
+            try:
+                resumed = score_model.train_streaming(paths, **args)
+            finally:
+                score_model.position_blocks = position_blocks
+            self.assertIn("resuming", out.getvalue())
+            self.assertEqual(len(paths), reads[0][-1]["file"])
+            self.assertEqual(5, len(resumed.estimators_))
+
+
+class BenchmarkTest(unittest.TestCase):
+    """The benchmark corpus and report comparison"""
+
+    def test_report(self):
+        corpus = benchmark.seeded_corpus(4, seed=1)
+        self.assertEqual(corpus, benchmark.seeded_corpus(4, seed=1))
+        for moves in corpus:
+            for name, board_class in benchmark.BOARDS.items():
+                self.assertTrue(benchmark.build(board_class, moves).get_legal_moves())
+        searches = [(name, player_class, options, 2)
+                    for name, player_class, options, _ in benchmark.SEARCHES]
+        board_nodes = benchmark.bench_search(isolation.Board, corpus, searches)
+        bitboard_nodes = benchmark.bench_search(isolation.BitBoard, corpus, searches)
+        repeated_nodes = benchmark.bench_search(isolation.Board, corpus, searches)
+        for name, result in board_nodes.items():
+            self.assertGreater(result["nodes"], 0)
+            self.assertEqual(result["nodes"], repeated_nodes[name]["nodes"])
+        # minimax visits the same tree on any engine
+        self.assertEqual(board_nodes["MinimaxPlayer"]["nodes"],
+                         bitboard_nodes["MinimaxPlayer"]["nodes"])
+        report = benchmark.run_benchmarks(["BitBoard"], count=2, search=False)
+        self.assertEqual([], benchmark.compare(report, report))
+        slower = dict(report["results"][0], us_per_call=report["results"][0]["us_per_call"] * 2)
+        self.assertEqual(1, len(benchmark.compare(report, dict(results=[slower]))))
+
+
+class EndgameTest(unittest.TestCase):
+    """Partition detection and the exact endgame solver"""
+
+    def longest(self, game, player):
+        """Brute-force longest path of a player moving alone. """
+        best = 0
+        for move in game.get_legal_moves(player):
+            child = game.copy()
+            child._active_player = player
+            child._inactive_player = game.get_opponent(player)
+            child.apply_move(move)
+            best = max(best, 1 + self.longest(child, player))
+        return best
+
+    def wins(self, game):
+        """Brute-force minimax result for the player to move. """
+        return any(not self.wins(game.forecast_move(move))
+                   for move in game.get_legal_moves())
+
+    def test_solver(self):
+        solved = 0
+        for seed in range(60):
+            rng = random.Random(seed)
+            game = isolation.Board("Player1", "Player2")
+            game.shuffle_moves = False
+            while game.get_legal_moves() and not game.is_partitioned():
+                self.assertIsNone(endgame.solve(game))
+                game.apply_move(rng.choice(game.get_legal_moves()))
+            while max(bin(game.reachable_cells(p)).count("1")
+                      for p in ("Player1", "Player2")) > 12 and game.get_legal_moves():
+                game.apply_move(rng.choice(game.get_legal_moves()))
+            if not game.get_legal_moves():
+                continue
+            result = endgame.solve(game)
+            self.assertEqual((self.longest(game, game.active_player),
+                              self.longest(game, game.inactive_player)),
+                             (result.own_length, result.opponent_length))
+            self.assertEqual(self.wins(game), result.won)
+            self.assertIn(result.move, game.get_legal_moves())
+            solved += 1
+        self.assertGreater(solved, 5)
+
+    def test_player_uses_solver(self):
+        player = game_agent.AlphaBetaPlayer(endgame=True)
+        for seed in range(10):
+            game = isolation.BitBoard(player, "Player2")
+            rng = random.Random(seed)
+            while game.get_legal_moves() and not (
+                    game.active_player == player and endgame.solve(game) is not None):
+                game.apply_move(rng.choice(sorted(game.get_legal_moves())))
+            if game.get_legal_moves():
+                break
+        move = player.get_move(game, isolation.TurnTimer(1000.))
+        self.assertEqual(player.endgame_result.move, move)
+        # the solver gives up once the turn is down to TIMER_THRESHOLD
+        self.assertIsNone(endgame.solve(game, time_left=lambda: 5., threshold=10.))
+        move = player.get_move(game, isolation.TurnTimer(player.TIMER_THRESHOLD - 1.))
+        self.assertIsNone(player.endgame_result)
+        self.assertIn(move, game.get_legal_moves())
+
+
+class OpeningBookTest(unittest.TestCase):
+    """Opening book replies are shared between symmetric positions"""
+
+    def test_lookup(self):
+        book = opening_book.build_book(5, 5, max_plies=2, time_limit=20)
+        self.assertEqual(len(opening_book.book_positions(5, 5, 2)), len(book))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "book.bin")
+            book.save(path)
+            loaded = opening_book.OpeningBook.load(path)
+        self.assertEqual(book.table, loaded.table)
+
+        cells, cell_index = isolation.knight_tables(5, 5)[1:]
+        perms = isolation.symmetry_tables(5, 5)
+        first = (1, 2)
+        reply = loaded.lookup(opening_book.replay([first], 5, 5))
+        expected = opening_book.canonical_key(
+            opening_book.replay([first, reply], 5, 5))[0]
+        for perm in perms:
+            # (1, 2) is on a mirror line, so the reply is only determined up
+            # to the symmetries that keep it in place
+            moves = [cells[perm[cell_index[first]]]]
+            move = loaded.lookup(opening_book.replay(moves, 5, 5))
+            self.assertIn(move, opening_book.replay(moves, 5, 5).get_legal_moves())
+            self.assertEqual(expected, opening_book.canonical_key(
+                opening_book.replay(moves + [move], 5, 5))[0])
+        self.assertIsNone(loaded.lookup(opening_book.replay([(0, 0), (1, 1)], 5, 5)))
+
+        player = game_agent.AlphaBetaPlayer(opening_book=loaded)
+        game = isolation.Board("Player1", player, 5, 5)
+        game.apply_move(first)
+        calls = []
+        self.assertEqual(reply, player.get_move(game, lambda: calls.append(1) or 1000.))
+        self.assertEqual([], calls)
+
+
+class MonteCarloTest(unittest.TestCase):
+    """The Monte Carlo tree search competition agent"""
+
+    def test_search(self):
+        player = competition_agent.CustomPlayer(max_playouts=300, seed=0)
+        game = isolation.BitBoard(player, "Player2")
+        for move in [(3, 3), (2, 2)]:
+            game.apply_move(move)
+        move = player.get_move(game, lambda: 1000.)
+        self.assertIn(move, game.get_legal_moves())
+        self.assertEqual(300, player.playouts)
+        tree = player.tree
+        self.assertEqual(300, tree.visits[0])
+        first, count = tree.first[0], tree.count[0]
+        self.assertEqual(sorted(game.get_legal_moves()),
+                         sorted((tree.move[n] % 7, tree.move[n] // 7)
+                                for n in range(first, first + count)))
+
+        # the opponent's reply lands in the kept subtree
+        game.apply_move(move)
+        game.apply_move(game.get_legal_moves()[0])
+        self.assertIn(player.get_move(game, lambda: 1000.), game.get_legal_moves())
+        self.assertGreater(player.reused_visits, 0)
+
+        # a player with one legal move returns it without searching
+        game = isolation.Board(player, "Player2")
+        for move in [(1, 2), (6, 6), (0, 0), (4, 5)]:
+            game.apply_move(move)
+        self.assertEqual([(2, 1)], game.get_legal_moves())
+        self.assertEqual((2, 1), player.get_move(game, lambda: 1000.))
+        self.assertEqual(0, player.playouts)
+
+    def test_wide_node(self):
+        # the first move on a 12x12 board has 144 children
+        tree = competition_agent.SearchTree()
+        root = tree.add(-1, 1)
+        tree.expand(root, range(144), 0)
+        self.assertEqual(144, tree.count[root])
+        self.assertEqual(145, len(tree))
+
+
+class GameRecordTest(unittest.TestCase):
+    """Binary game records round-trip games played with Board.play()"""
+
+    def test_round_trip(self):
+        games = []
+        for seed in range(5):
+            random.seed(seed)
+            player1 = sample_players.RandomPlayer()
+            player2 = sample_players.GreedyPlayer()
+            game = isolation.Board(player1, player2)
+            opening = [(2, 3), (0, 5)]
+            for move in opening:
+                game.apply_move(move)
+            winner, history, termination, state_hist = game.play()
+            games.append((opening + [tuple(m) for m in history],
+                          1 if winner == player1 else 2, termination,
+                          state_hist, seed))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "games.rec")
+            with game_records.GameRecordWriter(path, batch_size=2) as writer:
+                for moves, winner, termination, _, seed in games:
+                    writer.write(moves, winner, termination, opening=2,
+                                 seed=seed, players=("Random", "Greedy"))
+            records = list(game_records.read_records(path))
+        self.assertEqual(len(games), len(records))
+        for (moves, winner, termination, state_hist, seed), record in zip(games, records):
+            self.assertEqual(moves, record.moves)
+            self.assertEqual((winner, termination, seed, ("Random", "Greedy")),
+                             (record.winner, record.termination, record.seed,
+                              record.players))
+            self.assertEqual(state_hist, game_records.replay_states(record))
+
+    def test_long_names(self):
+        # 15 ascii bytes and a 2 byte character: the character is dropped
+        # rather than cut in half
+        record = game_records.encode_record([(2, 3), (0, 5)], 1, "illegal move",
+                                            players=("x" * 15 + "\u00e9", "Zoë"))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "games.rec")
+            with game_records.GameRecordWriter(path) as writer:
+                writer.write_encoded(record)
+            self.assertEqual(("x" * 15, "Zoë"),
+                             next(game_records.read_records(path)).players)
 
 
 if __name__ == '__main__':
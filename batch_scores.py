@@ -0,0 +1,322 @@
+"""Batched leaf evaluation for the search agents.
+
+A batch score function takes (game, moves, player) and returns the list of
+`score_fn(child, player)` values of the children of `game` reached by each
+of `moves`, so a search node one ply above the frontier can score all of its
+children with one call (see `AlphaBetaPlayer(batch=True)`).
+
+With numpy installed, child_rows() encodes the children as a single uint8
+array of board states in the `Board._board_state` layout (NO_MOVE in place
+of a player that has not moved), and the vectorized heuristics below score
+every row with a few array operations; the learned heuristic walks all the
+trees of its forest for every child at once.  batch_score_fn() returns the
+vectorized version registered for a score function, and falls back to
+calling the score function on each child when numpy is missing or no
+vectorized version is registered.
+"""
+import weakref
+
+try:
+    import numpy as np
+except ImportError:  # the scalar fallback works without numpy
+    np = None
+
+from compiled_model import LEAF
+from game_records import NO_MOVE
+from isolation import knight_tables, symmetry_tables
+
+# vectorized batch score functions, keyed by the score function they match
+_BATCH_SCORES = {}
+
+# knight-move and symmetry arrays shared by every batch of the same board
+# size; keyed by (width, height)
+_BOARD_TABLES = {}
+_CANONICAL_TABLES = {}
+
+# numpy copies of the arrays of each CompiledForest scored in batches
+_FOREST_ARRAYS = weakref.WeakKeyDictionary()
+
+
+def register(score_fn, batch_fn):
+    """Make batch_fn(game, moves, player) the vectorized version of
+    score_fn(game, player) returned by batch_score_fn().
+    """
+    _BATCH_SCORES[score_fn] = batch_fn
+
+
+def scalar_batch(score_fn):
+    """Return a batch score function that calls `score_fn` on each child,
+    pushing and popping the moves on the node's board.
+    """
+    def score_batch(game, moves, player):
+        scores = []
+        for move in moves:
+            game.push_move(move)
+            scores.append(score_fn(game, player))
+            game.pop_move()
+        return scores
+    return score_batch
+
+
+def batch_score_fn(score_fn):
+    """Return the batch score function for `score_fn`: its registered
+    vectorized version when numpy is available, otherwise scalar_batch().
+
+    Positions where a player has not moved yet are always scored by the
+    scalar function; they only occur in the first two plies.
+    """
+    scalar = scalar_batch(score_fn)
+    batch_fn = _BATCH_SCORES.get(score_fn) if np is not None else None
+    if batch_fn is None:
+        return scalar
+
+    def score_batch(game, moves, player):
+        if game.move_count < 2:
+            return scalar(game, moves, player)
+        return batch_fn(game, moves, player)
+    return score_batch
+
+
+def child_rows(game, moves):
+    """Return the uint8 array of the board states of the children of `game`
+    reached by each of `moves`, one row per move in the `_board_state`
+    layout: blocked cells, initiative, player 2 and player 1 locations.
+    """
+    cells = game.width * game.height
+    parent = np.array([NO_MOVE if value is None else value
+                       for value in game._board_state], dtype=np.uint8)
+    idx = move_indices(game, moves)
+    rows = np.repeat(parent[np.newaxis], len(moves), axis=0)
+    rows[np.arange(len(moves)), idx] = 1
+    rows[:, cells] ^= 1
+    rows[:, _player_columns(game, game.active_player)[0]] = idx
+    return rows
+
+
+def move_indices(game, moves):
+    """Return the flat cell indices of `moves` as an int array. """
+    height = game.height
+    return np.array([row + col * height for row, col in moves], dtype=np.intp)
+
+
+def _player_columns(game, player):
+    # the location columns of `player` and its opponent; player 1 (the last
+    # column) moves on even move counts, player 2 on odd ones
+    cells = game.width * game.height
+    mover = cells + 2 - (game.move_count & 1)
+    other = 2 * cells + 3 - mover
+    return (mover, other) if player == game.active_player else (other, mover)
+
+
+def board_tables(width, height):
+    """Return (neighbors, adjacent) arrays for a board size: the knight-move
+    table as an int array of shape (cells, 8) padded with the index `cells`
+    for missing moves, and the (cells, cells) matrix of knight adjacency.
+    """
+    key = (width, height)
+    if key not in _BOARD_TABLES:
+        cells = width * height
+        neighbors = np.full((cells, 8), cells, dtype=np.intp)
+        adjacent = np.zeros((cells, cells), dtype=np.intp)
+        for idx, cell_neighbors in enumerate(knight_tables(width, height)[0]):
+            neighbors[idx, :len(cell_neighbors)] = cell_neighbors
+            adjacent[idx, list(cell_neighbors)] = 1
+        _BOARD_TABLES[key] = (neighbors, adjacent)
+    return _BOARD_TABLES[key]
+
+
+def blank_cells(game):
+    """Return a bool array of the blank cells of `game`, with one extra
+    False entry at index `cells` (the padding of board_tables()).
+    """
+    cells = game.width * game.height
+    blank = np.zeros(cells + 1, dtype=bool)
+    blank[:cells] = np.array(game._board_state[:cells]) == 0
+    return blank
+
+
+def child_mobility(game, moves, player):
+    """Return (own_moves, opp_moves, lost, won, locations) arrays for
+    `player` on the children of `game` reached by `moves`: both players'
+    legal move counts, whether `player` has lost or won, and its flat cell
+    index in each child.
+
+    A child differs from `game` only by the blocked destination cell, so
+    the counts are read off the parent's blank cells: the mover's moves are
+    the blank neighbors of its destination, and the other player loses
+    the destination if it was one of its moves.
+    """
+    neighbors, adjacent = board_tables(game.width, game.height)
+    blank = blank_cells(game)
+    idx = move_indices(game, moves)
+    row, col = game.get_player_location(game.inactive_player)
+    other = row + col * game.height
+    mover_moves = blank[neighbors[idx]].sum(axis=1)
+    other_moves = blank[neighbors[other]].sum() - adjacent[other, idx]
+    # the player who did not move is to move in every child, and loses
+    # without legal moves
+    no_result = np.zeros(len(idx), dtype=bool)
+    if player == game.active_player:
+        return mover_moves, other_moves, no_result, other_moves == 0, idx
+    return (other_moves, mover_moves, other_moves == 0, no_result,
+            np.full(len(idx), other, dtype=np.intp))
+
+
+def _with_results(values, lost, won):
+    return np.where(lost, -np.inf, np.where(won, np.inf, values)).tolist()
+
+
+def open_move_score_batch(game, moves, player):
+    """Vectorized `sample_players.open_move_score()`. """
+    own_moves, _, lost, won, _ = child_mobility(game, moves, player)
+    return _with_results(own_moves.astype(float), lost, won)
+
+
+def improved_score_batch(game, moves, player):
+    """Vectorized `sample_players.improved_score()`. """
+    own_moves, opp_moves, lost, won, _ = child_mobility(game, moves, player)
+    return _with_results((own_moves - opp_moves).astype(float), lost, won)
+
+
+def center_score_batch(game, moves, player):
+    """Vectorized `sample_players.center_score()`. """
+    _, _, lost, won, location = child_mobility(game, moves, player)
+    y, x = location % game.height, location // game.height
+    return _with_results(((game.height - y)**2 + (game.width - x)**2).astype(float),
+                         lost, won)
+
+
+def custom_score_batch(game, moves, player):
+    """Vectorized `game_agent.custom_score()`. """
+    own_moves, opp_moves, lost, won, location = child_mobility(game, moves, player)
+    y, x = location % game.height, location // game.height
+    center_score = ((game.height - y)**2 + (game.width - x)**2).astype(float)
+    # every child has one blank cell less than its parent
+    total = own_moves + opp_moves + game.blank_count() - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = ((own_moves + center_score / total)**2 - opp_moves**2) / total
+    return _with_results(values, lost, won)
+
+
+def forest_score_batch(model, game, moves, player):
+    """Vectorized `game_agent.learned_score()` with the CompiledForest
+    `model`.
+    """
+    own_moves, opp_moves, lost, won, _ = child_mobility(game, moves, player)
+    is_player_1 = (player == game.active_player) == (game.move_count % 2 == 0)
+    label = model.class_index(1 if is_player_1 else 2)
+    if label is None:
+        win = np.zeros(len(moves))
+    else:
+        rows = child_rows(game, moves)
+        win = predict_class_rows(model, canonical_batch(rows, game.width, game.height),
+                                 label)
+    return _with_results(2. * win - 1. + (own_moves - opp_moves) / 1000., lost, won)
+
+
+def forest_arrays(model):
+    """Return (roots, feature, threshold, children, value, depth) numpy
+    arrays for a CompiledForest: leaves test feature 0 against an infinite
+    threshold and are their own children, so every row can descend `depth`
+    levels (the depth of the deepest tree) without checking for leaves;
+    children[2 * n] and children[2 * n + 1] are the left and right child.
+    """
+    if model not in _FOREST_ARRAYS:
+        feature = np.array(model.feature, dtype=np.intp)
+        leaf = feature == LEAF
+        nodes = np.arange(len(feature))
+        threshold = np.where(leaf, np.inf, np.array(model.threshold))
+        children = np.empty(2 * len(feature), dtype=np.intp)
+        children[0::2] = np.where(leaf, nodes, model.left)
+        children[1::2] = np.where(leaf, nodes, model.right)
+        depth = 0
+        level = list(model.roots)
+        while level:
+            depth += 1
+            level = [child for node in level if model.feature[node] != LEAF
+                     for child in (model.left[node], model.right[node])]
+        _FOREST_ARRAYS[model] = (np.array(model.roots, dtype=np.intp),
+                                 np.where(leaf, 0, feature), threshold, children,
+                                 np.array(model.value), depth - 1)
+    return _FOREST_ARRAYS[model]
+
+
+def predict_class_rows(model, rows, class_index):
+    """Return `model.predict_class()` of every row of the 2D array `rows`,
+    descending all the trees of the forest for all rows together.
+    """
+    roots, feature, threshold, children, value, depth = forest_arrays(model)
+    count, size = rows.shape
+    flat = rows.ravel()
+    # nodes[t * count + i] is the node of tree t that row i has reached
+    nodes = np.repeat(roots, count)
+    offsets = np.tile(np.arange(0, count * size, size), len(roots))
+    for _ in range(depth):
+        right = flat.take(feature.take(nodes) + offsets) > threshold.take(nodes)
+        nodes = children.take(2 * nodes + right)
+    win = value.take(nodes * len(model.classes) + class_index)
+    return win.reshape(len(roots), count).mean(axis=0)
+
+
+def canonical_batch(rows, width=7, height=7):
+    """canonical_rows() for a small batch of board states, such as the
+    children of a search node: builds every transformed row at once and
+    picks the smallest of each position's variants by comparing bytes.
+    """
+    gather, location = _canonical_tables(width, height)
+    cells = width * height
+    variants = rows[:, gather]
+    variants[:, :, cells + 1:] = location[np.arange(len(gather))[:, np.newaxis],
+                                          rows[:, np.newaxis, cells + 1:cells + 3]]
+    count, size = len(gather), cells + 3
+    data = variants.tobytes()
+    best = [min(range(i * count, (i + 1) * count),
+                key=lambda v: data[v * size:(v + 1) * size])
+            for i in range(len(rows))]
+    return variants.reshape(-1, size)[best]
+
+
+def _canonical_tables(width, height):
+    # (gather, location): gather[s] is the column order of the rows of
+    # symmetry s; location[s] maps location values (NO_MOVE stays NO_MOVE)
+    key = (width, height)
+    if key not in _CANONICAL_TABLES:
+        cells = width * height
+        perms = symmetry_tables(width, height)
+        inverses = symmetry_tables(width, height, inverse=True)
+        gather = np.array([list(inverse) + [cells, cells + 1, cells + 2]
+                           for inverse in inverses], dtype=np.intp)
+        location = np.full((len(perms), 256), NO_MOVE, dtype=np.uint8)
+        location[:, :cells] = perms
+        _CANONICAL_TABLES[key] = (gather, location)
+    return _CANONICAL_TABLES[key]
+
+
+def canonical_rows(matrix, width=7, height=7):
+    """
+    Return a copy of a uint8 matrix of board states (one `_board_state` row
+    per position, with NO_MOVE for unplaced players, and optionally more
+    columns such as a winner) with every position replaced by its canonical
+    form: the smallest of the rows of its rotated and reflected boards,
+    compared column by column, which is the state Board.canonical_form()
+    picks.  Columns past the board state are unchanged.
+    """
+    cells = width * height
+    columns = cells + 3
+    rows = np.arange(len(matrix))
+    best = matrix.copy()
+    perms = symmetry_tables(width, height)
+    inverses = symmetry_tables(width, height, inverse=True)
+    for perm, inverse in zip(perms[1:], inverses[1:]):
+        # locations map through the permutation; NO_MOVE stays NO_MOVE
+        location = np.full(256, NO_MOVE, dtype=np.uint8)
+        location[:cells] = perm
+        variant = matrix.copy()
+        variant[:, :cells] = matrix[:, inverse]
+        variant[:, cells + 1:columns] = location[matrix[:, cells + 1:columns]]
+        differ = variant[:, :columns] != best[:, :columns]
+        first = differ.argmax(axis=1)
+        smaller = differ.any(axis=1) & (variant[rows, first] < best[rows, first])
+        best[smaller] = variant[smaller]
+    return best
+
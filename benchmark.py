@@ -0,0 +1,291 @@
+"""Micro-benchmarks for the board engines, the heuristics and search
+throughput, run on a fixed corpus of seeded positions so results can be
+compared across commits and board engines.
+
+Results are written as JSON: a "meta" dict describing the run and a flat
+"results" list with one entry per (board, group, name), where group is
+"primitive", "heuristic" or "search".  Primitives and heuristics report
+microseconds per call; searches report nodes, seconds and nodes per second
+(playouts per second for the Monte Carlo player).
+
+    python benchmark.py                        # all engines, JSON to stdout
+    python benchmark.py --board BitBoard -o bench.json
+    python benchmark.py --baseline old.json    # flag regressions vs old run
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import timeit
+
+import game_agent
+import sample_players
+from competition_agent import CustomPlayer
+from isolation import Board, BitBoard, TurnTimer
+from game_agent import MinimaxPlayer, AlphaBetaPlayer
+
+BOARDS = {"Board": Board, "BitBoard": BitBoard}
+
+POSITIONS = 32  # positions in the corpus
+PLAYOUTS = 200  # Monte Carlo playouts per corpus position
+CORPUS_SEED = 0
+REPEAT = 5  # timings are the best of this many runs
+
+HEURISTICS = [
+    ("null_score", sample_players.null_score),
+    ("open_move_score", sample_players.open_move_score),
+    ("improved_score", sample_players.improved_score),
+    ("center_score", sample_players.center_score),
+    ("custom_score", game_agent.custom_score),
+    ("custom_score_2", game_agent.custom_score_2),
+    ("custom_score_3", game_agent.custom_score_3),
+]
+
+# (name, player class, constructor options, search depth) of each fixed-depth
+# search benchmark
+SEARCHES = [
+    ("MinimaxPlayer", MinimaxPlayer, dict(inplace=True), 4),
+    ("AlphaBetaPlayer", AlphaBetaPlayer, dict(inplace=True), 5),
+    ("AlphaBetaPlayer+tt+ordering", AlphaBetaPlayer,
+     dict(inplace=True, tt_size=2**16, ordering=True), 7),
+    ("AlphaBetaPlayer+tt+ordering+pvs", AlphaBetaPlayer,
+     dict(inplace=True, tt_size=2**16, ordering=True, pvs=True, aspiration=.25), 7),
+]
+
+
+def seeded_corpus(count=POSITIONS, seed=CORPUS_SEED, width=7, height=7):
+    """Return `count` move sequences of random games, each cut off between
+    the opening and the middle game with moves left for the player to move.
+    The same sequences are replayed on every board engine.
+    """
+    corpus = []
+    game_index = 0
+    while len(corpus) < count:
+        rng = random.Random(seed * 1000003 + game_index)
+        game_index += 1
+        game = Board("Player1", "Player2", width, height)
+        moves = []
+        for _ in range(rng.randint(2, 24)):
+            legal_moves = sorted(game.get_legal_moves())
+            if not legal_moves:
+                break
+            moves.append(rng.choice(legal_moves))
+            game.apply_move(moves[-1])
+        if game.get_legal_moves():
+            corpus.append(moves)
+    return corpus
+
+
+def build(board_class, moves, player_1="Player1", player_2="Player2"):
+    """Return a board of board_class with `moves` applied. """
+    game = board_class(player_1, player_2)
+    for move in moves:
+        game.apply_move(move)
+    return game
+
+
+def best_time(fn, repeat=REPEAT):
+    """Return the smallest wall time of `repeat` calls of fn(). """
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def bench_primitives(board_class, corpus, loops=20):
+    """Return {name: microseconds per call} for the board primitives, each
+    timed over every position of the corpus.
+    """
+    games = [build(board_class, moves) for moves in corpus]
+    replies = [game.get_legal_moves()[0] for game in games]
+    pairs = list(zip(games, replies))
+    calls = loops * len(games)
+
+    def run(fn):
+        def timed():
+            for _ in range(loops):
+                for game, move in pairs:
+                    fn(game, move)
+        return 1e6 * best_time(timed) / calls
+
+    def push_pop(game, move):
+        game.push_move(move)
+        game.pop_move()
+
+    results = {
+        "get_legal_moves": run(lambda game, move: game.get_legal_moves()),
+        "count_legal_moves": run(lambda game, move: game.count_legal_moves()),
+        "blank_count": run(lambda game, move: game.blank_count()),
+        "copy": run(lambda game, move: game.copy()),
+        "forecast_move": run(lambda game, move: game.forecast_move(move)),
+        "push_pop_move": run(push_pop),
+        "hash": run(lambda game, move: game.hash()),
+        "canonical_hash": run(lambda game, move: game.canonical_hash()),
+    }
+
+    # apply_move changes the board, so it is timed on copies made up front
+    def apply_all():
+        copies = [(game.copy(), move) for _ in range(loops) for game, move in pairs]
+        start = timeit.default_timer()
+        for game, move in copies:
+            game.apply_move(move)
+        return timeit.default_timer() - start
+    results["apply_move"] = 1e6 * min(apply_all() for _ in range(REPEAT)) / calls
+    return results
+
+
+def bench_heuristics(board_class, corpus, heuristics=HEURISTICS, loops=20):
+    """Return {name: microseconds per call} for each heuristic, scored from
+    the point of view of the player to move in every corpus position.
+    """
+    games = [build(board_class, moves) for moves in corpus]
+    calls = loops * len(games)
+    results = {}
+    for name, score_fn in heuristics:
+        def timed():
+            for _ in range(loops):
+                for game in games:
+                    score_fn(game, game.active_player)
+        results[name] = 1e6 * best_time(timed) / calls
+    return results
+
+
+def bench_search(board_class, corpus, searches=SEARCHES):
+    """Return {name: dict(depth, nodes, seconds, nodes_per_second)} for
+    fixed-depth searches from every corpus position, counting nodes with
+    the players' search statistics.
+    """
+    results = {}
+    for name, player_class, options, depth in searches:
+        nodes = 0
+        seconds = 0.
+        for moves in corpus:
+            # a fresh player per position, so transposition tables and move
+            # ordering history do not carry over between positions
+            player = player_class(stats=True, **options)
+            # the timer Board.play() passes, so the searches pay for the same
+            # deadline checks as in a game
+            player.time_left = TurnTimer(float("inf"))
+            game = build(board_class, moves, *(
+                (player, "Opponent") if len(moves) % 2 == 0 else ("Opponent", player)))
+            # unshuffled moves make node counts repeatable; they still differ
+            # between engines for alpha-beta, whose pruning depends on the
+            # engine's move generation order
+            game.shuffle_moves = False
+            start = timeit.default_timer()
+            if isinstance(player, AlphaBetaPlayer):
+                player.deepen(game, depth)
+            else:
+                player.minimax(game, depth)
+            seconds += timeit.default_timer() - start
+            nodes += player.stats.nodes
+        results[name] = dict(depth=depth, nodes=nodes, seconds=seconds,
+                             nodes_per_second=nodes / seconds if seconds else 0.)
+    return results
+
+
+def bench_playouts(board_class, corpus, playouts=PLAYOUTS):
+    """Return dict(playouts, nodes, seconds, nodes_per_second) for Monte
+    Carlo tree searches (`competition_agent.CustomPlayer`) of `playouts`
+    playouts from every corpus position, where nodes counts playouts.
+    """
+    inf = float("inf")
+    seconds = 0.
+    for moves in corpus:
+        player = CustomPlayer(max_playouts=playouts, seed=CORPUS_SEED)
+        game = build(board_class, moves, *(
+            (player, "Opponent") if len(moves) % 2 == 0 else ("Opponent", player)))
+        start = timeit.default_timer()
+        player.get_move(game, lambda: inf)
+        seconds += timeit.default_timer() - start
+    nodes = playouts * len(corpus)
+    return dict(playouts=playouts, nodes=nodes, seconds=seconds,
+                nodes_per_second=nodes / seconds if seconds else 0.)
+
+
+def run_benchmarks(boards=tuple(BOARDS), count=POSITIONS, seed=CORPUS_SEED,
+                   search=True):
+    """Run every benchmark on each named board engine and return the JSON
+    serializable report.
+    """
+    corpus = seeded_corpus(count, seed)
+    results = []
+    for board_name in boards:
+        board_class = BOARDS[board_name]
+        for name, micros in sorted(bench_primitives(board_class, corpus).items()):
+            results.append(dict(board=board_name, group="primitive", name=name,
+                                us_per_call=micros))
+        for name, micros in bench_heuristics(board_class, corpus).items():
+            results.append(dict(board=board_name, group="heuristic", name=name,
+                                us_per_call=micros))
+        if search:
+            for name, result in bench_search(board_class, corpus).items():
+                results.append(dict(board=board_name, group="search", name=name,
+                                    **result))
+            results.append(dict(board=board_name, group="search",
+                                name="CustomPlayer(MCTS)",
+                                **bench_playouts(board_class, corpus)))
+    meta = dict(python=platform.python_version(),
+                implementation=platform.python_implementation(),
+                machine=platform.machine(), positions=count, seed=seed,
+                repeat=REPEAT)
+    return dict(meta=meta, results=results)
+
+
+def result_cost(result):
+    """Return the cost of a result, where higher is slower. """
+    if "us_per_call" in result:
+        return result["us_per_call"]
+    return 1. / result["nodes_per_second"] if result["nodes_per_second"] else 0.
+
+
+def compare(baseline, report, threshold=1.25):
+    """Return a list of (board, group, name, ratio) for the results of
+    `report` that are more than `threshold` times slower than `baseline`;
+    ratio is the new cost over the old.
+    """
+    old = {(r["board"], r["group"], r["name"]): result_cost(r)
+           for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        key = (result["board"], result["group"], result["name"])
+        if old.get(key):
+            ratio = result_cost(result) / old[key]
+            if ratio > threshold:
+                regressions.append(key + (ratio,))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--board", action="append", choices=sorted(BOARDS),
+                        help="board engine to benchmark (repeatable; default all)")
+    parser.add_argument("--positions", type=int, default=POSITIONS)
+    parser.add_argument("--seed", type=int, default=CORPUS_SEED)
+    parser.add_argument("--no-search", action="store_true",
+                        help="skip the search throughput benchmarks")
+    parser.add_argument("-o", "--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.board or tuple(BOARDS), args.positions,
+                            args.seed, not args.no_search)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for board, group, name, ratio in regressions:
+            sys.stderr.write("regression: {} {} {}: {:.2f}x slower\n"
+                             .format(board, group, name, ratio))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
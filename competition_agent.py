@@ -4,7 +4,33 @@ champions) in a tournament.
 
          COMPLETING AND SUBMITTING A COMPETITION AGENT IS OPTIONAL
 """
+import math
 import random
+from array import array
+
+# Knight-move neighbors of every flat cell index (row + column * height),
+# keyed by (width, height).  Built here rather than imported from isolation
+# so this file can be submitted on its own.
+_NEIGHBORS = {}
+
+DIRECTIONS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
+              (1, -2), (1, 2), (2, -1), (2, 1)]
+
+
+def knight_neighbors(width, height):
+    """Return a tuple holding, for every flat cell index, the tuple of cell
+    indices a knight can reach from it on a width x height board.
+    """
+    key = (width, height)
+    if key not in _NEIGHBORS:
+        neighbors = []
+        for idx in range(width * height):
+            r, c = idx % height, idx // height
+            neighbors.append(tuple(
+                (r + dr) + (c + dc) * height for dr, dc in DIRECTIONS
+                if 0 <= r + dr < height and 0 <= c + dc < width))
+        _NEIGHBORS[key] = tuple(neighbors)
+    return _NEIGHBORS[key]
 
 
 class SearchTimeout(Exception):
@@ -36,13 +62,65 @@ def custom_score(game, player):
     raise NotImplementedError
 
 
+class SearchTree:
+    """Monte Carlo search tree stored column-wise in arrays.
+
+    Node n moved to cell move[n] from its parent; side[n] is the side that
+    made that move (0 for the player to move at the search root, 1 for its
+    opponent) and wins[n] the number of the visits[n] playouts through the
+    node won by that side.  The children of an expanded node are stored
+    contiguously from first[n], count[n] of them; first[n] is -1 until the
+    node is expanded.  Arrays hold no Python objects, so a large tree adds
+    no work (or pauses) to the cyclic garbage collector.
+    """
+
+    def __init__(self):
+        self.move = array("h")
+        self.side = array("b")
+        self.visits = array("l")
+        self.wins = array("l")
+        self.first = array("l")
+        self.count = array("i")
+
+    def __len__(self):
+        return len(self.move)
+
+    def add(self, move, side):
+        """Append an unexpanded node and return its index. """
+        self.move.append(move)
+        self.side.append(side)
+        self.visits.append(0)
+        self.wins.append(0)
+        self.first.append(-1)
+        self.count.append(0)
+        return len(self.move) - 1
+
+    def expand(self, node, moves, side):
+        """Add a child of `node` for each cell of `moves`, made by `side`. """
+        self.first[node] = len(self.move)
+        self.count[node] = len(moves)
+        for move in moves:
+            self.add(move, side)
+
+    def child(self, node, move):
+        """Return the child of `node` that moved to `move`, or None. """
+        first = self.first[node]
+        for n in range(first, first + self.count[node]):
+            if self.move[n] == move:
+                return n
+        return None
+
+
 class CustomPlayer:
     """Game-playing agent to use in the optional player vs player Isolation
     competition.
 
-    You must at least implement the get_move() method and a search function
-    to complete this class, but you may use any of the techniques discussed
-    in lecture or elsewhere on the web -- opening books, MCTS, etc.
+    Moves are chosen by Monte Carlo tree search with UCT selection.  The
+    search never touches the game board: the position is read once per turn
+    into a bitmask of blocked cells and the two player cell indices, and
+    every selection step and playout moves on those integers.  The subtree
+    of the position reached after the opponent's reply is kept for the next
+    turn.
 
     **************************************************************************
           THIS CLASS IS OPTIONAL -- IT IS ONLY USED IN THE ISOLATION PvP
@@ -58,13 +136,55 @@ class CustomPlayer:
         Time remaining (in milliseconds) when search is aborted.  Note that
         the PvP competition uses more accurate timers that are not cross-
         platform compatible, so a limit of 1ms (vs 10ms for the other classes)
-        is generally sufficient.
+        is generally sufficient there; the default of 10ms suits
+        `Board.play()`, whose timer includes the scheduling stalls of a
+        loaded machine.
+
+    exploration : float (optional)
+        UCT exploration constant; larger values visit less promising moves
+        more often.
+
+    playout : str (optional)
+        "random" plays uniformly random playouts; "heuristic" moves, with
+        probability 1 - epsilon, to the cell with the most onward moves.
+
+    epsilon : float (optional)
+        Probability of a random move in heuristic playouts.
+
+    reuse_tree : bool (optional)
+        Keep the subtree of the current position between turns.
+
+    max_playouts : int (optional)
+        Stop each search after this many playouts even if time is left;
+        None searches until the timer runs out.
+
+    seed : int (optional)
+        Seed of the player's random generator.
     """
+    MAX_TREE_NODES = 2**20  # start a new tree instead of reusing a larger one
 
-    def __init__(self, data=None, timeout=1.):
+    def __init__(self, data=None, timeout=10., exploration=math.sqrt(2),
+                 playout="random", epsilon=.1, reuse_tree=True,
+                 max_playouts=None, seed=None):
         self.score = custom_score
         self.time_left = None
         self.TIMER_THRESHOLD = timeout
+        self.exploration = exploration
+        if playout not in ("random", "heuristic"):
+            raise ValueError("unknown playout policy: {}".format(playout))
+        self.playout = playout
+        self.epsilon = epsilon
+        self.reuse_tree = reuse_tree
+        self.max_playouts = max_playouts
+        self.rng = random.Random(seed)
+        # playouts run by the last get_move() call, and visits the root
+        # already had from the previous turn's tree
+        self.playouts = 0
+        self.reused_visits = 0
+        self.tree = SearchTree()
+        # (node, blocked, own cell) after the last move played, to find the
+        # position after the opponent's reply among the node's children
+        self._last = None
 
     def get_move(self, game, time_left):
         """Search for the best move from the available legal moves and return a
@@ -93,5 +213,147 @@ class CustomPlayer:
             Board coordinates corresponding to a legal move; may return
             (-1, -1) if there are no available legal moves.
         """
-        # OPTIONAL: Finish this function!
-        raise NotImplementedError
+        self.time_left = time_left
+        self.playouts = 0
+        height = game.height
+        neighbors = knight_neighbors(game.width, height)
+
+        blank = set(r + c * height for r, c in game.get_blank_spaces())
+        blocked = 0
+        for idx in range(game.width * height):
+            if idx not in blank:
+                blocked |= 1 << idx
+        locs = []
+        for player in (game.active_player, game.inactive_player):
+            loc = game.get_player_location(player)
+            locs.append(None if loc is None else loc[0] + loc[1] * height)
+
+        root = self.find_root(blocked, locs)
+        if root is None:
+            self.tree = SearchTree()
+            root = self.tree.add(-1, 1)
+        tree = self.tree
+        self.reused_visits = tree.visits[root]
+        if tree.first[root] < 0:
+            tree.expand(root, self.legal_moves(neighbors, blocked, locs[0]), 0)
+        first, count = tree.first[root], tree.count[root]
+        if not count:
+            self._last = None
+            return (-1, -1)
+
+        if count > 1:
+            while (time_left() > self.TIMER_THRESHOLD and
+                   (self.max_playouts is None or self.playouts < self.max_playouts)):
+                self.search(root, neighbors, blocked, locs)
+                self.playouts += 1
+
+        best = max(range(first, first + count), key=tree.visits.__getitem__)
+        move = tree.move[best]
+        self._last = (best, blocked | 1 << move, move)
+        return (move % height, move // height)
+
+    def find_root(self, blocked, locs):
+        """Return the node of the current tree for the position (blocked,
+        locs) after the opponent's reply, or None if tree reuse is off, the
+        tree is full or the position is not in the tree.
+        """
+        last, self._last = self._last, None
+        if (not self.reuse_tree or last is None or
+                len(self.tree) > self.MAX_TREE_NODES):
+            return None
+        node, last_blocked, own = last
+        reply = locs[1]
+        if (own != locs[0] or reply is None or
+                blocked != last_blocked | 1 << reply or
+                self.tree.first[node] < 0):
+            return None
+        return self.tree.child(node, reply)
+
+    @staticmethod
+    def legal_moves(neighbors, blocked, loc):
+        """Return the cells the player on `loc` can move to. """
+        if loc is None:
+            return [idx for idx in range(len(neighbors)) if not blocked >> idx & 1]
+        return [n for n in neighbors[loc] if not blocked >> n & 1]
+
+    def search(self, root, neighbors, blocked, locs):
+        """Run one playout from `root`: select a path by UCT down to a node
+        not visited before (expanding nodes on the way), play the game out
+        from there and back up the result.
+        """
+        rng = self.rng
+        tree = self.tree
+        visits, wins, first, count = tree.visits, tree.wins, tree.first, tree.count
+        moves = tree.move
+        locs = list(locs)
+        side = 0  # side to move: 0 for the root player
+
+        # selection; unvisited children are tried first, in the random
+        # order they were added in
+        node = root
+        path = [root]
+        log = math.log
+        sqrt = math.sqrt
+        c = self.exploration
+        while True:
+            if first[node] < 0:
+                options = self.legal_moves(neighbors, blocked, locs[side])
+                rng.shuffle(options)
+                tree.expand(node, options, side)
+            start = first[node]
+            end = start + count[node]
+            if start == end:
+                break
+            log_visits = log(visits[node]) if visits[node] else 0.
+            best_value = -1.
+            for child in range(start, end):
+                n = visits[child]
+                if not n:
+                    best_child = child
+                    break
+                value = wins[child] / n + c * sqrt(log_visits / n)
+                if value > best_value:
+                    best_value, best_child = value, child
+            node = best_child
+            path.append(node)
+            move = moves[node]
+            blocked |= 1 << move
+            locs[side] = move
+            side ^= 1
+            if not visits[node]:
+                break
+
+        # playout on the integer state; the side to move without a legal
+        # move loses
+        heuristic = self.playout == "heuristic"
+        epsilon = self.epsilon
+        while True:
+            loc = locs[side]
+            if loc is None:
+                options = self.legal_moves(neighbors, blocked, loc)
+            else:
+                options = [n for n in neighbors[loc] if not blocked >> n & 1]
+            if not options:
+                break
+            if heuristic and len(options) > 1 and rng.random() >= epsilon:
+                best_count = -1
+                for n in options:
+                    onward = 0
+                    for m in neighbors[n]:
+                        if not blocked >> m & 1:
+                            onward += 1
+                    if onward > best_count:
+                        best_count, move = onward, n
+            else:
+                move = options[rng.randrange(len(options))]
+            blocked |= 1 << move
+            locs[side] = move
+            side ^= 1
+        winner = side ^ 1
+
+        # backpropagation
+        side_of = tree.side
+        for node in path:
+            visits[node] += 1
+            if side_of[node] == winner:
+                wins[node] += 1
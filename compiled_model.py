@@ -0,0 +1,153 @@
+"""Dependency-free evaluator for the tree ensemble trained by score_model.py.
+
+score_model.export_compiled_model() flattens the trees of a trained
+ExtraTreesClassifier into plain arrays and saves them as JSON, so the learned
+win probability can be used as a heuristic inside search without importing
+numpy or scikit-learn.  Every tree is stored in the same set of arrays; node
+`n` of the ensemble has
+
+    feature[n]      the feature tested by the node, or LEAF for a leaf
+    threshold[n]    go to left[n] if row[feature[n]] <= threshold[n],
+                    otherwise to right[n]
+    value[n * k:n * k + k]
+                    the class probabilities of a leaf (k classes)
+
+and `roots` holds the index of the first node of each tree.  Features are the
+`Board._board_state` layout of the board's canonical form, with NO_MOVE in
+place of a player that has not moved yet: the same columns as the
+score_model.deduplicate_positions() rows the model is trained on.
+"""
+import json
+
+from game_records import NO_MOVE
+
+LEAF = -1
+
+
+def board_features(game):
+    """Return the feature row of a board: its canonical state (see
+    `Board.canonical_form()`), in the `_board_state` layout with NO_MOVE in
+    place of None locations, matching the deduplicated training rows of
+    score_model.py.
+    """
+    row = list(game.canonical_form()[0])
+    if row[-1] is None:
+        row[-1] = NO_MOVE
+    if row[-2] is None:
+        row[-2] = NO_MOVE
+    return row
+
+
+class CompiledForest:
+    """A flattened tree ensemble; see the module docstring for the layout.
+
+    Parameters
+    ----------
+    classes : list
+        The class labels, in the order of the leaf probabilities.
+
+    roots : list<int>
+        Index of the root node of each tree.
+
+    feature, threshold, left, right : list
+        Per node arrays describing the splits.
+
+    value : list<float>
+        Leaf class probabilities, len(classes) entries per node.
+    """
+
+    def __init__(self, classes, roots, feature, threshold, left, right, value):
+        self.classes = list(classes)
+        self.roots = tuple(roots)
+        self.feature = tuple(feature)
+        self.threshold = tuple(threshold)
+        self.left = tuple(left)
+        self.right = tuple(right)
+        self.value = tuple(value)
+
+    @classmethod
+    def load(cls, path):
+        """Load a model saved with save(). """
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["classes"], data["roots"], data["feature"],
+                   data["threshold"], data["left"], data["right"],
+                   data["value"])
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(dict(classes=self.classes, roots=self.roots,
+                           feature=self.feature, threshold=self.threshold,
+                           left=self.left, right=self.right,
+                           value=self.value), f)
+
+    def class_index(self, label):
+        """Return the position of a class label in predict_proba() output, or
+        None if the model never saw the label.
+        """
+        return self.classes.index(label) if label in self.classes else None
+
+    def predict_proba(self, row):
+        """Return the list of class probabilities for one feature row,
+        averaged over the trees like sklearn's `predict_proba()`.
+        """
+        feature, threshold = self.feature, self.threshold
+        left, right, value = self.left, self.right, self.value
+        k = len(self.classes)
+        totals = [0.] * k
+        for node in self.roots:
+            while feature[node] != LEAF:
+                if row[feature[node]] <= threshold[node]:
+                    node = left[node]
+                else:
+                    node = right[node]
+            base = node * k
+            for i in range(k):
+                totals[i] += value[base + i]
+        n = len(self.roots)
+        return [total / n for total in totals]
+
+    def predict_class(self, row, class_index):
+        """Return the probability of a single class for one feature row;
+        cheaper than predict_proba() when only one class is needed.
+        """
+        feature, threshold = self.feature, self.threshold
+        left, right, value = self.left, self.right, self.value
+        k = len(self.classes)
+        total = 0.
+        for node in self.roots:
+            while feature[node] != LEAF:
+                if row[feature[node]] <= threshold[node]:
+                    node = left[node]
+                else:
+                    node = right[node]
+            total += value[node * k + class_index]
+        return total / len(self.roots)
+
+    def predict_class_batch(self, rows, class_index):
+        """Return the probability of a single class for each row of a list
+        of feature rows, e.g. every child of a search node at once.  Trees
+        are walked in the outer loop so each tree's arrays stay hot while all
+        rows descend it.
+        """
+        feature, threshold = self.feature, self.threshold
+        left, right, value = self.left, self.right, self.value
+        k = len(self.classes)
+        totals = [0.] * len(rows)
+        for root in self.roots:
+            for i, row in enumerate(rows):
+                node = root
+                while feature[node] != LEAF:
+                    if row[feature[node]] <= threshold[node]:
+                        node = left[node]
+                    else:
+                        node = right[node]
+                totals[i] += value[node * k + class_index]
+        n = len(self.roots)
+        return [total / n for total in totals]
+
+    def predict_proba_batch(self, rows):
+        """Return predict_proba() for each row of a list of feature rows. """
+        return [list(probs) for probs in
+                zip(*(self.predict_class_batch(rows, i)
+                      for i in range(len(self.classes))))] if rows else []
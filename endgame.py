@@ -0,0 +1,179 @@
+"""Exact endgame solver for partitioned isolation positions.
+
+Once no blank cell is reachable by both players (`Board.is_partitioned()`),
+the players can no longer block each other and the game reduces to two
+independent longest-knight-path problems: the player to move wins exactly
+when its longest path is longer than the opponent's.
+
+longest_path() finds a longest path with a depth-first search over the
+player's region, memoized on (cell, unvisited cells) in a table shared by
+all searches on boards of the same size, so later moves of the same endgame
+are mostly table lookups.  A node budget bounds each solve; when a region
+is too large to finish, or the turn's time runs out, solve() gives up and the caller falls back to
+regular search; the memo entries found so far are kept, so the solver
+usually succeeds a move or two later.
+"""
+import timeit
+from collections import namedtuple
+
+from isolation import knight_tables
+from isolation.bitboard import knight_masks
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def _popcount(mask):
+        return bin(mask).count("1")
+
+MAX_NODES = 2000  # search nodes allowed per longest_path() call (~25 ms)
+CACHE_SIZE = 2**18  # memo entries kept per board size before clearing
+
+# Memo tables keyed by (width, height); each maps (cell, unvisited cells)
+# to the length of the longest path from cell through those cells
+_CACHES = {}
+
+EndgameResult = namedtuple("EndgameResult", ["move", "won", "own_length",
+                                             "opponent_length"])
+
+
+class SolverBudgetExceeded(Exception):
+    """Raised when longest_path() runs out of search nodes or time. """
+    pass
+
+
+def reachable(masks, cell, free):
+    """Return the bitmask of the cells of `free` a knight on `cell` can
+    reach, moving only through cells of `free`.
+    """
+    reached = frontier = masks[cell] & free
+    while frontier:
+        grown = 0
+        while frontier:
+            low = frontier & -frontier
+            grown |= masks[low.bit_length() - 1]
+            frontier ^= low
+        frontier = grown & free & ~reached
+        reached |= frontier
+    return reached
+
+
+def longest_path(masks, start, region, cache=None, max_nodes=MAX_NODES, deadline=None):
+    """Return (length, first) for a longest knight path from cell `start`
+    through the cells of the bitmask `region`, where first is the first cell
+    of the path (None when no move is possible).
+
+    Parameters
+    ----------
+    masks : tuple<int>
+        Knight-move bitmask of each cell, as returned by
+        `isolation.bitboard.knight_masks()`.
+
+    start : int
+        Flat index of the cell the path starts from (not part of it).
+
+    region : int
+        Bitmask of the cells the path may visit.
+
+    cache : dict (optional)
+        Memo table to use and fill; must only be shared between calls on
+        boards of the same size.
+
+    max_nodes : int (optional)
+        Raise SolverBudgetExceeded after expanding this many new nodes.
+
+    deadline : float (optional)
+        Raise SolverBudgetExceeded once `timeit.default_timer()` passes this
+        time; checked every 64 nodes.
+    """
+    if cache is None:
+        cache = {}
+    budget = [max_nodes]
+
+    def search(cell, free):
+        # free only holds cells reachable from cell, so positions that
+        # differ in cut-off cells share a memo entry and the path length is
+        # bounded by the number of free cells
+        key = (cell, free)
+        length = cache.get(key)
+        if length is not None:
+            return length
+        budget[0] -= 1
+        if budget[0] < 0:
+            raise SolverBudgetExceeded()
+        if deadline is not None and not budget[0] & 63 and timeit.default_timer() > deadline:
+            raise SolverBudgetExceeded()
+        moves = []
+        options = masks[cell] & free
+        while options:
+            low = options & -options
+            n = low.bit_length() - 1
+            options ^= low
+            moves.append((_popcount(masks[n] & free), n))
+        # try the cells with the fewest onward moves first (Warnsdorff's
+        # rule), which tends to find a path through every free cell early
+        moves.sort()
+        bound = _popcount(free)
+        best = 0
+        for _, n in moves:
+            rest = free & ~(1 << n)
+            length = 1 + search(n, reachable(masks, n, rest))
+            if length > best:
+                best = length
+                if best == bound:
+                    break
+        cache[key] = best
+        return best
+
+    best, first = 0, None
+    options = masks[start] & region
+    while options:
+        low = options & -options
+        n = low.bit_length() - 1
+        options ^= low
+        rest = region & ~low
+        length = 1 + search(n, reachable(masks, n, rest))
+        if length > best:
+            best, first = length, n
+    return best, first
+
+
+def solve(game, max_nodes=MAX_NODES, time_left=None, threshold=0.):
+    """Solve a partitioned position for the player to move.
+
+    Returns an EndgameResult with the first move of the active player's
+    longest path ((-1, -1) if it has no move), whether the active player
+    wins with perfect play and both longest path lengths; or None if the
+    position is not partitioned or the solver ran out of nodes, or of time:
+    when `time_left` (a turn timer, see `isolation.TurnTimer`) is given, the
+    solver stops once fewer than `threshold` milliseconds are left.
+    """
+    deadline = None
+    if time_left is not None:
+        deadline = getattr(time_left, "deadline", None)
+        if deadline is None:
+            deadline = timeit.default_timer() + time_left() / 1000.
+        deadline -= threshold / 1000.
+        if timeit.default_timer() > deadline:
+            return None
+    if not game.is_partitioned():
+        return None
+    masks = knight_masks(game.width, game.height)
+    cells = knight_tables(game.width, game.height)[1]
+    cache = _CACHES.setdefault((game.width, game.height), {})
+    if len(cache) > CACHE_SIZE:
+        cache.clear()
+    lengths = []
+    for player in (game.active_player, game.inactive_player):
+        row, col = game.get_player_location(player)
+        try:
+            lengths.append(longest_path(masks, row + col * game.height,
+                                        game.reachable_cells(player), cache,
+                                        max_nodes, deadline))
+        except SolverBudgetExceeded:
+            return None
+    (own_length, first), (opponent_length, _) = lengths
+    # players alternate starting with the active player, so the active
+    # player runs out of moves first unless its path is strictly longer
+    return EndgameResult(cells[first] if first is not None else (-1, -1),
+                         own_length > opponent_length, own_length,
+                         opponent_length)
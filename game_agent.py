@@ -3,14 +3,44 @@ test your agent's strength against a set of known agents using tournament.py
 and include the results in your report.
 """
 import random,math
-
-#removed from use! but left as a demo of what is needed to use a class predictor
-#from sklearn.externals import joblib
-#rom sklearn.ensemble import ExtraTreesRegressor
-
-#print("loading estimator")
-#score_estimator=joblib.load("./trained_score_model.joblib") 
-#print("loaded est")
+import multiprocessing
+import sys
+import timeit
+from collections import namedtuple
+
+import batch_scores
+import endgame
+from isolation import TurnTimer, knight_tables, symmetry_tables
+from compiled_model import CompiledForest, board_features
+
+# class predictor exported by score_model.py; loaded by learned_score() on
+# first use
+COMPILED_MODEL = "./compiled_score_model.json"
+_score_model = None
+
+# Parallel root search (AlphaBetaPlayer(processes=N)): placeholders for the
+# players on boards sent to worker processes, and the extra milliseconds the
+# workers stop before the deadline to send their results back
+ROOT_PLAYER = "root player"
+ROOT_OPPONENT = "root opponent"
+PARALLEL_MARGIN = 5.
+MIN_PREDICT_MILLIS = .5  # shortest iteration time used to predict the next
+POLL_NODES = 16  # search nodes between clock reads (see IsolationPlayer.check_time)
+MIN_BATCH = 3  # fewest children scored by one call of a batch score function
+
+try:
+    _nextafter = math.nextafter
+except AttributeError:  # Python < 3.9
+    def _nextafter(x, toward):
+        """Return a float next to x in the direction of `toward` (one or two
+        units in the last place; close enough for null windows).
+        """
+        if x == toward:
+            return x
+        if math.isinf(x):
+            return math.copysign(sys.float_info.max, x)
+        step = abs(x) * sys.float_info.epsilon or 5e-324
+        return x + step if toward > x else x - step
 
 class SearchTimeout(Exception):
     """Subclass base exception for code clarity. """
@@ -51,10 +81,10 @@ def custom_score_3(game, player):
         return float("inf")
    
     
-    own_moves = len(game.get_legal_moves(player))
-    opp_moves = len(game.get_legal_moves(game.get_opponent(player)))
+    own_moves = game.count_legal_moves(player)
+    opp_moves = game.count_legal_moves(game.get_opponent(player))
     
-    empty_board = len(game.get_blank_spaces())
+    empty_board = game.blank_count()
     
     #moves_left= own_moves+opp_moves
     
@@ -64,24 +94,66 @@ def custom_score_3(game, player):
     # a more complex version using moves left on the board
     #return float(own_moves**2 - opp_moves**2)/moves_left
     
-    #unused but left as an example of how a class predictor might be implemented
-    # This was too slow to perform with timelimits, but seems structurally correct
-    #obtain the probability that a result is a winner
-    #result_est=score_estimator.predict_proba([list(game._board_state),])
-    #if player==game._player_1 :
-    #     result_est=result_est[0][0]
-    #else:
-    #     if len(score_estimator.classes_) > 1:
-    #        result_est=result_est[0][1]
-    #     else:
-    #        result_est=0
-    #result_orig=(float(own_moves**2 - opp_moves**2))
-    #result = float(result_est*result_orig)/(moves_left+empty_board)
-    #return result
-    #
+    # the class predictor version of this heuristic is learned_score()
 
     return float(own_moves - opp_moves)/empty_board
 
+def load_score_model(path=COMPILED_MODEL):
+    """Return the CompiledForest used by learned_score(), loading it from
+    `path` on first use.
+    """
+    global _score_model
+    if _score_model is None:
+        _score_model = CompiledForest.load(path)
+    return _score_model
+
+
+def learned_score(game, player):
+    """Calculate the heuristic value of a game state from the point of view
+    of the given player, as the win probability predicted by the model
+    exported with `score_model.export_compiled_model()` mapped to [-1, 1],
+    plus a small mobility term to break ties between equal predictions.
+
+    Parameters
+    ----------
+    game : `isolation.Board`
+        An instance of `isolation.Board` encoding the current state of the
+        game (e.g., player locations and blocked cells).
+
+    player : object
+        A player instance in the current game (i.e., an object corresponding to
+        one of the player objects `game.__player_1__` or `game.__player_2__`.)
+
+    Returns
+    -------
+    float
+        The heuristic value of the current game state to the specified player.
+    """
+    if game.is_loser(player):
+        return float("-inf")
+
+    if game.is_winner(player):
+        return float("inf")
+
+    model = load_score_model()
+    # winner labels are 1 for player 1 and 2 for player 2; player 1 is
+    # active on even move counts
+    is_player_1 = (player == game.active_player) == (game.move_count % 2 == 0)
+    label = model.class_index(1 if is_player_1 else 2)
+    win = model.predict_class(board_features(game), label) if label is not None else 0.
+
+    own_moves = game.count_legal_moves(player)
+    opp_moves = game.count_legal_moves(game.get_opponent(player))
+    return 2. * win - 1. + float(own_moves - opp_moves) / 1000.
+
+
+def learned_score_batch(game, moves, player):
+    """Vectorized learned_score() of the children of `game` reached by
+    `moves` (see batch_scores.py).
+    """
+    return batch_scores.forest_score_batch(load_score_model(), game, moves, player)
+
+
 def custom_score_2(game, player):
     """Calculate the heuristic value of a game state from the point of view
     of the given player.
@@ -114,10 +186,10 @@ def custom_score_2(game, player):
         return float("inf")
     
     
-    own_moves = len(game.get_legal_moves(player))
-    opp_moves = len(game.get_legal_moves(game.get_opponent(player)))
+    own_moves = game.count_legal_moves(player)
+    opp_moves = game.count_legal_moves(game.get_opponent(player))
         
-    empty_board = len(game.get_blank_spaces()) 
+    empty_board = game.blank_count() 
     moves_left= own_moves+opp_moves
     result=float(own_moves**2 - opp_moves**2)/(moves_left+empty_board)
     return result
@@ -157,10 +229,10 @@ def custom_score(game, player):
     if game.is_winner(player):
         return float("inf")
     
-    own_moves = len(game.get_legal_moves(player))
-    opp_moves = len(game.get_legal_moves(game.get_opponent(player)))
+    own_moves = game.count_legal_moves(player)
+    opp_moves = game.count_legal_moves(game.get_opponent(player))
     
-    empty_board = len(game.get_blank_spaces())   
+    empty_board = game.blank_count()   
     moves_left= own_moves+opp_moves
 
     w, h = game.width, game.height
@@ -184,6 +256,235 @@ def custom_score(game, player):
 
 
 
+batch_scores.register(custom_score, batch_scores.custom_score_batch)
+batch_scores.register(learned_score, learned_score_batch)
+
+# custom_score rewards distance from a point off the board's centre, so
+# only these score symmetric positions alike (see tt_symmetry_plies)
+custom_score_2.symmetric = custom_score_3.symmetric = learned_score.symmetric = True
+
+
+class SearchStats:
+    """Search counters collected by an `IsolationPlayer` created with
+    stats=True.  `Board.play()` resets them at the start of each game and
+    keeps a copy per player when the game ends (`Board.search_stats`).
+
+    Attributes
+    ----------
+    moves : int
+        Number of get_move() calls.
+
+    nodes : int
+        Nodes visited below the root (one per child searched).
+
+    leaves : int
+        Calls to the score function.
+
+    cutoffs : list<int>
+        Alpha-beta cutoffs by ply below the root.
+
+    researches : int
+        Full window re-searches after a failed null window (pvs=True) or
+        aspiration window.
+
+    early_stops : int
+        Searches the time manager ended before an iteration it predicted
+        could not finish (time_manager=True).
+
+    salvaged : int
+        Moves taken from an iteration the timer interrupted, because a root
+        move searched before the timeout beat the previous iteration's best
+        (time_manager=True).
+
+    depths : list<int>
+        The deepest completed search iteration of each move (0 if even the
+        first iteration timed out, or the endgame solver chose the move).
+
+    iteration_times : list<float>
+        Total milliseconds spent in completed iterations, by depth - 1.
+
+    iterations : list<int>
+        Number of completed iterations, by depth - 1.
+
+    margins : list<float>
+        Milliseconds left on the clock when each move was returned, as
+        measured by `Board.play()`.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.moves = 0
+        self.nodes = 0
+        self.leaves = 0
+        self.cutoffs = []
+        self.researches = 0
+        self.early_stops = 0
+        self.salvaged = 0
+        self.depths = []
+        self.iteration_times = []
+        self.iterations = []
+        self.margins = []
+
+    def copy(self):
+        new_stats = SearchStats()
+        new_stats.merge(self)
+        return new_stats
+
+    def cutoff(self, ply):
+        """Count a cutoff `ply` plies below the root. """
+        if ply >= len(self.cutoffs):
+            self.cutoffs.extend([0] * (ply + 1 - len(self.cutoffs)))
+        self.cutoffs[ply] += 1
+
+    def iteration(self, depth, millis):
+        """Record a completed iteration of `depth` plies that took `millis`
+        milliseconds.
+        """
+        if depth > len(self.iterations):
+            grow = depth - len(self.iterations)
+            self.iterations.extend([0] * grow)
+            self.iteration_times.extend([0.] * grow)
+        self.iterations[depth - 1] += 1
+        self.iteration_times[depth - 1] += millis
+
+    def end_move(self, depth):
+        """Record a finished get_move() that completed `depth` plies. """
+        self.moves += 1
+        self.depths.append(depth)
+
+    def merge(self, other):
+        """Add the counts of another SearchStats to this one. """
+        self.moves += other.moves
+        self.nodes += other.nodes
+        self.leaves += other.leaves
+        self.researches += other.researches
+        self.early_stops += other.early_stops
+        self.salvaged += other.salvaged
+        for ply, count in enumerate(other.cutoffs):
+            self.cutoff(ply)
+            self.cutoffs[ply] += count - 1
+        for depth, count in enumerate(other.iterations, 1):
+            self.iteration(depth, other.iteration_times[depth - 1])
+            self.iterations[depth - 1] += count - 1
+        self.depths.extend(other.depths)
+        self.margins.extend(other.margins)
+        return self
+
+    def summary(self):
+        """Return a dict of per-move averages and totals. """
+        moves = max(self.moves, 1)
+        return dict(
+            moves=self.moves,
+            nodes=self.nodes,
+            leaves=self.leaves,
+            nodes_per_move=self.nodes / moves,
+            leaves_per_move=self.leaves / moves,
+            mean_depth=sum(self.depths) / moves,
+            max_depth=max(self.depths, default=0),
+            cutoffs=list(self.cutoffs),
+            researches=self.researches,
+            early_stops=self.early_stops,
+            salvaged=self.salvaged,
+            iteration_millis=[total / count if count else 0.
+                              for total, count in zip(self.iteration_times,
+                                                      self.iterations)],
+            mean_margin=sum(self.margins) / max(len(self.margins), 1),
+            min_margin=min(self.margins, default=0.))
+
+
+TTEntry = namedtuple("TTEntry", ["key", "depth", "flag", "score", "move", "age"])
+
+
+class TranspositionTable:
+    """Bounded transposition table keyed by `Board.hash()` values.
+
+    Entries record the search depth, the score with a flag saying whether it
+    is exact or only a lower/upper bound (from a beta/alpha cutoff), and the
+    best move found, which searches try first.  The table is a fixed array of
+    slots indexed by the low bits of the key; a new entry replaces the one in
+    its slot when the slot holds the same position, an entry left from an
+    earlier search (see new_search()) or an entry searched no deeper.
+
+    Parameters
+    ----------
+    size : int
+        Number of slots; rounded up to a power of two.
+    """
+    EXACT, LOWER, UPPER = 0, 1, 2
+
+    def __init__(self, size=2**16):
+        self.size = 1 << max(size - 1, 1).bit_length()
+        self.mask = self.size - 1
+        self.slots = [None] * self.size
+        self.age = 0
+
+    def new_search(self):
+        """Start a new search; entries stored before now are replaceable. """
+        self.age += 1
+
+    def clear(self):
+        self.slots = [None] * self.size
+
+    def get(self, key):
+        """Return the entry stored for `key`, or None. """
+        entry = self.slots[key & self.mask]
+        if entry is not None and entry.key == key:
+            return entry
+        return None
+
+    def probe(self, key, depth, alpha, beta):
+        """Look up `key` for a search of `depth` plies in window (alpha, beta).
+
+        Returns
+        -------
+        (float or None, (int, int) or None)
+            The stored score if the entry is deep enough and its bound settles
+            the node (None otherwise), and the stored best move (None if the
+            position is not in the table).
+        """
+        entry = self.get(key)
+        if entry is None:
+            return None, None
+        if entry.depth >= depth:
+            if (entry.flag == self.EXACT or
+                    (entry.flag == self.LOWER and entry.score >= beta) or
+                    (entry.flag == self.UPPER and entry.score <= alpha)):
+                return entry.score, entry.move
+        return None, entry.move
+
+    def store(self, key, depth, score, alpha, beta, move):
+        """Record the result of searching `key` to `depth` plies with the
+        original window (alpha, beta).
+        """
+        if score <= alpha:
+            flag = self.UPPER
+        elif score >= beta:
+            flag = self.LOWER
+        else:
+            flag = self.EXACT
+        idx = key & self.mask
+        old = self.slots[idx]
+        if (old is None or old.key == key or old.age != self.age or
+                depth >= old.depth):
+            self.slots[idx] = TTEntry(key, depth, flag, score, move, self.age)
+
+
+# Mixed into table keys when the searching player is player 2; scores are
+# stored from the searching player's point of view, so the same position
+# must not share an entry between the two seats
+_TT_SEAT_KEY = 0x9e3779b97f4a7c15
+
+
+def _tt_move_first(legal_moves, tt_move):
+    """Move the transposition table's best move to the front, in place. """
+    if tt_move is not None and tt_move in legal_moves:
+        legal_moves.remove(tt_move)
+        legal_moves.insert(0, tt_move)
+    return legal_moves
+
+
 class IsolationPlayer:
     """Base class for minimax and alphabeta agents -- this class is never
     constructed or tested directly.
@@ -205,12 +506,82 @@ class IsolationPlayer:
         Time remaining (in milliseconds) when search is aborted. Should be a
         positive value large enough to allow the function to return before the
         timer expires.
+
+    inplace : bool (optional)
+        Search by applying and taking back moves on a single board with
+        `Board.push_move()`/`Board.pop_move()` instead of allocating a new
+        board for every node with `Board.forecast_move()`.
+
+    stats : bool (optional)
+        Collect search statistics in `self.stats` (a `SearchStats`);
+        otherwise `self.stats` is None.  Counting is done by wrappers
+        installed over child_value() and the score function, so players
+        without stats run the search code unchanged.
+
+    poll_nodes : int (optional)
+        Number of search nodes between reads of the clock (see
+        check_time()); 1 checks the time at every node.
     """
-    def __init__(self, search_depth=3, score_fn=custom_score, timeout=13.):
+    def __init__(self, search_depth=3, score_fn=custom_score, timeout=13.,
+                 inplace=False, stats=False, poll_nodes=POLL_NODES):
         self.search_depth = search_depth
         self.score = score_fn
         self.time_left = None
         self.TIMER_THRESHOLD = timeout
+        self.inplace = inplace
+        self.poll_nodes = poll_nodes
+        self._polls = 0  # nodes left until the next check_time()
+        self.stats = None
+        if stats:
+            self.stats = SearchStats()
+            self._score_fn = score_fn
+            self.score = self._counted_score
+            self.child_value = self._counted_child_value
+
+    def _counted_score(self, game, player):
+        """The score function, counting leaf evaluations. """
+        self.stats.leaves += 1
+        return self._score_fn(game, player)
+
+    def _counted_child_value(self, game, move, value_fn, *args):
+        """child_value(), counting visited nodes. """
+        self.stats.nodes += 1
+        return type(self).child_value(self, game, move, value_fn, *args)
+
+    def child_value(self, game, move, value_fn, *args):
+        """Return value_fn(child, *args) for the child of `game` reached by
+        `move`, either on a forecast copy or, in inplace mode, on `game`
+        itself with the move pushed and popped around the call.
+        """
+        if not self.inplace:
+            return value_fn(game.forecast_move(move), *args)
+        game.push_move(move)
+        score = value_fn(game, *args)
+        game.pop_move()
+        return score
+
+    def check_time(self):
+        """Raise SearchTimeout if fewer than TIMER_THRESHOLD milliseconds are
+        left, and restart the countdown of `poll_nodes` nodes to the next
+        check.
+
+        Searches check at the root and then count nodes down inline, so the
+        clock is read once every `poll_nodes` nodes.  When time_left is an
+        `isolation.TurnTimer` the clock is compared against its absolute
+        deadline instead of calling it.
+        """
+        self._polls = self.poll_nodes
+        deadline = getattr(self.time_left, "deadline", None)
+        if deadline is None:
+            if self.time_left() < self.TIMER_THRESHOLD:
+                raise SearchTimeout()
+        elif timeit.default_timer() > deadline - self.TIMER_THRESHOLD / 1000.:
+            raise SearchTimeout()
+
+    def unwind(self, game, move_count):
+        """Pop the moves an interrupted inplace search left on `game`. """
+        while game.move_count > move_count:
+            game.pop_move()
 
 
 class MinimaxPlayer(IsolationPlayer):
@@ -252,15 +623,21 @@ class MinimaxPlayer(IsolationPlayer):
         # Initialize the best move so that this function returns something
         # in case the search fails due to timeout
         best_move = (-1, -1)
+        move_count = game.move_count
 
         try:
             # The try/except block will automatically catch the exception
             # raised when the timer is about to expire.
-            return self.minimax(game, self.search_depth)
+            best_move = self.minimax(game, self.search_depth)
+            if self.stats is not None:
+                self.stats.end_move(self.search_depth)
+            return best_move
 
         except SearchTimeout:
-            pass  # Handle any actions required after timeout as needed
+            self.unwind(game, move_count)
 
+        if self.stats is not None:
+            self.stats.end_move(0)
         # Return the best move from the last completed search iteration
         return best_move
 
@@ -303,8 +680,7 @@ class MinimaxPlayer(IsolationPlayer):
                 each helper function or else your agent will timeout during
                 testing.
         """
-        if self.time_left() < self.TIMER_THRESHOLD:
-            raise SearchTimeout()
+        self.check_time()
         # TODO: finish this function!
 
         legal_moves = game.get_legal_moves()
@@ -316,7 +692,7 @@ class MinimaxPlayer(IsolationPlayer):
         best_score = float("-inf")
         
         for move in legal_moves:
-            score = self.min_value(game.forecast_move(move),depth-1)
+            score = self.child_value(game, move, self.min_value, depth - 1)
             if score > best_score:
                 best_score=score
                 best_move=move
@@ -324,26 +700,28 @@ class MinimaxPlayer(IsolationPlayer):
         return best_move
 
     def max_value(self, game, depth):
-        if self.time_left() < self.TIMER_THRESHOLD:
-            raise SearchTimeout()
+        self._polls -= 1
+        if self._polls <= 0:
+            self.check_time()
         if depth == 0:
             return self.score(game, self)
 
         best_score = float("-inf")
         for move in game.get_legal_moves():
-            best_score = max(best_score, self.min_value(game.forecast_move(move), depth - 1))
+            best_score = max(best_score, self.child_value(game, move, self.min_value, depth - 1))
             
         return best_score
 
     def min_value(self, game, depth):
-        if self.time_left() < self.TIMER_THRESHOLD:
-            raise SearchTimeout()
+        self._polls -= 1
+        if self._polls <= 0:
+            self.check_time()
         if depth == 0:
             return self.score(game, self)
 
         best_score = float("inf")
         for move in game.get_legal_moves():
-            best_score = min(best_score, self.max_value(game.forecast_move(move), depth - 1))
+            best_score = min(best_score, self.child_value(game, move, self.max_value, depth - 1))
 
         return best_score
             
@@ -351,7 +729,204 @@ class AlphaBetaPlayer(IsolationPlayer):
     """Game-playing agent that chooses a move using iterative deepening minimax
     search with alpha-beta pruning. You must finish and test this player to
     make sure it returns a good move before the search time limit expires.
+
+    Parameters
+    ----------
+    tt_size : int (optional)
+        Number of transposition table slots; 0 disables the table.  The table
+        is kept across iterative-deepening iterations and across turns.
+
+    ordering : bool (optional)
+        Order moves at every node: the previous iteration's principal
+        variation first, then the transposition table move, killer moves
+        and finally by history heuristic score.  Also turns off the
+        random shuffle of legal moves on the searched board, so searches
+        are deterministic.
+
+    endgame : bool (optional)
+        Once the players' regions are separated (`Board.is_partitioned()`),
+        play the first move of the longest knight path found by the exact
+        endgame solver (see endgame.py) instead of searching.  Positions the
+        solver cannot finish within its node budget, or before the turn is
+        down to TIMER_THRESHOLD, are searched as usual.
+
+    tt_symmetry_plies : int (optional)
+        Key the transposition table by `Board.canonical_hash()` at nodes
+        with fewer than this many moves played, so rotations and
+        reflections of a position share one entry; deeper nodes use the
+        cheaper `Board.hash()`, since symmetric positions are rare once the
+        players have moved.  Only allowed with a score function that scores
+        symmetric positions alike, marked by a true `symmetric` attribute;
+        ValueError is raised otherwise.
+
+    opening_book : `opening_book.OpeningBook` (optional)
+        Play the book reply, without searching, in positions found in the
+        book (see opening_book.py).
+
+    pvs : bool (optional)
+        Principal variation search: search the first move of every node
+        with the full window and the others with a null window just above
+        alpha (below beta at min nodes), re-searching with the full window
+        only when a move turns out better.  Pays off with `ordering`, when
+        the first move is usually the best.
+
+    aspiration : float (optional)
+        Start each iterative deepening iteration after the first with the
+        window (score - aspiration, score + aspiration) around the previous
+        iteration's score, re-searching with that side of the window opened
+        when the score falls outside it; 0 searches every iteration with
+        the full window.  The width should match the score function's
+        scale.
+
+    time_manager : bool (optional)
+        Predict the time of each next iteration from the effective branching
+        factor of the iterations completed so far, and return instead of
+        starting one that is not expected to finish before the timer
+        reaches TIMER_THRESHOLD.  An iteration interrupted by the timer
+        still counts when a root move searched before the timeout scored
+        better than the previous iteration's best move, which is always
+        searched first.
+
+    batch : bool (optional)
+        Score the children of the nodes one ply above the frontier with a
+        single call of the batch version of `score_fn` (see
+        batch_scores.py): its vectorized numpy version when there is one,
+        otherwise `score_fn` on each child.  The first child is scored
+        alone, and the others together once it has not caused a cutoff;
+        nodes with fewer than MIN_BATCH other children are scored one child
+        at a time.
+
+    processes : int (optional)
+        Split the root moves into this many shares and search all but the
+        first in a pool of worker processes (started by start(), which the
+        constructor calls, and kept until close(); the player is also a
+        context manager doing both), each running its own iterative
+        deepening and transposition table until the same deadline.  The
+        player searches the first share itself, then picks the best move of
+        all shares at the deepest depth they all completed; without a pool,
+        as after close() or in a pickled copy, it searches every move
+        itself.  The score function must be picklable (a module level
+        function).
+
+    See `IsolationPlayer` for the remaining parameters.
     """
+    def __init__(self, search_depth=3, score_fn=custom_score, timeout=13.,
+                 inplace=False, tt_size=0, ordering=False, stats=False,
+                 endgame=False, opening_book=None, tt_symmetry_plies=0,
+                 pvs=False, aspiration=0., time_manager=False, batch=False,
+                 processes=1, poll_nodes=POLL_NODES):
+        super().__init__(search_depth, score_fn, timeout, inplace, stats, poll_nodes)
+        if tt_symmetry_plies and not getattr(score_fn, "symmetric", False):
+            raise ValueError("tt_symmetry_plies needs a score function with a true "
+                             "`symmetric` attribute")
+        self.opening_book = opening_book
+        self.tt = TranspositionTable(tt_size) if tt_size else None
+        self._tt_size = tt_size
+        self._tt_seat = 0
+        self.tt_symmetry_plies = tt_symmetry_plies
+        self.pvs = pvs
+        self.aspiration = aspiration
+        self.time_manager = time_manager
+        self.batch = batch
+        self.batch_score = batch_scores.batch_score_fn(score_fn) if batch else None
+        # the previous iteration's best move, searched first at the root
+        # with time_manager, and the best (move, score) found so far by an
+        # iteration that searched it first
+        self._root_first = None
+        self._partial = None
+        self.processes = processes
+        self._pool = None
+        # Root moves to search (None for all of them) and the score of the
+        # best root move of the last completed iteration
+        self.root_moves = None
+        self.root_score = None
+        self.ordering = ordering
+        self.endgame = endgame
+        # EndgameResult of the last move decided by the endgame solver
+        self.endgame_result = None
+
+        # Move ordering state: the principal variation of the last completed
+        # iteration, the triangular table collecting the current one, two
+        # killer moves per ply and one history table per side
+        self.principal_variation = []
+        self._pv_table = []
+        self._follow_pv = False
+        self._root_depth = 0
+        self._killers = []
+        self._history = ({}, {})
+        self.start()
+
+    def tt_key(self, game):
+        """Return (key, symmetry) of the transposition table entry for
+        `game`: the hash and the identity, or the canonical hash and its
+        transform for the first `tt_symmetry_plies` plies of the game.
+        """
+        if game.move_count < self.tt_symmetry_plies:
+            key, symmetry = game.canonical_hash()
+            return key ^ self._tt_seat, symmetry
+        return game.hash() ^ self._tt_seat, 0
+
+    def transform_move(self, game, move, symmetry, inverse=False):
+        """Map `move` from the board's frame to the canonical frame of
+        symmetry `symmetry` (from the canonical frame with inverse=True);
+        table moves of canonical entries are stored in the canonical frame.
+        """
+        if move is None:
+            return None
+        cells, cell_index = knight_tables(game.width, game.height)[1:]
+        perm = symmetry_tables(game.width, game.height, inverse)[symmetry]
+        return cells[perm[cell_index[move]]]
+
+    def order_moves(self, legal_moves, ply, tt_move=None):
+        """Sort `legal_moves` in place for the node `ply` plies below the root:
+        the principal variation move (while the search is still following
+        the previous iteration's PV), the transposition table move, the
+        killer moves for this ply, then the rest by history score.
+        """
+        first = tt_move
+        if self._follow_pv:
+            pv = self.principal_variation
+            if ply < len(pv) and pv[ply] in legal_moves:
+                first = pv[ply]
+            else:
+                self._follow_pv = False
+        killers = self._killers[ply]
+        history = self._history[ply & 1]
+
+        def priority(move):
+            if move == first:
+                return 1 << 62
+            if move in killers:
+                return (1 << 61) if move == killers[0] else (1 << 60)
+            return history.get(move, 0)
+
+        legal_moves.sort(key=priority, reverse=True)
+        return legal_moves
+
+    def record_cutoff(self, ply, move, depth):
+        """Update the killer moves and history table for a move that caused
+        a cutoff at `ply` with `depth` plies left to search.
+        """
+        killers = self._killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        history = self._history[ply & 1]
+        history[move] = history.get(move, 0) + depth * depth
+
+    def update_pv(self, ply, move):
+        """Record `move` followed by the child's line as the PV at `ply`. """
+        self._pv_table[ply] = [move] + self._pv_table[ply + 1]
+
+    def start_search(self, game, max_depth):
+        """Reset per-turn move ordering state before iterative deepening. """
+        game.shuffle_moves = False
+        self.principal_variation = []
+        self._killers = [[None, None] for _ in range(max_depth + 1)]
+        # age the history scores so the previous turn still counts for a bit
+        for history in self._history:
+            for move in history:
+                history[move] >>= 2
 
     def get_move(self, game, time_left):
         """Search for the best move from the available legal moves and return a
@@ -385,17 +960,208 @@ class AlphaBetaPlayer(IsolationPlayer):
              best_move =  (-1, -1)
         else:
              best_move = legal_moves[0]
-           
-        max_depth = len(game.get_blank_spaces())+1
-        
+
+        if self.opening_book is not None and legal_moves:
+            move = self.opening_book.lookup(game)
+            if move in legal_moves:
+                if self.stats is not None:
+                    self.stats.end_move(0)
+                return move
+
+        if self.endgame and legal_moves:
+            self.endgame_result = endgame.solve(game, time_left=time_left,
+                                                threshold=self.TIMER_THRESHOLD)
+            if self.endgame_result is not None:
+                if self.stats is not None:
+                    self.stats.end_move(0)
+                return self.endgame_result.move
+
+        pending = None
+        if self._pool is not None and len(legal_moves) > 1:
+            pending = self.split_root(game, legal_moves)
+
+        iterations = self.deepen(game)
+        if iterations:
+            best_move, self.root_score = iterations[-1][1:]
+        completed = len(iterations)
+        if self._partial is not None and pending is None:
+            best_move, self.root_score = self._partial
+            if self.stats is not None:
+                self.stats.salvaged += 1
+
+        if pending is not None:
+            self.root_moves = None
+            best_move, completed = self.join_root(pending, iterations, best_move)
+
+        if self.stats is not None:
+            self.stats.end_move(completed)
+        return best_move
+
+    def deepen(self, game, max_depth=None):
+        """Run iterative deepening from `game` until the search times out,
+        completes `max_depth` plies or reaches the end of the game; return
+        the list of (depth, best move, score) of every completed iteration.
+        """
+        if max_depth is None or max_depth > game.blank_count():
+            max_depth = game.blank_count()
+        max_depth += 1
+        move_count = game.move_count
+        if self.tt is not None:
+            self.tt.new_search()
+        if self.ordering:
+            self.start_search(game, max_depth)
+        stats = self.stats
+        time_left = self.time_left
+        time_manager = self.time_manager
+        iterations = []
+        millis = []
+        self._partial = None
+
         try:
             # https://github.com/aimacode/aima-pseudocode/blob/master/md/Iterative-Deepening-Search.md
             for depth in range(1, max_depth):
-                best_move = self.alphabeta(game, depth)
+                start = time_left()
+                if time_manager and iterations:
+                    if self.predict_millis(millis) > start - self.TIMER_THRESHOLD:
+                        if stats is not None:
+                            stats.early_stops += 1
+                        break
+                    self._root_first = iterations[-1][1]
+                if self.aspiration and iterations:
+                    best_move = self.aspiration_search(game, depth, iterations[-1][2])
+                else:
+                    best_move = self.alphabeta(game, depth)
+                iterations.append((depth, best_move, self.root_score))
+                self._partial = None
+                millis.append(start - time_left())
+                if stats is not None:
+                    stats.iteration(depth, millis[-1])
         except SearchTimeout:
-            pass
+            self.unwind(game, move_count)
+        self._root_first = None
+        return iterations
+
+    @staticmethod
+    def predict_millis(millis):
+        """Predict the time of the next iteration from the times of the
+        completed ones, in milliseconds, as the last time multiplied by the
+        effective branching factor.
+
+        Alpha-beta costs alternate between odd and even depths, so the
+        factor is the square root of the growth over the last two
+        iterations when there are enough of them; iterations too fast to
+        time reliably predict nothing (0).
+        """
+        if len(millis) < 2 or millis[-2] < MIN_PREDICT_MILLIS:
+            return 0.
+        if len(millis) >= 3 and millis[-3] >= MIN_PREDICT_MILLIS:
+            ebf = math.sqrt(millis[-1] / millis[-3])
+        else:
+            ebf = millis[-1] / millis[-2]
+        return millis[-1] * max(ebf, 1.)
 
-        return best_move
+    def aspiration_search(self, game, depth, guess):
+        """Search the root to `depth` plies with an aspiration window around
+        `guess`, widening the side the score falls outside of until it lands
+        inside the window.
+        """
+        if math.isinf(guess):
+            return self.alphabeta(game, depth)
+        alpha = guess - self.aspiration
+        beta = guess + self.aspiration
+        while True:
+            best_move = self.alphabeta(game, depth, alpha, beta)
+            if self.root_score <= alpha and alpha > float("-inf"):
+                if self.stats is not None:
+                    self.stats.researches += 1
+                alpha = float("-inf")
+            elif self.root_score >= beta and beta < float("inf"):
+                if self.stats is not None:
+                    self.stats.researches += 1
+                beta = float("inf")
+            else:
+                return best_move
+
+    def split_root(self, game, legal_moves):
+        """Start searching all but the first share of `legal_moves` in the
+        worker processes, and restrict this player's own search to the first
+        share (see `processes`).  Returns the pending worker results.
+        """
+        shares = [legal_moves[i::self.processes] for i in range(self.processes)]
+        # the workers get a copy of the board with both players replaced by
+        # placeholders, so neither player object is pickled
+        board = game.copy()
+        for attr in ("_player_1", "_player_2", "_active_player", "_inactive_player"):
+            setattr(board, attr, ROOT_PLAYER if getattr(board, attr) == self
+                    else ROOT_OPPONENT)
+        deadline = timeit.default_timer() + self.time_left() / 1000.
+        pending = [self._pool.apply_async(_search_root_share, (board, share, deadline))
+                   for share in shares[1:] if share]
+        self.root_moves = shares[0]
+        return pending
+
+    def join_root(self, pending, iterations, best_move):
+        """Combine this player's iterations with the workers' results and
+        return (best move, depth).
+
+        The move is the best of all shares at the deepest depth every share
+        that reported in time has completed; results still missing when the
+        timer reaches TIMER_THRESHOLD are ignored.
+        """
+        results = [iterations]
+        for result in pending:
+            wait = (self.time_left() - self.TIMER_THRESHOLD) / 1000.
+            try:
+                results.append(result.get(max(wait, 0.)))
+            except multiprocessing.TimeoutError:
+                pass
+        results = [share for share in results if share]
+        if not results:
+            return best_move, 0
+        depth = min(len(share) for share in results)
+        best_score = float("-inf")
+        for share in results:
+            move, score = share[depth - 1][1:]
+            if score > best_score or best_move is None:
+                best_score, best_move = score, move
+        self.root_score = best_score
+        return best_move, depth
+
+    def start(self):
+        """Start the worker processes of a parallel player (see
+        `processes`), unless they are running already.  Call it outside of
+        get_move(): starting the pool takes longer than a turn.
+        """
+        if self.processes > 1 and self._pool is None:
+            options = dict(score_fn=self._score_fn if self.stats is not None
+                           else self.score,
+                           timeout=self.TIMER_THRESHOLD + PARALLEL_MARGIN,
+                           inplace=self.inplace, tt_size=self._tt_size,
+                           ordering=self.ordering,
+                           tt_symmetry_plies=self.tt_symmetry_plies,
+                           pvs=self.pvs, aspiration=self.aspiration,
+                           batch=self.batch, poll_nodes=self.poll_nodes)
+            self._pool = multiprocessing.Pool(self.processes - 1, _init_root_worker,
+                                              (options,))
+
+    def close(self):
+        """Stop the worker processes of a parallel player. """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getstate__(self):
+        # worker pools cannot be pickled; a copy searches alone until start()
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        return state
 
     def alphabeta(self, game, depth, alpha=float("-inf"), beta=float("inf")):
         """Implement depth-limited minimax search with alpha-beta pruning as
@@ -433,56 +1199,270 @@ class AlphaBetaPlayer(IsolationPlayer):
                 each helper function or else your agent will timeout during
                 testing.
         """
-        if self.time_left() < self.TIMER_THRESHOLD:
-            raise SearchTimeout()
+        self.check_time()
 
         legal_moves = game.get_legal_moves()
+        if self.root_moves is not None:
+            legal_moves = [move for move in legal_moves if move in self.root_moves]
         if not legal_moves or len(legal_moves)==0:
              best_move =  (-1, -1)
         else:
              best_move = legal_moves[0]
+
+        tt_key = tt_move = None
+        if self.tt is not None:
+            # the root player is always the one to move
+            self._tt_seat = _TT_SEAT_KEY if game.move_count & 1 else 0
+            tt_key, tt_symmetry = self.tt_key(game)
+            tt_move = self.tt.probe(tt_key, depth, alpha, beta)[1]
+            if tt_symmetry:
+                tt_move = self.transform_move(game, tt_move, tt_symmetry, True)
+        self._root_depth = depth
+        if self.ordering:
+            game.shuffle_moves = False
+            if len(self._killers) <= depth:
+                self._killers.extend([None, None] for _ in range(depth + 1 - len(self._killers)))
+            self._pv_table = [[] for _ in range(depth + 1)]
+            self._follow_pv = True
+            self.order_moves(legal_moves, 0, tt_move)
+        else:
+            _tt_move_first(legal_moves, tt_move)
+        root_first = self._root_first
+        if root_first is not None:
+            _tt_move_first(legal_moves, root_first)
+        alpha_orig = alpha
            
         best_score = float("-inf")
         
-        for move in game.get_legal_moves():
-            score = self.min_value(game.forecast_move(move), depth-1, alpha, beta)
+        pvs = self.pvs
+        for i, move in enumerate(legal_moves):
+            if pvs and i:
+                score = self.null_window_max(game, move, depth, alpha, beta)
+            else:
+                score = self.child_value(game, move, self.min_value, depth - 1, alpha, beta)
             if score > best_score:
                 best_score = score
                 best_move = move
+                # fully searched and better than the previous best move: good
+                # enough to play if the timer interrupts the iteration
+                if i and score > alpha_orig and legal_moves[0] == root_first:
+                    self._partial = (move, score)
+                if self.ordering:
+                    self.update_pv(0, move)
+            if self.ordering:
+                self._follow_pv = False
             if best_score >= beta:
-                return move
+                if self.stats is not None:
+                    self.stats.cutoff(0)
+                break
             alpha = max(alpha, best_score)
             #print ("depth",depth,"alpha:",alpha,"beta:",beta,"score:",score,"best_score:",best_score)
 
-
+        # a root searched over a share of its moves has no true value, so it
+        # must not be stored where deeper searches could find it
+        if tt_key is not None and legal_moves and self.root_moves is None:
+            if tt_symmetry:
+                stored_move = self.transform_move(game, best_move, tt_symmetry)
+            else:
+                stored_move = best_move
+            self.tt.store(tt_key, depth, best_score, alpha_orig, beta, stored_move)
+        if self.ordering:
+            self.principal_variation = self._pv_table[0]
+
+        self.root_score = best_score
         return best_move
 
+    def null_window_max(self, game, move, depth, alpha, beta):
+        """Value of a later `move` at a max node searched `depth` plies with
+        window (alpha, beta): first prove it cannot beat alpha with a null
+        window, re-searching with the full window only if it does.
+        """
+        score = self.child_value(game, move, self.min_value, depth - 1,
+                                 alpha, _nextafter(alpha, float("inf")))
+        if alpha < score < beta:
+            if self.stats is not None:
+                self.stats.researches += 1
+            score = self.child_value(game, move, self.min_value, depth - 1, alpha, beta)
+        return score
+
+    def null_window_min(self, game, move, depth, alpha, beta):
+        """The min node counterpart of null_window_max(): prove `move`
+        cannot go below beta with a null window just under it.
+        """
+        score = self.child_value(game, move, self.max_value, depth - 1,
+                                 _nextafter(beta, float("-inf")), beta)
+        if alpha < score < beta:
+            if self.stats is not None:
+                self.stats.researches += 1
+            score = self.child_value(game, move, self.max_value, depth - 1, alpha, beta)
+        return score
+
+    def frontier_scores(self, game, legal_moves):
+        """Return the scores of the children of a node one ply above the
+        frontier, from one call of the batch score function.
+        """
+        if self.stats is not None:
+            self.stats.nodes += len(legal_moves)
+            self.stats.leaves += len(legal_moves)
+        return self.batch_score(game, legal_moves, self)
+
     def max_value(self, game, depth, alpha, beta):
-        if self.time_left() < self.TIMER_THRESHOLD:
-            raise SearchTimeout()
+        self._polls -= 1
+        if self._polls <= 0:
+            self.check_time()
         if depth == 0:
             return self.score(game, self)
 
+        legal_moves = game.get_legal_moves()
+        ordering = self.ordering
+        if ordering:
+            ply = self._root_depth - depth
+            self._pv_table[ply] = []
+        tt_key = tt_move = None
+        if self.tt is not None and depth > 1:
+            # tt_key() inlined for the common case
+            if game.move_count < self.tt_symmetry_plies:
+                tt_key, tt_symmetry = self.tt_key(game)
+            else:
+                tt_key, tt_symmetry = game.hash() ^ self._tt_seat, 0
+            tt_score, tt_move = self.tt.probe(tt_key, depth, alpha, beta)
+            if tt_score is not None:
+                return tt_score
+            if tt_symmetry:
+                tt_move = self.transform_move(game, tt_move, tt_symmetry, True)
+        if ordering:
+            self.order_moves(legal_moves, ply, tt_move)
+        else:
+            _tt_move_first(legal_moves, tt_move)
+        alpha_orig = alpha
+
         best_score = float("-inf")
-        for move in game.get_legal_moves():
-            best_score = max(best_score, self.min_value(game.forecast_move(move), depth - 1, alpha, beta))
+        best_move = None
+        pvs = self.pvs
+        frontier = (depth == 1 and self.batch_score is not None
+                    and len(legal_moves) > MIN_BATCH)
+        scores = None
+        for i, move in enumerate(legal_moves):
+            if frontier and i:
+                # the first child alone often causes a cutoff; the others
+                # are scored together once it has not
+                if scores is None:
+                    scores = self.frontier_scores(game, legal_moves[1:])
+                score = scores[i - 1]
+            elif pvs and i:
+                score = self.null_window_max(game, move, depth, alpha, beta)
+            else:
+                score = self.child_value(game, move, self.min_value, depth - 1, alpha, beta)
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if ordering and score > alpha:
+                    self.update_pv(ply, move)
+            if ordering:
+                self._follow_pv = False
             if best_score >= beta:
-                return best_score
+                if ordering:
+                    self.record_cutoff(ply, move, depth)
+                if self.stats is not None:
+                    self.stats.cutoff(self._root_depth - depth)
+                break
             alpha = max(best_score, alpha)
 
+        if tt_key is not None:
+            if tt_symmetry:
+                best_move = self.transform_move(game, best_move, tt_symmetry)
+            self.tt.store(tt_key, depth, best_score, alpha_orig, beta, best_move)
         return best_score
 
     def min_value(self, game, depth, alpha, beta):
-        if self.time_left() < self.TIMER_THRESHOLD:
-            raise SearchTimeout()
+        self._polls -= 1
+        if self._polls <= 0:
+            self.check_time()
         if depth == 0:
             return self.score(game, self)
 
+        legal_moves = game.get_legal_moves()
+        ordering = self.ordering
+        if ordering:
+            ply = self._root_depth - depth
+            self._pv_table[ply] = []
+        tt_key = tt_move = None
+        if self.tt is not None and depth > 1:
+            # tt_key() inlined for the common case
+            if game.move_count < self.tt_symmetry_plies:
+                tt_key, tt_symmetry = self.tt_key(game)
+            else:
+                tt_key, tt_symmetry = game.hash() ^ self._tt_seat, 0
+            tt_score, tt_move = self.tt.probe(tt_key, depth, alpha, beta)
+            if tt_score is not None:
+                return tt_score
+            if tt_symmetry:
+                tt_move = self.transform_move(game, tt_move, tt_symmetry, True)
+        if ordering:
+            self.order_moves(legal_moves, ply, tt_move)
+        else:
+            _tt_move_first(legal_moves, tt_move)
+        beta_orig = beta
+
         best_score = float("inf")
-        for move in game.get_legal_moves():
-            best_score = min(best_score, self.max_value(game.forecast_move(move), depth - 1, alpha, beta))
+        best_move = None
+        pvs = self.pvs
+        frontier = (depth == 1 and self.batch_score is not None
+                    and len(legal_moves) > MIN_BATCH)
+        scores = None
+        for i, move in enumerate(legal_moves):
+            if frontier and i:
+                # the first child alone often causes a cutoff; the others
+                # are scored together once it has not
+                if scores is None:
+                    scores = self.frontier_scores(game, legal_moves[1:])
+                score = scores[i - 1]
+            elif pvs and i:
+                score = self.null_window_min(game, move, depth, alpha, beta)
+            else:
+                score = self.child_value(game, move, self.max_value, depth - 1, alpha, beta)
+            if score < best_score:
+                best_score = score
+                best_move = move
+                if ordering and score < beta:
+                    self.update_pv(ply, move)
+            if ordering:
+                self._follow_pv = False
             if best_score <= alpha:
-                return best_score
+                if ordering:
+                    self.record_cutoff(ply, move, depth)
+                if self.stats is not None:
+                    self.stats.cutoff(self._root_depth - depth)
+                break
             beta = min(beta, best_score)
 
-        return best_score
\ No newline at end of file
+        if tt_key is not None:
+            if tt_symmetry:
+                best_move = self.transform_move(game, best_move, tt_symmetry)
+            self.tt.store(tt_key, depth, best_score, alpha, beta_orig, best_move)
+        return best_score
+
+
+# AlphaBetaPlayer searching root shares in a worker process of a parallel
+# AlphaBetaPlayer; kept between moves with its transposition table
+_root_worker = None
+
+
+def _init_root_worker(options):
+    """Pool initializer: create the worker process's searching player. """
+    global _root_worker
+    _root_worker = AlphaBetaPlayer(**options)
+
+
+def _search_root_share(game, moves, deadline):
+    """Search the root `moves` of `game` by iterative deepening until the
+    absolute `deadline` (a `timeit.default_timer()` value) and return the
+    (depth, best move, score) of every completed iteration.
+    """
+    player = _root_worker
+    for attr in ("_player_1", "_player_2", "_active_player", "_inactive_player"):
+        if getattr(game, attr) == ROOT_PLAYER:
+            setattr(game, attr, player)
+    player.root_moves = moves
+    player.time_left = TurnTimer(0., start=deadline)  # a turn ending at deadline
+    return player.deepen(game)
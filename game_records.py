@@ -0,0 +1,185 @@
+"""Compact binary game records for the isolation tournament and score model.
+
+Games are appended to a single file instead of one pickle per game.  The file
+starts with an 8 byte magic string followed by records, each made of a fixed
+size header and one byte per ply:
+
+    header (RECORD_HEADER, little-endian)
+        uint16  number of plies (every move, including the opening moves)
+        uint8   board width
+        uint8   board height
+        uint8   number of opening plies applied before Board.play()
+        uint8   winner (1 for player 1, 2 for player 2)
+        uint8   termination code (index into TERMINATIONS)
+        uint8   reserved (0)
+        uint64  seed the game was played with (0 if unknown)
+        16s     player 1 name (utf-8, NUL padded)
+        16s     player 2 name (utf-8, NUL padded)
+    moves
+        uint8 per ply: the cell index row + column * height of the move,
+        NO_MOVE for a (-1, -1) / None move
+
+Board states are not stored; replay_states() rebuilds them from the moves.
+"""
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+MAGIC = b"ISOREC1\n"
+RECORD_HEADER = struct.Struct("<HBBBBBBQ16s16s")
+NO_MOVE = 255
+
+# termination strings returned by Board.play(); "illegal move" is the normal
+# end of a game (the loser had no legal moves left)
+TERMINATIONS = ("illegal move", "forfeit", "timeout")
+
+GameRecord = namedtuple("GameRecord", ["width", "height", "opening", "winner",
+                                       "termination", "seed", "players",
+                                       "moves"])
+
+
+def encode_record(moves, winner, termination, width=7, height=7, opening=0,
+                  seed=0, players=("", "")):
+    """Return the bytes of one game record.
+
+    Parameters
+    ----------
+    moves : list<(int, int)>
+        Every move of the game in order, opening moves included.
+
+    winner : int
+        1 if player 1 won the game, 2 if player 2 won.
+
+    termination : str
+        The reason string returned by `Board.play()`.
+
+    opening : int
+        How many of `moves` were applied before `Board.play()` started.
+    """
+    if width * height >= NO_MOVE:
+        raise ValueError("boards with more than {} cells cannot be recorded"
+                         .format(NO_MOVE - 1))
+    cells = bytes(NO_MOVE if move is None or move[0] < 0
+                  else move[0] + move[1] * height for move in moves)
+    header = RECORD_HEADER.pack(len(cells), width, height, opening, winner,
+                                TERMINATIONS.index(termination), 0, seed,
+                                _encode_name(players[0]),
+                                _encode_name(players[1]))
+    return header + cells
+
+
+def _encode_name(name):
+    """Return the utf-8 bytes of a player name cut to at most 16 bytes
+    without splitting a character.
+    """
+    return name.encode()[:16].decode(errors="ignore").encode()
+
+
+class GameRecordWriter:
+    """Append game records to a file, writing them in batches.
+
+    Use as a context manager, or call close() to write the last batch.
+
+    Parameters
+    ----------
+    path : str
+        The record file; created (with its magic header) if missing.
+
+    batch_size : int
+        Number of records buffered before they are written out.
+    """
+
+    def __init__(self, path, batch_size=256):
+        self.path = path
+        self.batch_size = batch_size
+        self._batch = []
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, "wb") as f:
+                f.write(MAGIC)
+
+    def write(self, moves, winner, termination, **kwargs):
+        """Queue a game; see encode_record() for the arguments. """
+        self.write_encoded(encode_record(moves, winner, termination, **kwargs))
+
+    def write_encoded(self, record):
+        """Queue the bytes of a record made with encode_record(). """
+        self._batch.append(record)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._batch:
+            with open(self.path, "ab") as f:
+                f.write(b"".join(self._batch))
+            self._batch = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_raw_records(path, offset=None):
+    """Generate (header, cells) for every record in a record file, where
+    header is the unpacked RECORD_HEADER tuple and cells is a bytes object
+    holding one cell index per ply.  Reading starts at `offset` when given:
+    the end of a record read before, which is RECORD_HEADER.size + plies
+    bytes past its start; the first record starts at len(MAGIC).
+
+    The file is memory-mapped, so records are decoded one at a time without
+    reading the whole file into memory.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size <= len(MAGIC):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(MAGIC)] != MAGIC:
+                raise ValueError("{} is not a game record file".format(path))
+            if offset is None:
+                offset = len(MAGIC)
+            end = len(data)
+            while offset + RECORD_HEADER.size <= end:
+                header = RECORD_HEADER.unpack_from(data, offset)
+                offset += RECORD_HEADER.size
+                yield header, data[offset:offset + header[0]]
+                offset += header[0]
+
+
+def read_records(path):
+    """Generate the GameRecord tuples stored in a record file, in order. """
+    for header, cells in read_raw_records(path):
+        (_, width, height, opening, winner, termination, _, seed,
+         name_1, name_2) = header
+        moves = [None if idx == NO_MOVE else (idx % height, idx // height)
+                 for idx in cells]
+        yield GameRecord(width, height, opening, winner,
+                         TERMINATIONS[termination], seed,
+                         (name_1.rstrip(b"\0").decode(errors="replace"),
+                          name_2.rstrip(b"\0").decode(errors="replace")), moves)
+
+
+def replay_states(record):
+    """Return the list of board states (in the `Board._board_state` layout)
+    before each move played after the opening; equal to the state history
+    returned by `Board.play()` for the recorded game.
+    """
+    width, height = record.width, record.height
+    state = [0] * (width * height + 3)
+    state[-1] = None
+    state[-2] = None
+    states = []
+    for ply, move in enumerate(record.moves):
+        if move is None:
+            break
+        if ply >= record.opening:
+            states.append(list(state))
+        idx = move[0] + move[1] * height
+        state[-1 - (ply & 1)] = idx
+        state[idx] = 1
+        state[-3] ^= 1
+    return states
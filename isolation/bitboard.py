@@ -0,0 +1,331 @@
+"""
+This file contains the `BitBoard` class, an alternative core for the
+`isolation.Board` game model.  Blocked cells are stored in a single integer
+bitmask and each player location is stored as a flat cell index, so legal
+move generation reduces to masking a precomputed knight-move table with the
+complement of the blocked cells.
+
+`BitBoard` keeps the public `Board` API, so it can be passed anywhere a
+`Board` is expected (players, heuristics, `tournament.py`).
+"""
+import random
+
+from .isolation import Board, knight_tables, zobrist_keys
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def _popcount(mask):
+        return bin(mask).count("1")
+
+# Cache of knight-move bitmasks shared by every board with the same
+# dimensions; keyed by (width, height)
+_MASKS = {}
+
+# Cache of the move lists of knight masks, shared in the same way: maps
+# (width, height) to a dict of {mask of open target cells: tuple of moves}
+_MOVE_LISTS = {}
+
+
+def knight_masks(width, height):
+    """Return a tuple of bitmasks, indexed by flat cell index, where each mask
+    has the bits set for every cell a knight can reach from that cell; built
+    from the neighbor tables of `isolation.knight_tables()`.
+    """
+    key = (width, height)
+    if key not in _MASKS:
+        neighbors = knight_tables(width, height)[0]
+        _MASKS[key] = tuple(sum(1 << n for n in cell_neighbors)
+                            for cell_neighbors in neighbors)
+    return _MASKS[key]
+
+
+class BitBoard(Board):
+    """Implement a model for the game Isolation assuming each player moves like
+    a knight in chess, storing the board state as integer bitmasks.
+
+    Parameters
+    ----------
+    player_1 : object
+        An object with a get_move() function. This is the only function
+        directly called by the Board class for each player.
+
+    player_2 : object
+        An object with a get_move() function. This is the only function
+        directly called by the Board class for each player.
+
+    width : int (optional)
+        The number of columns that the board should have.
+
+    height : int (optional)
+        The number of rows that the board should have.
+    """
+
+    def __init__(self, player_1, player_2, width=7, height=7):
+        self.width = width
+        self.height = height
+        self.move_count = 0
+        self._player_1 = player_1
+        self._player_2 = player_2
+        self._active_player = player_1
+        self._inactive_player = player_2
+
+        self._masks = knight_masks(width, height)
+        self._move_lists = _MOVE_LISTS.setdefault((width, height), {})
+        self._neighbors, self._cells, self._cell_index = knight_tables(width, height)
+        self._full = (1 << (width * height)) - 1
+
+        # Bit i of _blocked is set when cell i is occupied or was visited;
+        # _locs holds the flat cell index of player 1 and player 2
+        self._blocked = 0
+        self._locs = [Board.NOT_MOVED, Board.NOT_MOVED]
+        self._move_stack = []
+
+        self._zobrist = zobrist_keys(width, height)
+        self._hash = 0
+
+    @property
+    def _board_state(self):
+        """The board state in the list layout used by `Board`; built on
+        demand for `Board.play()` history and `to_string()`.  Every read
+        returns a new list, so assigning to its items does not change the
+        board; assign a whole state instead.
+        """
+        state = [Board.BLANK] * (self.width * self.height + 3)
+        blocked = self._blocked
+        for idx in range(self.width * self.height):
+            if blocked >> idx & 1:
+                state[idx] = 1
+        state[-3] = self.move_count & 1
+        state[-2] = self._locs[1]
+        state[-1] = self._locs[0]
+        return state
+
+    @_board_state.setter
+    def _board_state(self, state):
+        self._blocked = sum(1 << idx for idx in range(self.width * self.height)
+                            if state[idx] != Board.BLANK)
+        self._locs = [state[-1], state[-2]]
+
+    @classmethod
+    def from_board(cls, board):
+        """Return a `BitBoard` holding the same game state as the input
+        `Board` instance.
+        """
+        new_board = cls(board._player_1, board._player_2,
+                        width=board.width, height=board.height)
+        new_board.move_count = board.move_count
+        new_board._active_player = board._active_player
+        new_board._inactive_player = board._inactive_player
+        new_board.shuffle_moves = board.shuffle_moves
+        new_board._board_state = board._board_state
+        new_board._hash = new_board.zobrist_hash()
+        return new_board
+
+    def copy(self):
+        """ Return a deep copy of the current board. """
+        # Skip __init__; every attribute is copied from this board and the
+        # move tables are shared
+        new_board = BitBoard.__new__(BitBoard)
+        new_board.__dict__.update(self.__dict__)
+        new_board._locs = list(self._locs)
+        new_board._move_stack = []
+        return new_board
+
+    def move_is_legal(self, move):
+        """Test whether a move is legal in the current game state.
+
+        Parameters
+        ----------
+        move : (int, int)
+            A coordinate pair (row, column) indicating the next position for
+            the active player on the board.
+
+        Returns
+        -------
+        bool
+            Returns True if the move is legal, False otherwise
+        """
+        return (0 <= move[0] < self.height and 0 <= move[1] < self.width and
+                not self._blocked >> (move[0] + move[1] * self.height) & 1)
+
+    def get_blank_spaces(self):
+        """Return a list of the locations that are still available on the board.
+        """
+        return self.__mask_to_moves(self._full & ~self._blocked)
+
+    def blank_count(self):
+        """Return the number of blank cells as the popcount of the open
+        cells; see `Board.blank_count()`.
+        """
+        return _popcount(self._full & ~self._blocked)
+
+    def reachable_cells(self, player):
+        """Return the bitmask of blank cells the player can reach with
+        knight moves, grown one knight move at a time from its location;
+        see `Board.reachable_cells()`.
+        """
+        idx = self._locs[self.__slot(player)]
+        open_cells = self._full & ~self._blocked
+        if idx == Board.NOT_MOVED:
+            return open_cells
+        masks = self._masks
+        reached = frontier = masks[idx] & open_cells
+        while frontier:
+            grown = 0
+            while frontier:
+                low = frontier & -frontier
+                grown |= masks[low.bit_length() - 1]
+                frontier ^= low
+            frontier = grown & open_cells & ~reached
+            reached |= frontier
+        return reached
+
+    def get_player_location(self, player):
+        """Find the current location of the specified player on the board.
+
+        Parameters
+        ----------
+        player : object
+            An object registered as a player in the current game.
+
+        Returns
+        -------
+        (int, int) or None
+            The coordinate pair (row, column) of the input player, or None
+            if the player has not moved.
+        """
+        idx = self._locs[self.__slot(player)]
+        if idx == Board.NOT_MOVED:
+            return Board.NOT_MOVED
+        return self._cells[idx]
+
+    def get_legal_moves(self, player=None):
+        """Return the list of all legal moves for the specified player.
+
+        Parameters
+        ----------
+        player : object (optional)
+            An object registered as a player in the current game. If None,
+            return the legal moves for the active player on the board.
+
+        Returns
+        -------
+        list<(int, int)>
+            The list of coordinate pairs (row, column) of all legal moves
+            for the player constrained by the current game state.
+        """
+        if player is None:
+            player = self._active_player
+        idx = self._locs[self.__slot(player)]
+        if idx == Board.NOT_MOVED:
+            return self.get_blank_spaces()
+        valid_moves = self.__mask_to_moves(self._masks[idx] & ~self._blocked)
+        if self.shuffle_moves:
+            random.shuffle(valid_moves)
+        return valid_moves
+
+    def count_legal_moves(self, player=None):
+        """Return the number of legal moves for the specified player as the
+        popcount of the player's knight mask AND the open cells; see
+        `Board.count_legal_moves()`.
+        """
+        if player is None:
+            player = self._active_player
+        idx = self._locs[self.__slot(player)]
+        if idx == Board.NOT_MOVED:
+            return _popcount(self._full & ~self._blocked)
+        return _popcount(self._masks[idx] & ~self._blocked)
+
+    def apply_move(self, move):
+        """Move the active player to a specified location.
+
+        Parameters
+        ----------
+        move : (int, int)
+            A coordinate pair (row, column) indicating the next position for
+            the active player on the board.
+        """
+        idx = move[0] + move[1] * self.height
+        slot = int(self._active_player == self._player_2)
+        cell_keys, location_keys, side_key = self._zobrist
+        last_move = self._locs[slot]
+        if last_move != Board.NOT_MOVED:
+            self._hash ^= location_keys[slot][last_move]
+        self._hash ^= cell_keys[idx] ^ location_keys[slot][idx] ^ side_key
+        self._locs[slot] = idx
+        self._blocked |= 1 << idx
+        self._active_player, self._inactive_player = self._inactive_player, self._active_player
+        self.move_count += 1
+
+    def push_move(self, move):
+        """Apply a move in-place, recording the information needed to take
+        it back with `pop_move()`; see `Board.push_move()`.
+        """
+        slot = int(self._active_player == self._player_2)
+        self._move_stack.append((move[0] + move[1] * self.height,
+                                 self._locs[slot], self._hash))
+        self.apply_move(move)
+
+    def pop_move(self):
+        """Take back the most recent move applied with `push_move()`. """
+        idx, last_move, self._hash = self._move_stack.pop()
+        self._active_player, self._inactive_player = self._inactive_player, self._active_player
+        self.move_count -= 1
+        self._locs[int(self._active_player == self._player_2)] = last_move
+        self._blocked &= ~(1 << idx)
+
+    def is_winner(self, player):
+        """ Test whether the specified player has won the game. """
+        return player == self._inactive_player and not self.__has_moves()
+
+    def is_loser(self, player):
+        """ Test whether the specified player has lost the game. """
+        return player == self._active_player and not self.__has_moves()
+
+    def utility(self, player):
+        """Returns the utility of the current game state from the perspective
+        of the specified player; see `Board.utility()`.
+        """
+        if not self.__has_moves():
+
+            if player == self._inactive_player:
+                return float("inf")
+
+            if player == self._active_player:
+                return float("-inf")
+
+        return 0.
+
+    def __has_moves(self):
+        """Test whether the active player has any legal move. """
+        idx = self._locs[int(self._active_player == self._player_2)]
+        if idx == Board.NOT_MOVED:
+            return self._blocked != self._full
+        return bool(self._masks[idx] & ~self._blocked)
+
+    def __slot(self, player):
+        """Return the index of the player in `_locs`. """
+        if player == self._player_1:
+            return 0
+        elif player == self._player_2:
+            return 1
+        raise RuntimeError(
+            "Invalid player in get_player_location: {}".format(player))
+
+    def __mask_to_moves(self, mask):
+        """Convert a bitmask of cells into a list of (row, column) pairs.
+        Masks are the open knight targets of a cell, a few thousand per
+        board size, so their move tuples are cached.
+        """
+        moves = self._move_lists.get(mask)
+        if moves is None:
+            cells = self._cells
+            moves = []
+            bits = mask
+            while bits:
+                low = bits & -bits
+                moves.append(cells[low.bit_length() - 1])
+                bits ^= low
+            moves = self._move_lists[mask] = tuple(moves)
+        return list(moves)
@@ -10,9 +10,139 @@ be available to project reviewers.
 import random
 import timeit
 from copy import copy
+from operator import itemgetter
 
 TIME_LIMIT_MILLIS = 150
 
+# Zobrist key tables shared by every board with the same dimensions; keyed
+# by (width, height)
+_ZOBRIST_KEYS = {}
+
+# Knight-move neighbor tables shared by every board with the same
+# dimensions; keyed by (width, height)
+_KNIGHT_TABLES = {}
+
+
+def knight_tables(width, height):
+    """Return the move tables for a board of the given size as a tuple
+    (neighbors, cells, cell_index).  neighbors[i] is the tuple of flat cell
+    indices a knight can reach from cell i, cells[i] is the (row, column)
+    pair of cell i and cell_index maps (row, column) pairs back to flat
+    indices.
+
+    Cells are indexed the same way as `Board._board_state`; i.e., the cell
+    at (row, column) has index `row + column * height`.  The tables are built
+    once per board size and shared by all boards of that size.
+    """
+    key = (width, height)
+    if key not in _KNIGHT_TABLES:
+        directions = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                      (1, -2), (1, 2), (2, -1), (2, 1)]
+        cells = tuple((idx % height, idx // height)
+                      for idx in range(width * height))
+        neighbors = tuple(
+            tuple(r + dr + (c + dc) * height for dr, dc in directions
+                  if 0 <= r + dr < height and 0 <= c + dc < width)
+            for r, c in cells)
+        cell_index = {cell: idx for idx, cell in enumerate(cells)}
+        _KNIGHT_TABLES[key] = (neighbors, cells, cell_index)
+    return _KNIGHT_TABLES[key]
+
+
+# Cell permutations of the board symmetries shared by every board with the
+# same dimensions; keyed by (width, height)
+_SYMMETRY_TABLES = {}
+
+
+def symmetry_tables(width, height, inverse=False):
+    """Return the board symmetries as a tuple of cell permutations, where
+    perm[i] is the flat index cell i maps to; the first permutation is the
+    identity.  Square boards have 8 symmetries (rotations and reflections),
+    other boards 4 (reflections of the rows and/or columns).  With
+    inverse=True, return the inverse of each permutation instead.
+
+    Knight moves are preserved by all of them, so a position and its
+    transformed copies are equivalent.
+    """
+    key = (width, height)
+    if key not in _SYMMETRY_TABLES:
+        perms = []
+        for swap in ((False, True) if width == height else (False,)):
+            for flip_rows in (False, True):
+                for flip_cols in (False, True):
+                    perm = []
+                    for idx in range(width * height):
+                        r, c = idx % height, idx // height
+                        if swap:
+                            r, c = c, r
+                        if flip_rows:
+                            r = height - 1 - r
+                        if flip_cols:
+                            c = width - 1 - c
+                        perm.append(r + c * height)
+                    perms.append(tuple(perm))
+        inverses = []
+        for perm in perms:
+            inv = [0] * len(perm)
+            for idx, target in enumerate(perm):
+                inv[target] = idx
+            inverses.append(tuple(inv))
+        # itemgetter(*inverse)(state) gathers the cells of the transformed
+        # board from a state list in one call
+        gathers = tuple(itemgetter(*inv) for inv in inverses)
+        _SYMMETRY_TABLES[key] = (tuple(perms), tuple(inverses),
+                                 tuple(zip(perms, gathers)))
+    return _SYMMETRY_TABLES[key][1 if inverse else 0]
+
+
+def _symmetry_gathers(width, height):
+    """Return (perm, gather) for each symmetry, where gather(state) returns
+    the cells of the transformed board from a `_board_state` list.
+    """
+    symmetry_tables(width, height)
+    return _SYMMETRY_TABLES[(width, height)][2]
+
+
+def zobrist_keys(width, height):
+    """Return the Zobrist keys for a board of the given size as a tuple
+    (cell_keys, location_keys, side_key).  cell_keys[i] marks cell i as
+    blocked, location_keys[p][i] marks player p (0 for player 1, 1 for
+    player 2) as standing on cell i, and side_key marks player 2 to move.
+
+    The keys come from a fixed seed so hashes are reproducible across runs
+    and processes.
+    """
+    key = (width, height)
+    if key not in _ZOBRIST_KEYS:
+        rng = random.Random(width * 1000003 + height)
+        cells = width * height
+        _ZOBRIST_KEYS[key] = (
+            tuple(rng.getrandbits(64) for _ in range(cells)),
+            (tuple(rng.getrandbits(64) for _ in range(cells)),
+             tuple(rng.getrandbits(64) for _ in range(cells))),
+            rng.getrandbits(64))
+    return _ZOBRIST_KEYS[key]
+
+
+class TurnTimer(object):
+    """The time_left callable of one turn: returns the number of milliseconds
+    left before `time_limit` milliseconds have passed since it was created.
+
+    The end of the turn is also available as `deadline`, an absolute
+    `timeit.default_timer()` time in seconds, so players can compare the
+    clock against it directly instead of calling the timer (see
+    `game_agent.IsolationPlayer.check_time()`).
+    """
+    __slots__ = ("deadline",)
+
+    def __init__(self, time_limit, start=None):
+        if start is None:
+            start = timeit.default_timer()
+        self.deadline = start + time_limit / 1000.
+
+    def __call__(self):
+        return 1000. * (self.deadline - timeit.default_timer())
+
 
 class Board(object):
     """Implement a model for the game Isolation assuming each player moves like
@@ -37,6 +167,14 @@ class Board(object):
     BLANK = 0
     NOT_MOVED = None
 
+    # Shuffle each legal move list; set to False on an instance for a
+    # deterministic move order (e.g., for search move ordering)
+    shuffle_moves = True
+
+    # Copies of the players' search statistics (None for players without
+    # them), indexed by seat; set by play()
+    search_stats = (None, None)
+
     def __init__(self, player_1, player_2, width=7, height=7):
         self.width = width
         self.height = height
@@ -52,8 +190,90 @@ class Board(object):
         self._board_state[-1] = Board.NOT_MOVED
         self._board_state[-2] = Board.NOT_MOVED
 
+        # Undo stack for push_move()/pop_move(); each entry holds the cell
+        # index that was occupied, the previous location of the mover and
+        # the previous Zobrist hash
+        self._move_stack = []
+
+        # Zobrist hash of the position, updated incrementally by apply_move()
+        self._zobrist = zobrist_keys(width, height)
+        self._hash = 0
+
+        # Move tables shared by all boards of this size
+        self._neighbors, self._cells, self._cell_index = knight_tables(width, height)
+
+        # Mobility counters updated incrementally by apply_move() and
+        # pop_move(): the number of blank cells and, for every cell, the
+        # number of blank cells a knight can reach from it
+        self._blank_count = width * height
+        self._degree = [len(cell_neighbors) for cell_neighbors in self._neighbors]
+
     def hash(self):
-        return str(self._board_state).__hash__()
+        """Return the Zobrist hash of the current state: a 64-bit integer
+        covering the blocked cells, both player locations and which player
+        has initiative.  It is updated incrementally by apply_move(), so
+        calling it costs a single attribute lookup.
+        """
+        return self._hash
+
+    def zobrist_hash(self):
+        """Compute the Zobrist hash of the current state from scratch; this
+        always equals hash() and is used to seed it when a board is built
+        from a raw state.
+        """
+        cell_keys, location_keys, side_key = self._zobrist
+        value = side_key if self.move_count & 1 else 0
+        for slot, player in enumerate((self._player_1, self._player_2)):
+            loc = self.get_player_location(player)
+            if loc != Board.NOT_MOVED:
+                value ^= location_keys[slot][loc[0] + loc[1] * self.height]
+        blank = set(r + c * self.height for r, c in self.get_blank_spaces())
+        for idx, cell_key in enumerate(cell_keys):
+            if idx not in blank:
+                value ^= cell_key
+        return value
+
+    def canonical_form(self):
+        """Return (state, symmetry) for the current position, where state is
+        the smallest of the states of the rotated and reflected boards (see
+        symmetry_tables()) as a tuple in the `_board_state` layout, and
+        symmetry is the index of the transform that produces it: cell i of
+        this board is cell symmetry_tables()[symmetry][i] of state.
+
+        Positions that are rotations or reflections of each other have the
+        same canonical state, so it can key opening books, transposition
+        tables and training data.
+        """
+        state = self._board_state
+        parity, p2_loc, p1_loc = state[-3:]
+        best = best_symmetry = None
+        for symmetry, (perm, gather) in enumerate(
+                _symmetry_gathers(self.width, self.height)):
+            transformed = gather(state) + (
+                parity,
+                p2_loc if p2_loc is None else perm[p2_loc],
+                p1_loc if p1_loc is None else perm[p1_loc])
+            if best is None or transformed < best:
+                best, best_symmetry = transformed, symmetry
+        return best, best_symmetry
+
+    def canonical_hash(self):
+        """Return (hash, symmetry): the Zobrist hash of the canonical state
+        returned by canonical_form() and the index of its transform.  The
+        hash equals hash() of the board transformed by that symmetry, so
+        it is the same for every rotation and reflection of a position.
+        """
+        state, symmetry = self.canonical_form()
+        cell_keys, location_keys, side_key = self._zobrist
+        value = side_key if self.move_count & 1 else 0
+        if state[-1] is not None:
+            value ^= location_keys[0][state[-1]]
+        if state[-2] is not None:
+            value ^= location_keys[1][state[-2]]
+        for cell_key, blocked in zip(cell_keys, state):
+            if blocked:
+                value ^= cell_key
+        return value, symmetry
 
     @property
     def active_player(self):
@@ -92,11 +312,13 @@ class Board(object):
 
     def copy(self):
         """ Return a deep copy of the current board. """
-        new_board = Board(self._player_1, self._player_2, width=self.width, height=self.height)
-        new_board.move_count = self.move_count
-        new_board._active_player = self._active_player
-        new_board._inactive_player = self._inactive_player
+        # Skip __init__; every attribute is copied from this board and the
+        # move tables are shared
+        new_board = Board.__new__(Board)
+        new_board.__dict__.update(self.__dict__)
         new_board._board_state = copy(self._board_state)
+        new_board._degree = copy(self._degree)
+        new_board._move_stack = []
         return new_board
 
     def forecast_move(self, move):
@@ -132,15 +354,54 @@ class Board(object):
         bool
             Returns True if the move is legal, False otherwise
         """
-        idx = move[0] + move[1] * self.height
-        return (0 <= move[0] < self.height and 0 <= move[1] < self.width and
-                self._board_state[idx] == Board.BLANK)
+        idx = self._cell_index.get(tuple(move))
+        return idx is not None and self._board_state[idx] == Board.BLANK
 
     def get_blank_spaces(self):
         """Return a list of the locations that are still available on the board.
         """
-        return [(i, j) for j in range(self.width) for i in range(self.height)
-                if self._board_state[i + j * self.height] == Board.BLANK]
+        cells = self._cells
+        return [cells[idx] for idx, value in enumerate(self._board_state[:-3])
+                if value == Board.BLANK]
+
+    def blank_count(self):
+        """Return the number of blank cells; equal to
+        len(get_blank_spaces()) but read from a counter kept by apply_move().
+        """
+        return self._blank_count
+
+    def reachable_cells(self, player):
+        """Return the cells a player could ever reach with knight moves over
+        blank cells (a flood fill from its location), as a bitmask with bit
+        `row + column * height` set for each cell.  A player that has not
+        moved can reach every blank cell.
+        """
+        idx = self.__location_index(player)
+        state = self._board_state
+        if idx == Board.NOT_MOVED:
+            return sum(1 << n for n, value in enumerate(state[:-3])
+                       if value == Board.BLANK)
+        neighbors = self._neighbors
+        reached = 0
+        frontier = [idx]
+        while frontier:
+            for n in neighbors[frontier.pop()]:
+                if state[n] == Board.BLANK and not reached >> n & 1:
+                    reached |= 1 << n
+                    frontier.append(n)
+        return reached
+
+    def is_partitioned(self):
+        """Test whether the players can no longer interact: both have moved
+        and no blank cell is reachable by both (see reachable_cells()).
+        From then on each player can only make the moves of the longest
+        knight path in its own region.
+        """
+        if (self.get_player_location(self._player_1) == Board.NOT_MOVED or
+                self.get_player_location(self._player_2) == Board.NOT_MOVED):
+            return False
+        return not (self.reachable_cells(self._player_1) &
+                    self.reachable_cells(self._player_2))
 
     def get_player_location(self, player):
         """Find the current location of the specified player on the board.
@@ -167,9 +428,7 @@ class Board(object):
         else:
             raise RuntimeError(
                 "Invalid player in get_player_location: {}".format(player))
-        w = idx // self.height
-        h = idx % self.height
-        return (h, w)
+        return self._cells[idx]
 
     def get_legal_moves(self, player=None):
         """Return the list of all legal moves for the specified player.
@@ -190,6 +449,29 @@ class Board(object):
             player = self.active_player
         return self.__get_moves(self.get_player_location(player))
 
+    def count_legal_moves(self, player=None):
+        """Return the number of legal moves for the specified player; equal
+        to len(get_legal_moves(player)) but read from the open-neighbor
+        counts apply_move() keeps for every cell.
+
+        Parameters
+        ----------
+        player : object (optional)
+            An object registered as a player in the current game. If None,
+            count the legal moves for the active player on the board.
+
+        Returns
+        -------
+        int
+            The number of legal moves available to the player.
+        """
+        if player is None:
+            player = self.active_player
+        idx = self.__location_index(player)
+        if idx == Board.NOT_MOVED:
+            return self._blank_count
+        return self._degree[idx]
+
     def apply_move(self, move):
         """Move the active player to a specified location.
 
@@ -201,19 +483,61 @@ class Board(object):
         """
         idx = move[0] + move[1] * self.height
         last_move_idx = int(self.active_player == self._player_2) + 1
+        cell_keys, location_keys, side_key = self._zobrist
+        location_keys = location_keys[last_move_idx - 1]
+        last_move = self._board_state[-last_move_idx]
+        if last_move != Board.NOT_MOVED:
+            self._hash ^= location_keys[last_move]
+        self._hash ^= cell_keys[idx] ^ location_keys[idx] ^ side_key
         self._board_state[-last_move_idx] = idx
         self._board_state[idx] = 1
         self._board_state[-3] ^= 1
+        self._blank_count -= 1
+        degree = self._degree
+        for n in self._neighbors[idx]:
+            degree[n] -= 1
         self._active_player, self._inactive_player = self._inactive_player, self._active_player
         self.move_count += 1
 
+    def push_move(self, move):
+        """Apply a move in-place like `apply_move()`, recording the
+        information needed to take it back with `pop_move()`.
+
+        Parameters
+        ----------
+        move : (int, int)
+            A coordinate pair (row, column) indicating the next position for
+            the active player on the board.
+        """
+        last_move_idx = int(self._active_player == self._player_2) + 1
+        self._move_stack.append((move[0] + move[1] * self.height,
+                                 self._board_state[-last_move_idx],
+                                 self._hash))
+        self.apply_move(move)
+
+    def pop_move(self):
+        """Take back the most recent move applied with `push_move()`,
+        restoring the board to the state before that move.
+        """
+        idx, last_move, self._hash = self._move_stack.pop()
+        self._active_player, self._inactive_player = self._inactive_player, self._active_player
+        self.move_count -= 1
+        last_move_idx = int(self._active_player == self._player_2) + 1
+        self._board_state[-last_move_idx] = last_move
+        self._board_state[idx] = Board.BLANK
+        self._board_state[-3] ^= 1
+        self._blank_count += 1
+        degree = self._degree
+        for n in self._neighbors[idx]:
+            degree[n] += 1
+
     def is_winner(self, player):
         """ Test whether the specified player has won the game. """
-        return player == self._inactive_player and not self.get_legal_moves(self._active_player)
+        return player == self._inactive_player and not self.__has_moves()
 
     def is_loser(self, player):
         """ Test whether the specified player has lost the game. """
-        return player == self._active_player and not self.get_legal_moves(self._active_player)
+        return player == self._active_player and not self.__has_moves()
 
     def utility(self, player):
         """Returns the utility of the current game state from the perspective
@@ -237,7 +561,7 @@ class Board(object):
             a value of -inf if the player has lost, and a value of 0
             otherwise.
         """
-        if not self.get_legal_moves(self._active_player):
+        if not self.__has_moves():
 
             if player == self._inactive_player:
                 return float("inf")
@@ -254,14 +578,31 @@ class Board(object):
         if loc == Board.NOT_MOVED:
             return self.get_blank_spaces()
 
-        r, c = loc
-        directions = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
-                      (1, -2), (1, 2), (2, -1), (2, 1)]
-        valid_moves = [(r + dr, c + dc) for dr, dc in directions
-                       if self.move_is_legal((r + dr, c + dc))]
-        random.shuffle(valid_moves)
+        state = self._board_state
+        cells = self._cells
+        valid_moves = [cells[n] for n in self._neighbors[loc[0] + loc[1] * self.height]
+                       if state[n] == Board.BLANK]
+        if self.shuffle_moves:
+            random.shuffle(valid_moves)
         return valid_moves
 
+    def __location_index(self, player):
+        """Return the flat cell index of a player, or NOT_MOVED. """
+        if player == self._player_1:
+            return self._board_state[-1]
+        elif player == self._player_2:
+            return self._board_state[-2]
+        raise RuntimeError(
+            "Invalid player in get_player_location: {}".format(player))
+
+    def __has_moves(self):
+        """Test whether the active player has any legal move. """
+        state = self._board_state
+        idx = state[-1] if self._active_player == self._player_1 else state[-2]
+        if idx == Board.NOT_MOVED:
+            return self._blank_count > 0
+        return self._degree[idx] > 0
+
     def print_board(self):
         """DEPRECATED - use Board.to_string()"""
         return self.to_string()
@@ -271,8 +612,10 @@ class Board(object):
         the location of each player and indicating which cells have been
         blocked, and which remain open.
         """
-        p1_loc = self._board_state[-1]
-        p2_loc = self._board_state[-2]
+        # read once: BitBoard builds the state on every access
+        state = self._board_state
+        p1_loc = state[-1]
+        p2_loc = state[-2]
 
         col_margin = len(str(self.height - 1)) + 1
         prefix = "{:<" + "{}".format(col_margin) + "}"
@@ -282,7 +625,7 @@ class Board(object):
             out += prefix.format(i) + ' | '
             for j in range(self.width):
                 idx = i + j * self.height
-                if not self._board_state[idx]:
+                if not state[idx]:
                     out += ' '
                 elif p1_loc == idx:
                     out += symbols[0]
@@ -315,30 +658,44 @@ class Board(object):
         move_history = []
         state_history = []
 
-        time_millis = lambda: 1000 * timeit.default_timer()
-
-        while True:
-
-            legal_player_moves = self.get_legal_moves()
-            game_copy = self.copy()
-
-            move_start = time_millis()
-            time_left = lambda : time_limit - (time_millis() - move_start)
-            curr_move = self._active_player.get_move(game_copy, time_left)
-            move_end = time_left()
-
-            if curr_move is None:
-                curr_move = Board.NOT_MOVED
-
-            if move_end < 0:
-                return self._inactive_player, move_history, "timeout",state_history
-
-            if curr_move not in legal_player_moves:
-                if len(legal_player_moves) > 0:
-                    return self._inactive_player, move_history, "forfeit",state_history
-                return self._inactive_player, move_history, "illegal move",state_history
-
-            move_history.append(list(curr_move))
-            state_history.append(list(self._board_state))
-
-            self.apply_move(curr_move)
+        # search statistics of players that collect them (players created
+        # with stats=True, see game_agent.SearchStats); reset here and
+        # copied into self.search_stats when the game ends
+        stats = [getattr(player, "stats", None)
+                 for player in (self._player_1, self._player_2)]
+        for player_stats in stats:
+            if player_stats is not None:
+                player_stats.reset()
+
+        try:
+            while True:
+
+                legal_player_moves = self.get_legal_moves()
+                game_copy = self.copy()
+
+                time_left = TurnTimer(time_limit)
+                curr_move = self._active_player.get_move(game_copy, time_left)
+                move_end = time_left()
+                player_stats = getattr(self._active_player, "stats", None)
+                if player_stats is not None:
+                    player_stats.margins.append(move_end)
+
+                if curr_move is None:
+                    curr_move = Board.NOT_MOVED
+
+                if move_end < 0:
+                    return self._inactive_player, move_history, "timeout",state_history
+
+                if curr_move not in legal_player_moves:
+                    if len(legal_player_moves) > 0:
+                        return self._inactive_player, move_history, "forfeit",state_history
+                    return self._inactive_player, move_history, "illegal move",state_history
+
+                move_history.append(list(curr_move))
+                state_history.append(list(self._board_state))
+
+                self.apply_move(curr_move)
+        finally:
+            self.search_stats = tuple(None if player_stats is None
+                                      else player_stats.copy()
+                                      for player_stats in stats)
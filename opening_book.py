@@ -0,0 +1,223 @@
+"""Opening book for the isolation agents: best replies for every position of
+the first few plies, computed offline by deep search and looked up in O(1).
+
+Positions that are rotations or reflections of each other (see
+`isolation.symmetry_tables()`) share a single entry: each position is keyed
+by its canonical form (`Board.canonical_form()`), and the stored reply is
+mapped back through the inverse transform on lookup.  On a 7x7 board this stores about
+one eighth of the positions.
+
+A position key is the bytes (player 1 cell, player 2 cell, sorted vacated
+cells), with NO_MOVE for a player that has not been placed; since every
+move blocks one cell, the key determines the player to move.
+
+The book file starts with an 8 byte magic string and a header, followed by
+one record per position:
+
+    header (BOOK_HEADER, little-endian)
+        uint8   board width
+        uint8   board height
+        uint8   max plies (positions with fewer moves played are stored)
+        uint8   reserved (0)
+        uint32  number of records
+    record
+        uint8   key length
+        bytes   canonical key
+        uint8   reply cell index (row + column * height, canonical frame)
+
+Build a book with:
+
+    python opening_book.py --plies 4 --time 2000 --processes 4
+"""
+import argparse
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+from game_agent import AlphaBetaPlayer, custom_score
+from game_records import NO_MOVE
+from isolation import BitBoard, TurnTimer, knight_tables, symmetry_tables
+
+MAGIC = b"ISOBOOK1"
+BOOK_HEADER = struct.Struct("<BBBBI")
+
+OPENING_BOOK = "./opening_book.bin"
+MAX_PLIES = 4  # book positions have fewer moves played than this
+SEARCH_TIME = 2000  # milliseconds of iterative deepening per book position
+TT_SIZE = 2**18
+
+
+def canonical_key(game):
+    """Return (key, symmetry) for the position of `game`: the book key of
+    its canonical form and the index of the transform that produces it (see
+    `Board.canonical_form()`).
+    """
+    state, symmetry = game.canonical_form()
+    player_2, player_1 = state[-2:]
+    vacated = [idx for idx in range(game.width * game.height)
+               if state[idx] and idx != player_1 and idx != player_2]
+    locations = [NO_MOVE if loc is None else loc for loc in (player_1, player_2)]
+    return bytes(locations + vacated), symmetry
+
+
+class OpeningBook:
+    """Best replies for the opening positions of one board size.
+
+    Parameters
+    ----------
+    width, height : int
+        Board size the book was built for.
+
+    max_plies : int
+        Positions with fewer moves played than this are in the book.
+
+    table : dict (optional)
+        Maps canonical keys to reply cell indices in the canonical frame.
+    """
+    def __init__(self, width=7, height=7, max_plies=MAX_PLIES, table=None):
+        self.width = width
+        self.height = height
+        self.max_plies = max_plies
+        self.table = {} if table is None else table
+        self._cells = knight_tables(width, height)[1]
+        self._inverse = symmetry_tables(width, height, inverse=True)
+
+    def __len__(self):
+        return len(self.table)
+
+    def lookup(self, game):
+        """Return the book reply (row, column) for the player to move in
+        `game`, or None if the position is not in the book.
+        """
+        if (game.move_count >= self.max_plies or game.width != self.width
+                or game.height != self.height):
+            return None
+        key, symmetry = canonical_key(game)
+        cell = self.table.get(key)
+        if cell is None:
+            return None
+        return self._cells[self._inverse[symmetry][cell]]
+
+    def add(self, game, move):
+        """Store `move` as the reply to the position of `game`. """
+        key, symmetry = canonical_key(game)
+        cell = move[0] + move[1] * self.height
+        self.table[key] = symmetry_tables(self.width, self.height)[symmetry][cell]
+
+    def save(self, path=OPENING_BOOK):
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(BOOK_HEADER.pack(self.width, self.height, self.max_plies, 0,
+                                     len(self.table)))
+            for key, cell in sorted(self.table.items()):
+                f.write(bytes([len(key)]) + key + bytes([cell]))
+
+    @classmethod
+    def load(cls, path=OPENING_BOOK):
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("{} is not an opening book".format(path))
+        offset = len(MAGIC)
+        width, height, max_plies, _, count = BOOK_HEADER.unpack_from(data, offset)
+        offset += BOOK_HEADER.size
+        table = {}
+        for _ in range(count):
+            size = data[offset]
+            key = data[offset + 1:offset + 1 + size]
+            table[key] = data[offset + 1 + size]
+            offset += size + 2
+        return cls(width, height, max_plies, table)
+
+
+def book_positions(width=7, height=7, max_plies=MAX_PLIES):
+    """Return one move sequence for every position, up to symmetry, with
+    fewer than `max_plies` moves played and a legal move for the player to
+    move, in order of the number of moves played.
+    """
+    seen = set()
+    positions = []
+    frontier = [[]]
+    for _ in range(max_plies):
+        children = []
+        for moves in frontier:
+            game = replay(moves, width, height)
+            legal_moves = sorted(game.get_legal_moves())
+            if not legal_moves:
+                continue
+            key = canonical_key(game)[0]
+            if key in seen:
+                continue
+            seen.add(key)
+            positions.append(moves)
+            children.extend(moves + [move] for move in legal_moves)
+        frontier = children
+    return positions
+
+
+def replay(moves, width=7, height=7, player_1="Player1", player_2="Player2"):
+    """Return a board with `moves` applied. """
+    game = BitBoard(player_1, player_2, width, height)
+    for move in moves:
+        game.apply_move(move)
+    return game
+
+
+def search_position(moves, width=7, height=7, time_limit=SEARCH_TIME,
+                    score_fn=custom_score, max_plies=MAX_PLIES):
+    """Return the reply found by `time_limit` milliseconds of iterative
+    deepening alpha-beta search from the position after `moves`.  Book
+    positions (fewer than `max_plies` moves) share transposition table
+    entries with their symmetries when `score_fn` is symmetric.
+    """
+    symmetry_plies = max_plies if getattr(score_fn, "symmetric", False) else 0
+    player = AlphaBetaPlayer(score_fn=score_fn, inplace=True, tt_size=TT_SIZE,
+                             ordering=True, tt_symmetry_plies=symmetry_plies)
+    game = replay(moves, width, height, *(
+        (player, "Opponent") if len(moves) % 2 == 0 else ("Opponent", player)))
+    return player.get_move(game, TurnTimer(time_limit))
+
+
+def build_book(width=7, height=7, max_plies=MAX_PLIES, time_limit=SEARCH_TIME,
+               score_fn=custom_score, processes=1):
+    """Search every book position and return the resulting OpeningBook.
+
+    Positions are searched in `processes` worker processes; `score_fn` must
+    be picklable (a module level function) when processes > 1.
+    """
+    positions = book_positions(width, height, max_plies)
+    args = [(moves, width, height, time_limit, score_fn, max_plies) for moves in positions]
+    if processes > 1:
+        with ProcessPoolExecutor(processes) as executor:
+            replies = list(executor.map(_search_args, args, chunksize=4))
+    else:
+        replies = [search_position(*a) for a in args]
+    book = OpeningBook(width, height, max_plies)
+    for moves, move in zip(positions, replies):
+        book.add(replay(moves, width, height), move)
+    return book
+
+
+def _search_args(args):
+    return search_position(*args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--width", type=int, default=7)
+    parser.add_argument("--height", type=int, default=7)
+    parser.add_argument("--plies", type=int, default=MAX_PLIES,
+                        help="store positions with fewer moves played")
+    parser.add_argument("--time", type=int, default=SEARCH_TIME,
+                        help="milliseconds of search per position")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("-o", "--output", default=OPENING_BOOK)
+    args = parser.parse_args(argv)
+
+    book = build_book(args.width, args.height, args.plies, args.time,
+                      processes=args.processes)
+    book.save(args.output)
+    print("{} positions written to {}".format(len(book), args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -133,6 +133,12 @@ def center_score(game, player):
     return float((h - y)**2 + (w - x)**2)
 
 
+# heuristics that score the rotations and reflections of a position alike,
+# so searches may share their transposition table entries (see
+# `game_agent.AlphaBetaPlayer`, tt_symmetry_plies)
+null_score.symmetric = open_move_score.symmetric = improved_score.symmetric = True
+
+
 class RandomPlayer():
     """Player that chooses a move randomly."""
 
@@ -309,6 +315,11 @@ def load_game(game_file):
     return "success",state
 
 
+import batch_scores
+batch_scores.register(open_move_score, batch_scores.open_move_score_batch)
+batch_scores.register(improved_score, batch_scores.improved_score_batch)
+batch_scores.register(center_score, batch_scores.center_score_batch)
+
 from game_agent import (MinimaxPlayer, AlphaBetaPlayer, custom_score,
                         custom_score_2, custom_score_3)
 
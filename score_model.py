@@ -1,191 +1,566 @@
-# -*- coding: utf-8 -*-
-""" 
-We will use this script to process the played games and generate a model to 
-predict likelynesss to win
-"""
-import os,sys,time,random,math
-
-import numpy as np # linear algebra
-import pandas as pd # data processing, CSV file I/O (e.g. pd.read_csv)
-
-from sklearn.ensemble import ExtraTreesRegressor,ExtraTreesClassifier
-from sklearn.metrics import make_scorer, mean_absolute_error
-from sklearn.grid_search import GridSearchCV
-
-from sklearn.cross_validation import train_test_split
-from sklearn.externals import joblib
-
-datadir="./game_state_data/"  #where the game data was saved
-
-def to_string(state, symbols=['1', '2']): #stolen from isolation.py
-    """Generate a string representation of the current game state, marking
-    the location of each player and indicating which cells have been
-    blocked, and which remain open.
-    """
-    p1_loc = state[-1]
-    p2_loc = state[-2]
-    
-    col_margin = len(str(7 - 1)) + 1
-    prefix = "{:<" + "{}".format(col_margin) + "}"
-    offset = " " * (col_margin + 3)
-    out = offset + '   '.join(map(str, range(7))) + '\n\r'
-    for i in range(7):
-        out += prefix.format(i) + ' | '
-        for j in range(7):
-            idx = i + j * 7
-            if not state[idx]:
-                out += ' '
-            elif p1_loc == idx:
-                out += symbols[0]
-            elif p2_loc == idx:
-                out += symbols[1]
-            else:
-                out += '-'
-            out += ' | '
-        out += '\n\r'
-    
-    return out
-
-def load_game(game_file):
-    """ 
-    Load the state of the game and the winner 
-    load the game from a file for later analysis
-    each row in the file is the game state.
-    row has format [gamestate],player_num_of_winner
-    """
-    import pickle
-    try:
-        with open(game_file, 'rb') as f:
-            state=pickle.load(f)
-    except:
-        return False,([0],0)
-    return True,state
-
-def load_games_from_dir(datadir):
-    """ 
-    Attempt to load games from the given datadir, and return them as a 
-    single data struct
-    """
-    #create a list of files 
-    try:  
-        files =  [x for x in os.listdir(datadir) if x.endswith('.pckl')] #create a list of subdirectories in the current dir
-    except:
-        sys.stderr.write("expected error->problem removing directories that aren't in list: ignore")
-    
-    #loading game data from files, and create single list
-    games_data=[]
-    print("Sample files seen",files[:4])
-    for game_file in files[:1000]:
-        load_result,game_data=load_game(datadir+game_file)
-        if load_result:
-            for turn in game_data[0]:
-                #(turn[:-1]+1)*-1
-                turn.append(game_data[1])
-                games_data.append(turn)
-        else:
-            print("failed to load:",game_file)
-    # return a dataframe of all the games states and who won
-    labels=["cell_"+str(c) for c in range(50)]
-    labels.append('player2')
-    labels.append('player1')
-    labels.append('winner')
-    return pd.DataFrame.from_records(games_data,columns=labels)
-
-
-def grid_search_wrapper(x,y,regr,param,regr_name='BLANK',cachedir="./"):
-    start_time = time.time()
-    print("In:{}".format(regr))
-    filename= 'grid_{}.joblib'.format(regr_name)
-    if os.path.isfile(cachedir+filename):
-        print(filename," exists, importing ")
-        return joblib.load(cachedir+filename) 
-    else:
-        print("{} not present, running a gridsearch".format(filename))
-        #search the param_grid for best params based on the f1 score
-        grid_search = GridSearchCV(regr,
-                                   param_grid= param,
-                                   n_jobs=-1,
-                                   scoring=make_scorer(mean_absolute_error,greater_is_better=False)) 
-        print("begin gridsearch training")
-        grid_search.fit(x,y)
-        print("end gridsearch training")
-        #reach into the grid search and pull out the best parameters, and set those on the clf
-        params={}
-        for p in grid_search.best_params_:
-            params[p]=grid_search.best_params_[p]
-        regr.set_params(**params)
-        print("run time:{}s".format(round((time.time()-start_time), 3) ))   
-        joblib.dump(regr,cachedir+filename) 
-    return regr
-        
-        
-if __name__ == "__main__":
-    game_states_labeled=load_games_from_dir(datadir)
-    print(game_states_labeled.info())
-    
-    x=game_states_labeled.drop('winner',1).values
-    y=game_states_labeled['winner'].values
-    
-    #  train/validation split
-    X_train, X_validation, y_train, y_validation = train_test_split( x,
-                                                                    y,
-                                                                   test_size=0.20,
-                                                                    random_state=42)
-    print("sample train data size:{}".format(len(y_train)))
-    
-
-    #estimator=LinearRegression(n_jobs=-1)
-    #poor prediction performance
-   
-    #estimator=KNeighborsRegressor(n_jobs = -1)
-    #Knn was slow and didn't predict acuratly enough to bother with 
-   
-    #estimator=RandomForestRegressor(n_jobs =-1, random_state=42)
-    #essentially the same as extra trees with slightly worse performance
-    
-    #estimator=svr()
-    #absolutly horrible train/predict time, and no better performance than Linear
-    
-
-    print("\nstart ExtraTrees:")   
-    estimator=ExtraTreesRegressor(n_jobs =-1)
-    estimator=ExtraTreesClassifier(n_jobs =-1)
-    
-    print("default params of estimator",estimator)
-    #use grid search to spot the best params
-    #param=dict(n_estimators=[3,5,7,10,25,50,200,500], max_features=['auto','sqrt','log2'])
-    param=dict(n_estimators=[3,10,50], max_features=['auto'])
-    estimator=grid_search_wrapper(X_train,y_train,estimator,param,regr_name='ExtraTrees')
-    print("post grid search params of est",estimator)
-    #train the estimator
-    start_time = time.time()
-    estimator.fit(X_train,y_train)
-    fit_time=time.time()-start_time
-    print("fit time:{}s".format(round(fit_time, 3) ))
-    #test on the validation set
-    start_time = time.time()
-    curr_predict=np.array(estimator.predict(X_validation)).copy()
-    predict_time=time.time()-start_time
-    print("predict time:{}s".format(round(predict_time, 3) ))    
-    #track the run info
-    MAE=np.mean(abs(curr_predict - y_validation))
-    print("Mean abs error: {:.2f}".format(MAE))
-    #retrain estimator with all data for final model
-    estimator.fit(x,y)
-    joblib.dump(estimator,"./trained_score_model.joblib")
-    
-    print(estimator.classes_)
-    print(estimator.feature_importances_)
-
-  
-    #print(2-curr_predict[:5])
-    #print(curr_predict[:5])
-    #for cp in curr_predict:
-        #if cp <=1 or cp>=2:
-            #print(cp)
-    #for i in range(10):
-        #print(curr_predict[i], y_validation[i])
-    #for x in X_validation[:10]:
-        #print(to_string(list(x)))
-        
+# -*- coding: utf-8 -*-
+""" 
+We will use this script to process the played games and generate a model to 
+predict likelynesss to win
+"""
+import os,sys,time,random,math
+
+import numpy as np # linear algebra
+
+from sklearn.ensemble import ExtraTreesRegressor,ExtraTreesClassifier
+from sklearn.metrics import make_scorer, mean_absolute_error
+
+try:
+    import joblib
+except ImportError:  # scikit-learn < 0.21 vendors joblib
+    from sklearn.externals import joblib
+
+from game_records import MAGIC as RECORDS_MAGIC
+from game_records import NO_MOVE, RECORD_HEADER, read_raw_records, read_records, replay_states
+from selfplay import MAGIC as POSITIONS_MAGIC
+from selfplay import chunk_size, read_chunks
+from batch_scores import canonical_rows
+from compiled_model import LEAF, CompiledForest
+from isolation import knight_tables
+
+datadir="./game_state_data/"  #where the game data was saved
+
+# streaming training (train_streaming) on every *.rec and *.pos file in
+# datadir instead of loading all the positions into memory
+STREAM_TRAINING = False
+CHUNK_ROWS = 2**17  # positions per training chunk
+SHUFFLE_ROWS = 2**20  # positions shuffled together
+TREES_PER_CHUNK = 4
+MAX_TREES = 200
+CHECKPOINT_EVERY = 10  # chunks between checkpoints
+CHECKPOINT = "./score_model_checkpoint.joblib"
+
+def to_string(state, symbols=['1', '2']): #stolen from isolation.py
+    """Generate a string representation of the current game state, marking
+    the location of each player and indicating which cells have been
+    blocked, and which remain open.
+    """
+    p1_loc = state[-1]
+    p2_loc = state[-2]
+    
+    col_margin = len(str(7 - 1)) + 1
+    prefix = "{:<" + "{}".format(col_margin) + "}"
+    offset = " " * (col_margin + 3)
+    out = offset + '   '.join(map(str, range(7))) + '\n\r'
+    for i in range(7):
+        out += prefix.format(i) + ' | '
+        for j in range(7):
+            idx = i + j * 7
+            if not state[idx]:
+                out += ' '
+            elif p1_loc == idx:
+                out += symbols[0]
+            elif p2_loc == idx:
+                out += symbols[1]
+            else:
+                out += '-'
+            out += ' | '
+        out += '\n\r'
+    
+    return out
+
+def load_game(game_file):
+    """ 
+    Load the state of the game and the winner 
+    load the game from a file for later analysis
+    each row in the file is the game state.
+    row has format [gamestate],player_num_of_winner
+    """
+    import pickle
+    try:
+        with open(game_file, 'rb') as f:
+            state=pickle.load(f)
+    except:
+        return False,([0],0)
+    return True,state
+
+def load_games_from_dir(datadir):
+    """ 
+    Attempt to load games from the given datadir, and return them as a 
+    single data struct. Game record files (*.rec, see game_records.py) are
+    streamed in full; legacy per-game pickles (*.pckl) are still read, up to
+    the first 1000.
+    """
+    import pandas as pd # data processing, CSV file I/O (e.g. pd.read_csv)
+    #create a list of files 
+    try:  
+        files =  [x for x in os.listdir(datadir) if x.endswith('.pckl')] #create a list of subdirectories in the current dir
+        record_files = [x for x in os.listdir(datadir) if x.endswith('.rec')]
+    except:
+        sys.stderr.write("expected error->problem removing directories that aren't in list: ignore")
+    
+    #loading game data from files, and create single list
+    games_data=[]
+    for record_file in record_files:
+        for record in read_records(datadir+record_file):
+            for turn in replay_states(record):
+                turn.append(record.winner)
+                games_data.append(turn)
+    if files:
+        print("Sample files seen",files[:4])
+    for game_file in files[:1000]:
+        load_result,game_data=load_game(datadir+game_file)
+        if load_result:
+            for turn in game_data[0]:
+                #(turn[:-1]+1)*-1
+                turn.append(game_data[1])
+                games_data.append(turn)
+        else:
+            print("failed to load:",game_file)
+    # return a dataframe of all the games states and who won
+    labels=["cell_"+str(c) for c in range(50)]
+    labels.append('player2')
+    labels.append('player1')
+    labels.append('winner')
+    return pd.DataFrame.from_records(games_data,columns=labels)
+
+
+def load_records_matrix(paths):
+    """
+    Load every position in the given game record files into one preallocated
+    uint8 matrix; one row per position with the same columns as
+    load_games_from_dir(): the cells (1 = blocked), initiative, player 2 and
+    player 1 location (NO_MOVE if not placed yet) and the winner (1 or 2).
+
+    The files are read twice: once to count the positions and once to fill
+    the rows, each game's rows being built with a few whole-array numpy
+    operations.
+    """
+    rows = 0
+    size = None
+    for path in paths:
+        for header, _ in read_raw_records(path):
+            plies, width, height, opening = header[:4]
+            if size is None:
+                size = (width, height)
+            elif size != (width, height):
+                raise ValueError("all games must use the same board size")
+            rows += max(plies - opening, 0)
+    if size is None:
+        return np.zeros((0, 7 * 7 + 4), dtype=np.uint8)
+
+    cells = size[0] * size[1]
+    matrix = np.zeros((rows, cells + 4), dtype=np.uint8)
+    row = 0
+    for path in paths:
+        for header, moves in read_raw_records(path):
+            plies, _, _, opening, winner = header[:5]
+            n = plies - opening
+            if n <= 0:
+                continue
+            fill_record_rows(matrix[row:row + n], moves, opening, winner, cells)
+            row += n
+    return matrix
+
+
+def fill_record_rows(block, moves, opening, winner, cells):
+    """
+    Fill the zeroed rows of `block` with the positions of one recorded game
+    (the cell index bytes `moves`, of which the first `opening` were played
+    before the first position), in the load_records_matrix() layout.
+    """
+    plies = len(moves)
+    idx = np.frombuffer(moves, dtype=np.uint8).astype(np.intp)
+    # position r is the state before ply k = opening + r, where every
+    # cell moved to on an earlier ply is blocked
+    ply = np.arange(opening, plies)
+    block[:, idx] = np.arange(plies)[None, :] < ply[:, None]
+    block[:, cells] = ply & 1
+    # last ply < k played by player 2 (odd plies) and player 1 (even)
+    last_p2 = ply - 1 - (ply & 1)
+    last_p1 = ply - 2 + (ply & 1)
+    block[:, cells + 1] = np.where(last_p2 >= 0, idx[np.maximum(last_p2, 0)], NO_MOVE)
+    block[:, cells + 2] = np.where(last_p1 >= 0, idx[np.maximum(last_p1, 0)], NO_MOVE)
+    block[:, cells + 3] = winner
+
+
+def position_blocks(paths, width=7, height=7, state=None):
+    """
+    Generate uint8 matrices in the load_records_matrix() layout holding the
+    positions of the given files, one game record (*.rec, see
+    game_records.py) or self-play chunk (*.pos, see selfplay.py) at a time.
+    Games of other board sizes are skipped.
+
+    If given, the dict `state` holds the "file" index and byte "offset"
+    reached after each matrix; generation starts from there, so a later call
+    with the same paths continues where an earlier one stopped.
+    """
+    if state is None:
+        state = {}
+    cells = width * height
+    for index in range(state.get("file", 0), len(paths)):
+        path = paths[index]
+        offset = state.get("offset") if index == state.get("file") else None
+        state["file"], state["offset"] = index, offset
+        if path.endswith(".pos"):
+            offset = len(POSITIONS_MAGIC) if offset is None else offset
+            for chunk in read_chunks(path, offset):
+                offset += chunk_size(chunk)
+                state["offset"] = offset
+                if (chunk.width, chunk.height) != (width, height):
+                    continue
+                block = np.empty((len(chunk.winners), cells + 4), dtype=np.uint8)
+                block[:, :-1] = np.frombuffer(chunk.states, dtype=np.uint8).reshape(-1, cells + 3)
+                block[:, -1] = np.frombuffer(chunk.winners, dtype=np.uint8)
+                yield block
+            continue
+        offset = len(RECORDS_MAGIC) if offset is None else offset
+        for header, moves in read_raw_records(path, offset):
+            offset += RECORD_HEADER.size + len(moves)
+            state["offset"] = offset
+            plies, game_width, game_height, opening, winner = header[:5]
+            if plies <= opening or (game_width, game_height) != (width, height):
+                continue
+            block = np.zeros((plies - opening, cells + 4), dtype=np.uint8)
+            fill_record_rows(block, moves, opening, winner, cells)
+            yield block
+    state["file"], state["offset"] = len(paths), None
+
+
+def _take_chunks(state, chunk_rows):
+    # the shuffled rows not generated yet leave the state a chunk at a time
+    while len(state["ready"]):
+        chunk = state["ready"][:chunk_rows]
+        state["ready"] = state["ready"][chunk_rows:]
+        yield chunk
+
+
+def shuffled_chunks(paths, chunk_rows=CHUNK_ROWS, buffer_rows=SHUFFLE_ROWS, seed=0,
+                    width=7, height=7, state=None):
+    """
+    Generate shuffled matrices of chunk_rows positions (the last one may be
+    shorter) from the given files, read in a random order with
+    position_blocks().  Positions are shuffled within a buffer of about
+    buffer_rows positions, which bounds the memory used; the sequence of
+    chunks depends only on the files and the seed.
+
+    If given, the dict `state` holds everything needed to go on after each
+    chunk: the file order and position_blocks() cursor, the random state and
+    the positions read but not generated yet.  Passing a saved state (and
+    the same arguments) generates the rest of the sequence without reading
+    the files before the cursor again.
+    """
+    if state is None:
+        state = {}
+    rng = np.random.RandomState(seed)
+    if "paths" in state:
+        rng.set_state(state["rng"])
+    else:
+        paths = list(paths)
+        rng.shuffle(paths)
+        state.update(paths=paths, rng=rng.get_state(), buffer=[],
+                     ready=np.zeros((0, width * height + 4), dtype=np.uint8))
+    buffer = state["buffer"]
+    buffered = sum(len(block) for block in buffer)
+    for chunk in _take_chunks(state, chunk_rows):
+        yield chunk
+    for block in position_blocks(state["paths"], width, height, state):
+        buffer.append(block)
+        buffered += len(block)
+        if buffered >= buffer_rows:
+            rows = np.concatenate(buffer)
+            rng.shuffle(rows)
+            full = len(rows) - len(rows) % chunk_rows
+            # the rest is shuffled again with the next positions
+            buffer[:] = [rows[full:]]
+            buffered = len(rows) - full
+            state.update(rng=rng.get_state(), ready=rows[:full])
+            for chunk in _take_chunks(state, chunk_rows):
+                yield chunk
+    if buffered:
+        rows = np.concatenate(buffer)
+        rng.shuffle(rows)
+        buffer[:] = []
+        state.update(rng=rng.get_state(), ready=rows)
+        for chunk in _take_chunks(state, chunk_rows):
+            yield chunk
+
+
+def train_streaming(paths, checkpoint=CHECKPOINT, chunk_rows=CHUNK_ROWS,
+                    buffer_rows=SHUFFLE_ROWS, trees_per_chunk=TREES_PER_CHUNK,
+                    max_trees=MAX_TREES, checkpoint_every=CHECKPOINT_EVERY, seed=0,
+                    width=7, height=7):
+    """
+    Train an ExtraTreesClassifier on every position of the given files
+    without loading them at once: the first chunk of shuffled_chunks() is
+    held out for validation, and each later chunk, deduplicated up to
+    symmetry, grows trees_per_chunk more trees with warm_start.  Once the
+    forest has more than max_trees trees the oldest are dropped, so the
+    model size is bounded too and later chunks still count.
+
+    Every tree must see both winners, or the trees would disagree on the
+    classes: a chunk holding one winner only is merged into the next one,
+    and dropped if it is the last.
+
+    Every checkpoint_every chunks the estimator, the validation chunk and
+    the shuffled_chunks() state are saved to `checkpoint`; a later call with
+    the same files and seed resumes from it, reading only the positions not
+    trained on yet.  Returns the estimator.
+    """
+    stream = {}
+    done = 0
+    estimator = ExtraTreesClassifier(n_estimators=0, warm_start=True, n_jobs=-1,
+                                     random_state=seed)
+    if os.path.isfile(checkpoint):
+        saved = joblib.load(checkpoint)
+        estimator, done = saved["estimator"], saved["chunks"]
+        stream, validation = saved["stream"], saved["validation"]
+        print("resuming from {} after {} chunks".format(checkpoint, done))
+    chunks = shuffled_chunks(paths, chunk_rows, buffer_rows, seed, width, height, stream)
+    if not done:
+        validation = next(chunks, None)
+        if validation is None:
+            raise ValueError("no positions to train on")
+        validation = deduplicate_positions(validation, width, height)
+    x_validation, y_validation = validation[:, :-1], validation[:, -1]
+
+    def save_checkpoint():
+        # write a new file and rename it, so an interrupted save keeps the
+        # previous checkpoint
+        joblib.dump(dict(estimator=estimator, chunks=done, stream=stream,
+                         validation=validation), checkpoint + ".tmp")
+        os.replace(checkpoint + ".tmp", checkpoint)
+        print("chunk {}: {} trees, validation accuracy {:.3f}".format(
+            done, len(estimator.estimators_), estimator.score(x_validation, y_validation)))
+
+    start_time = time.time()
+    held = []
+    for chunk in chunks:
+        held.append(chunk)
+        if len(np.unique(np.concatenate([block[:, -1] for block in held]))) < 2:
+            continue
+        rows = deduplicate_positions(np.concatenate(held), width, height)
+        held = []
+        estimator.set_params(n_estimators=len(getattr(estimator, "estimators_", [])) +
+                             trees_per_chunk)
+        estimator.fit(rows[:, :-1], rows[:, -1])
+        if len(estimator.estimators_) > max_trees:
+            del estimator.estimators_[:-max_trees]
+            estimator.set_params(n_estimators=max_trees)
+        done += 1
+        if done % checkpoint_every == 0:
+            save_checkpoint()
+    if held:
+        print("dropped {} positions with a single winner".format(sum(len(b) for b in held)))
+    if not done:
+        raise ValueError("no positions with both winners after the validation chunk")
+    if done % checkpoint_every:
+        save_checkpoint()
+    print("trained on {} chunks in {}s".format(done, round(time.time() - start_time, 3)))
+    return estimator
+
+
+def deduplicate_positions(matrix, width=7, height=7):
+    """
+    Return the distinct rows of canonical_rows(matrix), so positions that
+    are rotations or reflections of each other and have the same winner
+    are trained on once.
+    """
+    return np.unique(canonical_rows(matrix, width, height), axis=0)
+
+
+FEATURE_LABELS = ["player1_moves", "player2_moves", "blank_cells",
+                  "player1_center_dist", "player2_center_dist"]
+
+def derived_features(matrix, width=7, height=7):
+    """
+    Compute int16 features for every row of a load_records_matrix() matrix,
+    in the order of FEATURE_LABELS: the number of legal moves of each
+    player, the number of blank cells and each player's Manhattan distance
+    to the center cell (-1 if the player is not placed yet).
+    """
+    cells = width * height
+    rows = len(matrix)
+    # knight neighbors of every cell, padded with the index `cells`, which
+    # points at an always-closed extra column
+    neighbors = np.full((cells, 8), cells, dtype=np.intp)
+    for idx, targets in enumerate(knight_tables(width, height)[0]):
+        neighbors[idx, :len(targets)] = targets
+    is_open = np.zeros((rows, cells + 1), dtype=np.int8)
+    is_open[:, :cells] = 1 - matrix[:, :cells]
+    blank = is_open.sum(axis=1, dtype=np.int16)
+
+    features = np.empty((rows, len(FEATURE_LABELS)), dtype=np.int16)
+    features[:, 2] = blank
+    for player, column in enumerate((cells + 2, cells + 1)):
+        loc = matrix[:, column].astype(np.intp)
+        placed = loc != NO_MOVE
+        loc = np.where(placed, loc, 0)
+        moves = is_open[np.arange(rows)[:, None], neighbors[loc]].sum(axis=1)
+        features[:, player] = np.where(placed, moves, blank)
+        dist = (np.abs(2 * (loc % height) - (height - 1)) +
+                np.abs(2 * (loc // height) - (width - 1))) // 2
+        features[:, 3 + player] = np.where(placed, dist, -1)
+    return features
+
+
+def compile_forest(estimator, max_depth=None):
+    """
+    Flatten the trees of a fitted tree ensemble classifier (ExtraTrees or
+    RandomForest) into a CompiledForest, see compiled_model.py. Nodes deeper
+    than max_depth are dropped and their parent becomes a leaf predicting
+    the class distribution of all the samples that reached it; this bounds
+    the cost of a prediction at the price of some accuracy.
+    """
+    feature, threshold, left, right, value, roots = [], [], [], [], [], []
+    for tree_estimator in estimator.estimators_:
+        tree = tree_estimator.tree_
+        roots.append(len(feature))
+        # depth first, appending each node and patching in the indices of
+        # its children once they are placed
+        stack = [(0, 0, None, None)]
+        while stack:
+            node, depth, parent, side = stack.pop()
+            index = len(feature)
+            if parent is not None:
+                (left if side == 0 else right)[parent] = index
+            counts = tree.value[node][0]
+            total = float(counts.sum())
+            value.extend(float(c) / total for c in counts)
+            if tree.children_left[node] < 0 or (max_depth is not None and depth >= max_depth):
+                feature.append(LEAF)
+                threshold.append(0.)
+                left.append(LEAF)
+                right.append(LEAF)
+            else:
+                feature.append(int(tree.feature[node]))
+                threshold.append(float(tree.threshold[node]))
+                left.append(LEAF)
+                right.append(LEAF)
+                stack.append((tree.children_right[node], depth + 1, index, 1))
+                stack.append((tree.children_left[node], depth + 1, index, 0))
+    classes = [c.item() if hasattr(c, "item") else c for c in estimator.classes_]
+    return CompiledForest(classes, roots, feature, threshold, left, right, value)
+
+
+def export_compiled_model(estimator, path="./compiled_score_model.json", max_depth=None):
+    """
+    Save a fitted tree ensemble as a CompiledForest JSON file, the model
+    loaded by game_agent.learned_score().
+    """
+    model = compile_forest(estimator, max_depth)
+    model.save(path)
+    print("exported {} trees, {} nodes to {}".format(len(model.roots), len(model.feature), path))
+    return model
+
+
+def grid_search_wrapper(x,y,regr,param,regr_name='BLANK',cachedir="./"):
+    from sklearn.grid_search import GridSearchCV
+    start_time = time.time()
+    print("In:{}".format(regr))
+    filename= 'grid_{}.joblib'.format(regr_name)
+    if os.path.isfile(cachedir+filename):
+        print(filename," exists, importing ")
+        return joblib.load(cachedir+filename) 
+    else:
+        print("{} not present, running a gridsearch".format(filename))
+        #search the param_grid for best params based on the f1 score
+        grid_search = GridSearchCV(regr,
+                                   param_grid= param,
+                                   n_jobs=-1,
+                                   scoring=make_scorer(mean_absolute_error,greater_is_better=False)) 
+        print("begin gridsearch training")
+        grid_search.fit(x,y)
+        print("end gridsearch training")
+        #reach into the grid search and pull out the best parameters, and set those on the clf
+        params={}
+        for p in grid_search.best_params_:
+            params[p]=grid_search.best_params_[p]
+        regr.set_params(**params)
+        print("run time:{}s".format(round((time.time()-start_time), 3) ))   
+        joblib.dump(regr,cachedir+filename) 
+    return regr
+        
+        
+if __name__ == "__main__" and STREAM_TRAINING:
+    estimator = train_streaming([datadir + x for x in sorted(os.listdir(datadir))
+                                 if x.endswith('.rec') or x.endswith('.pos')])
+    joblib.dump(estimator,"./trained_score_model.joblib")
+    export_compiled_model(estimator, "./compiled_score_model.json", max_depth=12)
+elif __name__ == "__main__":
+    from sklearn.cross_validation import train_test_split
+    record_paths = [datadir + x for x in os.listdir(datadir) if x.endswith('.rec')]
+    if record_paths:
+        start_time = time.time()
+        game_states = load_records_matrix(record_paths)
+        print("loaded {} positions in {}s".format(len(game_states), round(time.time()-start_time, 3)))
+        game_states = deduplicate_positions(game_states)
+        print("{} distinct positions up to symmetry".format(len(game_states)))
+        x=game_states[:, :-1]
+        y=game_states[:, -1]
+    else:
+        game_states_labeled=load_games_from_dir(datadir)
+        print(game_states_labeled.info())
+    
+        x=game_states_labeled.drop('winner',1).values
+        y=game_states_labeled['winner'].values
+    
+    #  train/validation split
+    X_train, X_validation, y_train, y_validation = train_test_split( x,
+                                                                    y,
+                                                                   test_size=0.20,
+                                                                    random_state=42)
+    print("sample train data size:{}".format(len(y_train)))
+    
+
+    #estimator=LinearRegression(n_jobs=-1)
+    #poor prediction performance
+   
+    #estimator=KNeighborsRegressor(n_jobs = -1)
+    #Knn was slow and didn't predict acuratly enough to bother with 
+   
+    #estimator=RandomForestRegressor(n_jobs =-1, random_state=42)
+    #essentially the same as extra trees with slightly worse performance
+    
+    #estimator=svr()
+    #absolutly horrible train/predict time, and no better performance than Linear
+    
+
+    print("\nstart ExtraTrees:")   
+    estimator=ExtraTreesRegressor(n_jobs =-1)
+    estimator=ExtraTreesClassifier(n_jobs =-1)
+    
+    print("default params of estimator",estimator)
+    #use grid search to spot the best params
+    #param=dict(n_estimators=[3,5,7,10,25,50,200,500], max_features=['auto','sqrt','log2'])
+    param=dict(n_estimators=[3,10,50], max_features=['auto'])
+    estimator=grid_search_wrapper(X_train,y_train,estimator,param,regr_name='ExtraTrees')
+    print("post grid search params of est",estimator)
+    #train the estimator
+    start_time = time.time()
+    estimator.fit(X_train,y_train)
+    fit_time=time.time()-start_time
+    print("fit time:{}s".format(round(fit_time, 3) ))
+    #test on the validation set
+    start_time = time.time()
+    curr_predict=np.array(estimator.predict(X_validation)).copy()
+    predict_time=time.time()-start_time
+    print("predict time:{}s".format(round(predict_time, 3) ))    
+    #track the run info
+    MAE=np.mean(abs(curr_predict - y_validation))
+    print("Mean abs error: {:.2f}".format(MAE))
+    #retrain estimator with all data for final model
+    estimator.fit(x,y)
+    joblib.dump(estimator,"./trained_score_model.joblib")
+    export_compiled_model(estimator, "./compiled_score_model.json", max_depth=12)
+    
+    print(estimator.classes_)
+    print(estimator.feature_importances_)
+
+  
+    #print(2-curr_predict[:5])
+    #print(curr_predict[:5])
+    #for cp in curr_predict:
+        #if cp <=1 or cp>=2:
+            #print(cp)
+    #for i in range(10):
+        #print(curr_predict[i], y_validation[i])
+    #for x in X_validation[:10]:
+        #print(to_string(list(x)))
+        
         
\ No newline at end of file
@@ -0,0 +1,323 @@
+"""Self-play training data for the score model: games between alpha-beta
+agents played in parallel worker processes, with every searched position
+streamed to a binary file together with its search score and the outcome
+of the game.
+
+Each game is numbered and seeded from (seed, game number), which fixes its
+random opening and move shuffles; a rerun with the same arguments skips the
+games already in the file, so an interrupted run resumes where it stopped.
+Searches have a fixed depth by default, so their scores do not depend on the
+machine; --time plays timed iterative deepening moves instead.
+
+The position file starts with an 8 byte magic string followed by chunks of
+positions, each a header and one column per field:
+
+    header (CHUNK_HEADER, little-endian)
+        uint32  number of positions
+        uint8   board width
+        uint8   board height
+        uint16  reserved (0)
+    columns (little-endian), one value per position
+        uint8[cells + 3]    board state in the `Board._board_state` layout,
+                            NO_MOVE for a player that has not moved
+        float32 score       score of the last completed search iteration, for
+                            the player to move (NaN if none completed)
+        uint8   depth       depth of that iteration
+        uint8   ply         moves played before the position
+        uint8   winner      1 if player 1 won the game, 2 if player 2 won
+        uint32  game        game number
+
+A chunk holds whole games, so a game is either in the file or not; a chunk
+cut short by an interrupted run is dropped when the run resumes.  As in game
+record files, boards have fewer than NO_MOVE cells, so every location, depth
+and ply fits in a byte.
+
+Generate 10000 games of custom_score against improved_score with:
+
+    python selfplay.py --games 10000 --agents custom improved --depth 5
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import time
+from array import array
+from collections import namedtuple
+
+from game_agent import AlphaBetaPlayer, custom_score, custom_score_2, custom_score_3, learned_score
+from game_records import NO_MOVE
+from isolation import BitBoard, TurnTimer
+from sample_players import center_score, improved_score, open_move_score
+from tournament import collect_garbage, game_seed
+
+MAGIC = b"ISOPOS1\n"
+CHUNK_HEADER = struct.Struct("<IBBH")
+
+POSITIONS = "./game_state_data/selfplay.pos"
+CHUNK_ROWS = 2**16  # positions buffered before a chunk is written
+SEARCH_DEPTH = 4  # plies searched for every move without --time
+OPENING_PLIES = 2  # random moves before the agents start searching
+
+SCORE_FNS = dict(open=open_move_score, center=center_score, improved=improved_score,
+                 custom=custom_score, custom_2=custom_score_2, custom_3=custom_score_3,
+                 learned=learned_score)
+AGENT_OPTIONS = dict(inplace=True, tt_size=2**16, ordering=True, pvs=True, time_manager=True)
+
+PositionChunk = namedtuple("PositionChunk", ["width", "height", "states", "scores",
+                                             "depths", "plies", "winners", "games"])
+
+
+def _little_endian(values):
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def encode_chunk(width, height, games):
+    """Return the bytes of one chunk holding the positions of `games`, a list
+    of (game, winner, states, scores, depths, plies) as returned by
+    play_game().
+    """
+    rows = sum(len(depths) for _, _, _, _, depths, _ in games)
+    header = CHUNK_HEADER.pack(rows, width, height, 0)
+    scores = array("f")
+    numbers = array("I")
+    winners = bytearray()
+    for game, winner, _, game_scores, depths, _ in games:
+        scores.extend(game_scores)
+        numbers.extend([game] * len(depths))
+        winners.extend([winner] * len(depths))
+    return b"".join([header, b"".join(g[2] for g in games),
+                     _little_endian(scores).tobytes(),
+                     b"".join(g[4] for g in games), b"".join(g[5] for g in games),
+                     bytes(winners), _little_endian(numbers).tobytes()])
+
+
+def _read_chunks(f, offset=None):
+    """Generate (end offset, PositionChunk) for the complete chunks of an open
+    position file, from `offset` (the end of an earlier chunk) if given.
+    """
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("{} is not a position file".format(f.name))
+    if offset is not None:
+        f.seek(offset)
+    while True:
+        header = f.read(CHUNK_HEADER.size)
+        if len(header) < CHUNK_HEADER.size:
+            return
+        rows, width, height, _ = CHUNK_HEADER.unpack(header)
+        state_size = rows * (width * height + 3)
+        data = f.read(state_size + rows * 11)
+        if len(data) < state_size + rows * 11:
+            return
+        offset = state_size
+        scores = _little_endian(array("f", data[offset:offset + 4 * rows]))
+        offset += 4 * rows
+        depths = data[offset:offset + rows]
+        plies = data[offset + rows:offset + 2 * rows]
+        winners = data[offset + 2 * rows:offset + 3 * rows]
+        games = _little_endian(array("I", data[offset + 3 * rows:]))
+        yield f.tell(), PositionChunk(width, height, data[:state_size], scores, depths,
+                                      plies, winners, games)
+
+
+def read_chunks(path, offset=None):
+    """Generate the PositionChunk tuples of a position file, one chunk in
+    memory at a time; `states` holds width * height + 3 bytes per position.
+
+    Reading starts at `offset` when given: the end of a chunk read before,
+    which is chunk_size() bytes past its start; the first chunk starts at
+    len(MAGIC).
+    """
+    with open(path, "rb") as f:
+        for _, chunk in _read_chunks(f, offset):
+            yield chunk
+
+
+def chunk_size(chunk):
+    """Return the number of bytes a PositionChunk takes in its file. """
+    return CHUNK_HEADER.size + len(chunk.states) + 11 * len(chunk.winners)
+
+
+def completed_games(path):
+    """Return (games, end): the set of game numbers in the position file and
+    the offset just past its last complete chunk ((empty set, 0) if there is
+    no file).
+    """
+    games = set()
+    end = 0
+    if os.path.exists(path) and os.path.getsize(path):
+        end = len(MAGIC)
+        with open(path, "rb") as f:
+            for end, chunk in _read_chunks(f):
+                games.update(chunk.games)
+    return games, end
+
+
+class PositionWriter:
+    """Append the positions of finished games to a position file, a chunk of
+    at least `chunk_rows` positions at a time.
+
+    Use as a context manager, or call close() to write the last chunk.
+    `end` is the offset past the last complete chunk (see completed_games());
+    anything after it is dropped.
+    """
+
+    def __init__(self, path, width=7, height=7, chunk_rows=CHUNK_ROWS, end=0):
+        if width * height >= NO_MOVE:
+            raise ValueError("boards with more than {} cells cannot be recorded"
+                             .format(NO_MOVE - 1))
+        self.path = path
+        self.width = width
+        self.height = height
+        self.chunk_rows = chunk_rows
+        self.positions = 0
+        self._games = []
+        self._rows = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab") as f:
+            f.truncate(end)
+            if not end:
+                f.write(MAGIC)
+
+    def write(self, game):
+        """Queue the positions of a game returned by play_game(). """
+        self._games.append(game)
+        self._rows += len(game[4])
+        if self._rows >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if self._games:
+            with open(self.path, "ab") as f:
+                f.write(encode_chunk(self.width, self.height, self._games))
+            self.positions += self._rows
+            self._games = []
+            self._rows = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# game settings of each worker process; set once by _init_worker
+_settings = None
+
+def _init_worker(agents, depth, time_limit, opening, seed, width, height):
+    global _settings
+    _settings = (agents, depth, time_limit, opening, seed, width, height)
+
+
+def play_game(game_number):
+    """Play self-play game `game_number` with the settings of this worker.
+
+    Returns (game number, winner, states, scores, depths, plies): the winner
+    (1 or 2) and, for every position where an agent searched its move, the
+    board state bytes, the search score as an array("f"), and the bytes of
+    the search depths and plies.
+    """
+    agents, depth, time_limit, opening, seed, width, height = _settings
+    random.seed(game_seed(seed, game_number))
+    collect_garbage()
+    players = [AlphaBetaPlayer(score_fn=SCORE_FNS[name], **AGENT_OPTIONS) for name in agents]
+    game = BitBoard(players[0], players[1], width, height)
+    for _ in range(opening):
+        legal_moves = sorted(game.get_legal_moves())
+        if not legal_moves:
+            break
+        game.apply_move(random.choice(legal_moves))
+
+    states = bytearray()
+    scores = array("f")
+    depths = bytearray()
+    plies = bytearray()
+    while True:
+        legal_moves = game.get_legal_moves()
+        if not legal_moves:
+            break
+        player = game.active_player
+        # a fixed depth search gets a clock that never runs out
+        player.time_left = TurnTimer(float("inf") if time_limit is None else time_limit)
+        iterations = player.deepen(game, depth)
+        if iterations:
+            completed, move, score = iterations[-1]
+        else:
+            completed, move, score = 0, legal_moves[0], math.nan
+        states.extend(NO_MOVE if value is None else value for value in game._board_state)
+        scores.append(score)
+        depths.append(completed)
+        plies.append(game.move_count)
+        game.apply_move(move)
+    winner = 1 if game.inactive_player is players[0] else 2
+    return game_number, winner, bytes(states), scores, bytes(depths), bytes(plies)
+
+
+def generate(path=POSITIONS, games=1000, agents=("custom", "improved"), depth=SEARCH_DEPTH,
+             time_limit=None, opening=OPENING_PLIES, seed=0, processes=None, width=7,
+             height=7, chunk_rows=CHUNK_ROWS):
+    """Play self-play games 0 to `games` - 1 that are not in the position file
+    yet and append their positions to it; return the number of games played.
+
+    `agents` names the SCORE_FNS of player 1 and player 2.  Every move is an
+    alpha-beta search of `depth` plies, or of iterative deepening for
+    `time_limit` milliseconds when given (depth None searches until the time
+    runs out).  Games are spread over `processes` worker processes (default
+    one per core); positions are written in the order games finish.
+    """
+    done, end = completed_games(path)
+    todo = [number for number in range(games) if number not in done]
+    settings = (tuple(agents), depth, time_limit, opening, seed, width, height)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    start = time.time()
+    with PositionWriter(path, width, height, chunk_rows, end) as writer:
+        if processes > 1 and len(todo) > 1:
+            with multiprocessing.Pool(processes, _init_worker, settings) as pool:
+                for game in pool.imap_unordered(play_game, todo, chunksize=4):
+                    writer.write(game)
+        else:
+            _init_worker(*settings)
+            for number in todo:
+                writer.write(play_game(number))
+        writer.flush()
+        seconds = time.time() - start
+    print("{} games ({} already in {}), {} positions in {:.1f}s, {:.0f} positions/hour"
+          .format(len(todo), len(done), path, writer.positions, seconds,
+                  3600 * writer.positions / max(seconds, 1e-9)))
+    return len(todo)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--games", type=int, default=1000,
+                        help="play games 0 to GAMES - 1 that are not in the file yet")
+    parser.add_argument("--agents", nargs=2, default=["custom", "improved"],
+                        choices=sorted(SCORE_FNS), help="score functions of player 1 and 2")
+    parser.add_argument("--depth", type=int, default=SEARCH_DEPTH,
+                        help="plies searched for every move")
+    parser.add_argument("--time", type=float, default=None,
+                        help="milliseconds of iterative deepening per move instead of --depth")
+    parser.add_argument("--opening", type=int, default=OPENING_PLIES,
+                        help="random moves before the agents start searching")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=None,
+                        help="worker processes (default: one per core)")
+    parser.add_argument("-o", "--output", default=POSITIONS)
+    args = parser.parse_args(argv)
+
+    generate(args.output, args.games, args.agents,
+             None if args.time is not None else args.depth, args.time, args.opening,
+             args.seed, args.processes)
+
+
+if __name__ == "__main__":
+    main()
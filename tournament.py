@@ -11,19 +11,44 @@ players, and the players play each match twice -- once as the first player and
 once as the second player.  Randomizing the openings and switching the player
 order corrects for imbalances due to both starting position and initiative.
 """
-import itertools, random, warnings, time
+import itertools, random, warnings, time, os, hashlib, inspect, json, math, multiprocessing, gc
 
 from collections import namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor
 
-from isolation import Board
+from isolation import BitBoard
+from game_records import GameRecordWriter, encode_record
+from opening_book import OpeningBook
 from sample_players import (RandomPlayer, open_move_score,
                             improved_score, center_score)
-from game_agent import (MinimaxPlayer, AlphaBetaPlayer, custom_score,
-                        custom_score_2, custom_score_3)
+from game_agent import (MinimaxPlayer, AlphaBetaPlayer, SearchStats,
+                        custom_score, custom_score_2, custom_score_3)
 
 NUM_MATCHES = 10  # number of matches against each opponent
 TIME_LIMIT = 150  # number of milliseconds before timeout
 SAVE_GAME=True
+TT_SIZE = 2**16  # transposition table slots for each alpha-beta agent
+SEARCH_STATS = False  # collect and print per-agent search statistics
+SEARCH_PROCESSES = 1  # processes per alpha-beta search (root splitting); only helps with idle cores
+
+# search options shared by every minimax / alpha-beta agent
+MM_OPTIONS = dict(inplace=True, stats=SEARCH_STATS)
+AB_OPTIONS = dict(inplace=True, tt_size=TT_SIZE, ordering=True, pvs=True, time_manager=True,
+                  endgame=True, stats=SEARCH_STATS, processes=SEARCH_PROCESSES)
+# opening book built by opening_book.py; given to AB_Custom, the agent whose
+# heuristic (custom_score) built it, when the file exists
+OPENING_BOOK = "./opening_book.bin"
+GAME_BOARD = BitBoard  # board engine used for every game; isolation.Board also works
+NUM_PROCESSES = 1  # worker processes for play_matches; 1 plays every game in this process
+TOURNAMENT_SEED = None  # base seed for per-game seeds; set it for a reproducible tournament (see play_matches)
+# results of the games of seeded tournaments (see ResultCache); None disables
+RESULT_CACHE = "./game_state_data/results.jsonl"
+# compare each AB_Custom agent with AB_Improved by a sequential probability
+# ratio test, stopping its games once decided (see SPRT and play_sprt)
+USE_SPRT = False
+SPRT_DELTA = .15  # H1: an agent wins 0.5 + SPRT_DELTA of its untied game pairs
+SPRT_ALPHA = .05  # probability of accepting H1 when H0 holds
+SPRT_BETA = .05  # probability of accepting H0 when H1 holds
 
 DESCRIPTION = """
 This script evaluates the performance of the custom_score evaluation function
@@ -33,72 +58,431 @@ Iterative Deepening and the custom_score function defined in game_agent.py.
 
 Agent = namedtuple("Agent", ["player", "name"])
 
-def save_game(state_hist,winner,game_file):
-    """ Save the state of the game and the winner 
-    preserve the game to a file for later analysis
-    each row in the file is the game state.
-    row has format [gamestate],player_num_of_winner
+# Games are appended to this binary record file (see game_records.py)
+GAME_RECORDS = "./game_state_data/games.rec"
+_record_writer = None
+
+def record_writer():
+    """ Return the writer for GAME_RECORDS, opening it on first use """
+    global _record_writer
+    if _record_writer is None:
+        os.makedirs(os.path.dirname(GAME_RECORDS), exist_ok=True)
+        _record_writer = GameRecordWriter(GAME_RECORDS)
+    return _record_writer
+
+def close_record_writer():
+    """ Write out any buffered game records """
+    global _record_writer
+    if _record_writer is not None:
+        _record_writer.close()
+        _record_writer = None
+
+def encode_game(game, winner, opening, history, termination, names, seed=0):
+    """ Encode a finished game as a binary game record """
+    return encode_record(list(opening) + [tuple(move) for move in history],
+                         1 if winner == game._player_1 else 2, termination,
+                         width=game.width, height=game.height,
+                         opening=len(opening), seed=seed, players=names)
+
+def merge_stats(search_stats, agents, game_stats):
+    """ Add the per-game statistics of each agent (None for agents without
+    them) to the search_stats dict of Agent -> SearchStats
     """
-    import pickle
-    try:
-        with open(game_file, 'wb') as f:
-            pickle.dump((state_hist,winner),f)
-    except:
-        return False
-    return True
-
-def load_game(game_file):
-    """ load the state of the game and the winner 
-    load the game from a file for later analysis
-    each row in the file is the game state.
-    row has format [gamestate],player_num_of_winner
-    """
-    import pickle
-    try:
-        with open(game_file, 'rb') as f:
-            state=pickle.load(f)
-    except:
-        return False,([0],0)
-    return True,state
+    for agent, player_stats in zip(agents, game_stats):
+        if player_stats is not None:
+            search_stats.setdefault(agent, SearchStats()).merge(player_stats)
+
+def termination_counts(termination, agent_won):
+    """ Return the (timeouts, forfeits) a game adds to a round's tally: a
+    game lost on time by either player, or forfeited by the test agent
+    """
+    return int(termination == "timeout"), int(not agent_won and termination == "forfeit")
+
+# objects frozen by the last full collection of collect_garbage()
+_frozen_after_collection = 0
+
+def collect_garbage():
+    """ Freeze the objects alive before a game, the agents' transposition
+    tables among them, so the collections that come due during the game's
+    turns only traverse objects created since.  Once the frozen objects have
+    doubled since the last full collection, they are unfrozen and collected
+    first, which keeps the cost of those collections low overall
+    """
+    global _frozen_after_collection
+    if not hasattr(gc, "freeze"):  # Python < 3.7
+        gc.collect()
+    elif gc.get_freeze_count() >= 2 * _frozen_after_collection:
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+        _frozen_after_collection = gc.get_freeze_count()
+    else:
+        gc.freeze()
 
-def play_round(cpu_agent, test_agents, win_counts, num_matches):
+def play_round(cpu_agent, test_agents, win_counts, num_matches, search_stats=None):
     """Compare the test agents to the cpu agent in "fair" matches.
 
     "Fair" matches use random starting locations and force the agents to
     play as both first and second player to control for advantages resulting
     from choosing better opening moves or having first initiative to move.
+
+    The search statistics of agents that collect them are added to the
+    search_stats dict, if given.
     """
     timeout_count = 0
     forfeit_count = 0
     for _ in range(num_matches):
 
-        games = sum([[Board(cpu_agent.player, agent.player),
-                      Board(agent.player, cpu_agent.player)]
-                    for agent in test_agents], [])
+        seats = sum([[(cpu_agent, agent), (agent, cpu_agent)]
+                     for agent in test_agents], [])
+        games = [GAME_BOARD(first.player, second.player) for first, second in seats]
 
         # initialize all games with a random move and response
+        opening = []
         for _ in range(2):
             move = random.choice(games[0].get_legal_moves())
+            opening.append(move)
             for game in games:
                 game.apply_move(move)
 
         # play all games and tally the results
-        for game in games:
-            winner, _, termination,state_hist = game.play(time_limit=TIME_LIMIT)
+        for (first, second), game in zip(seats, games):
+            collect_garbage()
+            winner, history, termination,state_hist = game.play(time_limit=TIME_LIMIT)
             win_counts[winner] += 1
-            filename="./game_state_data/game_state"+str(random.randint(1, 1000000000))+str(win_counts[winner])+".pckl"
-            if winner == game._player_1 and SAVE_GAME==True:
-                save_game(state_hist,1,filename)
+            agent = second if first is cpu_agent else first
+            timeouts, forfeits = termination_counts(termination, winner == agent.player)
+            timeout_count += timeouts
+            forfeit_count += forfeits
+            if search_stats is not None:
+                merge_stats(search_stats, (first, second), game.search_stats)
+            if SAVE_GAME==True:
+                record_writer().write_encoded(encode_game(
+                    game, winner, opening, history, termination,
+                    (first.name, second.name)))
+
+    return timeout_count, forfeit_count
+
+
+def game_seed(*key):
+    """ Derive a 64 bit seed from a key tuple; stable across runs and
+    processes (unlike hash() of a tuple containing strings)
+    """
+    return int(hashlib.sha1(repr(key).encode()).hexdigest()[:16], 16)
+
+def function_fingerprint(fn):
+    """ Name and source hash of a function, so editing a heuristic changes
+    the configuration of the agents using it
+    """
+    try:
+        source = inspect.getsource(fn).encode()
+    except (OSError, TypeError):
+        source = getattr(getattr(fn, "__code__", None), "co_code", b"")
+    return "{}.{}:{}".format(fn.__module__, fn.__qualname__,
+                             hashlib.sha1(source).hexdigest()[:16])
+
+def config_value(value):
+    """ A stable representation of a player attribute for agent_config() """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if hasattr(value, "__code__"):
+        return function_fingerprint(value)
+    if isinstance(value, OpeningBook):
+        return "OpeningBook:" + hashlib.sha1(
+            repr(sorted(value.table.items())).encode()).hexdigest()[:16]
+    return type(value).__name__
+
+# constructor parameters the players keep under another attribute name
+CONFIG_ATTRIBUTES = {"score_fn": ("_score_fn", "score"), "timeout": ("TIMER_THRESHOLD",),
+                     "tt_size": ("_tt_size",)}
+# constructor parameters that do not change how a player plays
+CONFIG_IGNORED = ("self", "stats")
+
+def agent_config(player):
+    """ Return the configuration of a player: its class and the value of
+    every constructor parameter except CONFIG_IGNORED, read back from the
+    player's attributes
+    """
+    config = {"class": type(player).__name__}
+    for name in inspect.signature(type(player).__init__).parameters:
+        for attr in (name,) + CONFIG_ATTRIBUTES.get(name, ()):
+            if name not in CONFIG_IGNORED and hasattr(player, attr):
+                config[name] = config_value(getattr(player, attr))
+                break
+    return config
+
+def config_hash(player):
+    """ Hash of agent_config(player), stable across runs and processes """
+    return hashlib.sha1(repr(sorted(agent_config(player).items())).encode()).hexdigest()
+
+def game_key(cpu_config, agent_config, agent_first, seed):
+    """ Result cache key of one game: the config hashes of both agents, the
+    seat order, the game seed and the tournament's game settings
+    """
+    return hashlib.sha1(repr((cpu_config, agent_config, agent_first, seed, TIME_LIMIT,
+                              GAME_BOARD.__name__)).encode()).hexdigest()
+
+class ResultCache:
+    """Results of finished games, keyed by game_key().
+
+    Results are appended to a JSON lines file as the games finish, so a
+    rerun of a seeded tournament, or one interrupted part way, only plays
+    the games of agents whose configuration changed.
+
+    Parameters
+    ----------
+    path : str
+        The cache file; created on the first result.
+    """
+    def __init__(self, path=RESULT_CACHE):
+        self.path = path
+        self.results = {}
+        self._file = None
+        # the file ends with a line cut short by an interrupted run
+        self._cut_short = False
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    self._cut_short = not line.endswith("\n")
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.results[entry["key"]] = (entry["agent_won"], entry["termination"])
+
+    def __len__(self):
+        return len(self.results)
+
+    def get(self, key):
+        """ Return the (agent_won, termination) result of a game, or None """
+        return self.results.get(key)
+
+    def put(self, key, agent_won, termination):
+        if self._file is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, "a")
+            if self._cut_short:
+                self._file.write("\n")
+        self._file.write(json.dumps(dict(key=key, agent_won=agent_won,
+                                         termination=termination)) + "\n")
+        self._file.flush()
+        self.results[key] = (agent_won, termination)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def random_opening(rng):
+    """ Pick the random first move and response shared by a round's games """
+    board = GAME_BOARD("Player1", "Player2")
+    for _ in range(2):
+        board.apply_move(rng.choice(sorted(board.get_legal_moves())))
+    return board.get_player_location("Player1"), board.get_player_location("Player2")
+
+# Agents held by each worker process of the parallel tournament; set once by
+# _init_worker so tasks only carry agent indices
+_worker_agents = None
+
+def _set_agents(cpu_agents, test_agents):
+    global _worker_agents
+    _worker_agents = (cpu_agents, test_agents)
+
+def _init_worker(cpu_agents, test_agents, worker_counter):
+    """ Process pool initializer: keep the agents and pin this worker to a
+    single core so concurrent games don't compete for CPU time
+    """
+    _set_agents(cpu_agents, test_agents)
+    if hasattr(os, "sched_setaffinity"):
+        with worker_counter.get_lock():
+            worker_id = worker_counter.value
+            worker_counter.value += 1
+        cores = sorted(os.sched_getaffinity(0))
+        os.sched_setaffinity(0, {cores[worker_id % len(cores)]})
+
+def play_game(cpu_idx, agent_idx, agent_first, opening, seed):
+    """ Play one game in a worker process; `seed` seeds the random module
+    (move shuffles, random players) so the game can be replayed.
+
+    Returns (cpu_idx, agent_idx, agent_won, termination, record, stats) where
+    record is the encoded game record, or None if SAVE_GAME is off, and stats
+    is the (cpu agent, test agent) pair of search statistics
+    """
+    cpu_agents, test_agents = _worker_agents
+    cpu_player = cpu_agents[cpu_idx].player
+    agent_player = test_agents[agent_idx].player
+    random.seed(seed)
+    if agent_first:
+        game = GAME_BOARD(agent_player, cpu_player)
+    else:
+        game = GAME_BOARD(cpu_player, agent_player)
+    for move in opening:
+        game.apply_move(move)
+    collect_garbage()
+    winner, history, termination, state_hist = game.play(time_limit=TIME_LIMIT)
+    record = None
+    if SAVE_GAME==True:
+        names = (cpu_agents[cpu_idx].name, test_agents[agent_idx].name)
+        record = encode_game(game, winner, opening, history, termination,
+                             names[::-1] if agent_first else names, seed)
+    stats = game.search_stats[::-1] if agent_first else game.search_stats
+    return cpu_idx, agent_idx, winner == agent_player, termination, record, stats
+
+class InlineExecutor:
+    """ Stand-in for the process pool that plays each submitted game at once
+    in this process
+    """
+    def submit(self, fn, *args):
+        return completed(fn(*args))
+
+    def shutdown(self):
+        pass
+
+def completed(result):
+    """ A future already holding `result` """
+    future = Future()
+    future.set_result(result)
+    return future
+
+def submit_round(executor, cpu_idx, cpu_agent, test_agents, num_matches, base_seed,
+                 cache=None, configs=None, first_match=0, agent_indices=None):
+    """ Queue every game of play_round() against cpu_agents[cpu_idx] on the
+    executor; each match shares one seeded random opening and each game
+    gets its own seed from (base_seed, opponent, match, agent, seat), with
+    the agents named, so a game keeps its seed when agents are added,
+    removed or reordered.
+
+    The matches are numbered from `first_match`, and only the test agents
+    at `agent_indices` (default all) play them.  Games found in `cache`
+    (with the config_hash() of every player in the `configs` dict) are not
+    played again; their futures hold the cached result.  Returns a list of
+    (cache key, future) pairs, in match, agent, seat order.
+    """
+    if agent_indices is None:
+        agent_indices = range(len(test_agents))
+    futures = []
+    for match in range(first_match, first_match + num_matches):
+        opening = random_opening(random.Random(game_seed(base_seed, cpu_agent.name, match)))
+        for agent_idx in agent_indices:
+            agent = test_agents[agent_idx]
+            for agent_first in (False, True):
+                seed = game_seed(base_seed, cpu_agent.name, match, agent.name, agent_first)
+                key = None
+                if cache is not None:
+                    key = game_key(configs[cpu_agent.player], configs[agent.player],
+                                   agent_first, seed)
+                    result = cache.get(key)
+                    if result is not None:
+                        futures.append((key, completed(
+                            (cpu_idx, agent_idx) + tuple(result) + (None, (None, None)))))
+                        continue
+                futures.append((key, executor.submit(play_game, cpu_idx, agent_idx,
+                                                     agent_first, opening, seed)))
+    return futures
+
+def collect_round(futures, cpu_agent, test_agents, win_counts, search_stats=None,
+                  cache=None, outcomes=None):
+    """ Wait for the games queued by submit_round() and tally them like
+    play_round(), adding the results of new games to `cache` and, if given,
+    appending whether the test agent won to the `outcomes` list of its
+    index (a dict of lists) in the order the games were queued.
+
+    Returns (timeouts, forfeits, cached games)
+    """
+    timeout_count = 0
+    forfeit_count = 0
+    cached_count = 0
+    for key, future in futures:
+        _, agent_idx, agent_won, termination, record, stats = future.result()
+        if cache is not None:
+            if cache.get(key) is None:
+                cache.put(key, agent_won, termination)
             else:
-                if SAVE_GAME==True:
-                    save_game(state_hist,2,filename)
+                cached_count += 1
+        if record is not None:
+            record_writer().write_encoded(record)
+        if search_stats is not None:
+            merge_stats(search_stats, (cpu_agent, test_agents[agent_idx]), stats)
+        if outcomes is not None:
+            outcomes.setdefault(agent_idx, []).append(agent_won)
+        if agent_won:
+            win_counts[test_agents[agent_idx].player] += 1
+        else:
+            win_counts[cpu_agent.player] += 1
+        timeouts, forfeits = termination_counts(termination, agent_won)
+        timeout_count += timeouts
+        forfeit_count += forfeits
+    return timeout_count, forfeit_count, cached_count
 
-        if termination == "timeout":
-            timeout_count += 1
-        elif winner not in test_agents and termination == "forfeit":
-            forfeit_count += 1
 
-    return timeout_count, forfeit_count
+class SPRT:
+    """Sequential probability ratio test of whether a test agent beats the
+    baseline agent.
+
+    Games the two agents played from the same opening and seat against the
+    same opponent are compared in pairs; pairs the agents both won or both
+    lost are ties and carry no information on the difference.  The test
+    weighs H0, the agent wins half of the other pairs, against H1, it wins
+    0.5 + delta of them, and ends once the log likelihood ratio crosses a
+    bound: `result` becomes "better" (H1) or "not better" (H0, which an
+    agent worse than the baseline also ends with).
+
+    Parameters
+    ----------
+    delta : float
+        Advantage of the agent under H1.
+
+    alpha, beta : float
+        Probabilities of accepting H1 when H0 holds, and H0 when H1 holds.
+    """
+    def __init__(self, delta=SPRT_DELTA, alpha=SPRT_ALPHA, beta=SPRT_BETA):
+        self.win_llr = math.log((.5 + delta) / .5)
+        self.loss_llr = math.log((.5 - delta) / .5)
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        self.wins = 0
+        self.losses = 0
+        self.llr = 0.
+        self.result = None
+
+    def add(self, agent_won, baseline_won):
+        """ Add a pair of games; ignored once the test has ended """
+        if self.result is not None or agent_won == baseline_won:
+            return
+        if agent_won:
+            self.wins += 1
+            self.llr += self.win_llr
+        else:
+            self.losses += 1
+            self.llr += self.loss_llr
+        if self.llr >= self.upper:
+            self.result = "better"
+        elif self.llr <= self.lower:
+            self.result = "not better"
+
+
+def print_search_stats(search_stats, agents):
+    """ Print a table of per-move search statistics for the agents that
+    collected them, in the order of `agents`
+    """
+    print("\n{:^74}".format("Search statistics (per move)"))
+    print("{:^13}{:^7}{:^10}{:^10}{:^11}{:^11}{:^12}".format(
+        "Agent", "Moves", "Nodes", "Leaves", "Depth", "Margin ms", "Cutoffs"))
+    print("{:^13}{:^7}{:^10}{:^10}{:^11}{:^11}{:^12}".format(
+        "", "", "", "", "mean/max", "mean/min", "ply 0/1/2"))
+    for agent in agents:
+        if agent not in search_stats:
+            continue
+        summary = search_stats[agent].summary()
+        moves = max(summary["moves"], 1)
+        cutoffs = (summary["cutoffs"] + [0, 0, 0])[:3]
+        print("{:^13}{:^7}{:^10.0f}{:^10.0f}{:^11}{:^11}{:^12}".format(
+            agent.name, summary["moves"], summary["nodes_per_move"],
+            summary["leaves_per_move"],
+            "{:.1f}/{}".format(summary["mean_depth"], summary["max_depth"]),
+            "{:.0f}/{:.0f}".format(summary["mean_margin"], summary["min_margin"]),
+            "/".join("{:.1f}".format(count / moves) for count in cutoffs)))
 
 
 def update(total_wins, wins):
@@ -107,11 +491,78 @@ def update(total_wins, wins):
     return total_wins
 
 
-def play_matches(cpu_agents, test_agents, num_matches):
-    """Play matches between the test agent and each cpu_agent individually. """
+def available_processes(num_processes):
+    """ Cap num_processes at the number of available cores """
+    if num_processes > 1:
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+        if num_processes > cores:
+            # more workers than cores would make games share a core and
+            # skew the per-move time limit
+            warnings.warn("Reducing NUM_PROCESSES from {} to the {} available cores"
+                          .format(num_processes, cores))
+            num_processes = cores
+    return num_processes
+
+def start_pool(cpu_agents, test_agents, num_processes):
+    """ Start the worker processes that play the games queued by submit_round() """
+    return ProcessPoolExecutor(
+        max_workers=num_processes, initializer=_init_worker,
+        initargs=(cpu_agents, test_agents, multiprocessing.Value("i", 0)))
+
+def open_result_cache(result_cache, cpu_agents, test_agents):
+    """ Return (cache, configs) for submit_round(): the ResultCache of the
+    file `result_cache` and the config_hash() of every agent's player, or
+    (None, None) without a file
+    """
+    if not result_cache:
+        return None, None
+    configs = {agent.player: config_hash(agent.player)
+               for agent in list(cpu_agents) + list(test_agents)}
+    return ResultCache(result_cache), configs
+
+
+def play_matches(cpu_agents, test_agents, num_matches, num_processes=NUM_PROCESSES,
+                 seed=TOURNAMENT_SEED, result_cache=RESULT_CACHE):
+    """Play matches between the test agent and each cpu_agent individually.
+
+    With num_processes > 1 every game is queued up front on a pool of worker
+    processes, each playing one game at a time on its own core, and the
+    results are tallied per opponent in the usual order.
+
+    With a `seed`, the openings and every game's random module are seeded
+    from it (see submit_round()), and the result of every game is stored in
+    the `result_cache` file under the configurations of both agents and the
+    game's seed: a rerun only plays the games of agents whose constructor
+    options or score function source changed.  Moves still depend on how
+    deep the timed searches get, so a replayed game can have another
+    outcome; the cache keeps the first.  Search statistics and game records
+    cover the games played in this run.
+    """
+    executor = None
+    pending = None
+    num_processes = available_processes(num_processes)
+    base_seed = seed
+    cache, configs = open_result_cache(result_cache if seed is not None else None,
+                                       cpu_agents, test_agents)
+    if num_processes > 1:
+        if base_seed is None:
+            base_seed = random.randint(0, 2**32 - 1)
+        print("Parallel tournament: {} processes, seed {}".format(num_processes, base_seed))
+        executor = start_pool(cpu_agents, test_agents, num_processes)
+        pending = [submit_round(executor, idx, agent, test_agents, num_matches,
+                                base_seed, cache, configs)
+                   for idx, agent in enumerate(cpu_agents)]
+    elif base_seed is not None:
+        # the seeded games of the pool, played in this process a round at a time
+        print("Seeded tournament: seed {}".format(base_seed))
+        _set_agents(cpu_agents, test_agents)
+        executor = InlineExecutor()
+
     total_wins = {agent.player: 0 for agent in test_agents}
+    search_stats = {}
     total_timeouts = 0.
     total_forfeits = 0.
+    total_cached = 0
     total_matches = 2 * num_matches * len(cpu_agents)
 
     print("\n{:^9}{:^13}{:^13}{:^13}{:^13}{:^13}".format(
@@ -129,7 +580,13 @@ def play_matches(cpu_agents, test_agents, num_matches):
 
         print("{!s:^9}{:^13}".format(idx + 1, agent.name), end="", flush=True)
 
-        counts = play_round(agent, test_agents, wins, num_matches)
+        if executor is None:
+            counts = play_round(agent, test_agents, wins, num_matches, search_stats)
+        else:
+            futures = pending[idx] if pending is not None else submit_round(
+                executor, idx, agent, test_agents, num_matches, base_seed, cache, configs)
+            counts = collect_round(futures, agent, test_agents, wins, search_stats, cache)
+            total_cached += counts[2]
         total_timeouts += counts[0]
         total_forfeits += counts[1]
         total_wins = update(total_wins, wins)
@@ -139,6 +596,14 @@ def play_matches(cpu_agents, test_agents, num_matches):
         print(" {:^5}| {:^5} {:^5}| {:^5} {:^5}| {:^5} {:^5}| {:^5}"
               .format(*round_totals))
 
+    if executor is not None:
+        executor.shutdown()
+    if cache is not None:
+        cache.close()
+        print("{} of {} games read from {}".format(total_cached, total_matches * len(test_agents),
+                                                   result_cache))
+    close_record_writer()
+
     print("-" * 74)
     print("{:^9}{:^13}{:^13}{:^13}{:^13}{:^13}\n".format(
         "", "Win Rate:",
@@ -146,6 +611,9 @@ def play_matches(cpu_agents, test_agents, num_matches):
           for a in test_agents]
     ))
 
+    if search_stats:
+        print_search_stats(search_stats, list(test_agents) + list(cpu_agents))
+
     if total_timeouts:
         print(("\nThere were {} timeouts during the tournament -- make sure " +
                "your agent handles search timeout correctly, and consider " +
@@ -156,33 +624,135 @@ def play_matches(cpu_agents, test_agents, num_matches):
                "legal moves available to play.\n").format(total_forfeits))
 
 
+def play_sprt(cpu_agents, test_agents, num_matches, num_processes=NUM_PROCESSES,
+              seed=TOURNAMENT_SEED, result_cache=RESULT_CACHE, baseline=0):
+    """Compare every test agent with test_agents[baseline] by a sequential
+    probability ratio test (see SPRT), and stop playing an agent's games
+    once its test has ended.
+
+    The games are played in rounds: one match (both seats, from a shared
+    opening) against every cpu agent, for the baseline and every agent
+    still undecided.  Rounds go on while an agent is undecided and the
+    round fits in the games of the full tournament (num_matches matches
+    against every cpu agent for every test agent), so the games decided
+    agents no longer play go to the undecided ones.  Games are seeded and
+    cached as in play_matches(); without a seed, one is picked.
+
+    Returns a dict of test agent name -> "better", "not better" or None
+    (undecided), with None for the baseline.
+    """
+    num_processes = available_processes(num_processes)
+    base_seed = random.randint(0, 2**32 - 1) if seed is None else seed
+    cache, configs = open_result_cache(result_cache if seed is not None else None,
+                                       cpu_agents, test_agents)
+    if num_processes > 1:
+        executor = start_pool(cpu_agents, test_agents, num_processes)
+    else:
+        _set_agents(cpu_agents, test_agents)
+        executor = InlineExecutor()
+    print("SPRT tournament: {} processes, seed {}, {} vs {} (delta {}, alpha {}, beta {})"
+          .format(num_processes, base_seed, "/".join(agent.name for idx, agent in
+                                                      enumerate(test_agents) if idx != baseline),
+                  test_agents[baseline].name, SPRT_DELTA, SPRT_ALPHA, SPRT_BETA))
+
+    tests = {idx: SPRT() for idx in range(len(test_agents)) if idx != baseline}
+    wins = {agent.player: 0 for agent in list(test_agents) + list(cpu_agents)}
+    games = [0] * len(test_agents)
+    search_stats = {}
+    total_timeouts = 0
+    total_forfeits = 0
+    budget = 2 * num_matches * len(cpu_agents) * len(test_agents)
+    round_games = 2 * len(cpu_agents)
+    match = 0
+    while True:
+        undecided = [idx for idx in sorted(tests) if tests[idx].result is None]
+        agent_indices = [baseline] + undecided
+        if not undecided or sum(games) + round_games * len(agent_indices) > budget:
+            break
+        pending = [submit_round(executor, idx, agent, test_agents, 1, base_seed, cache,
+                                configs, first_match=match, agent_indices=agent_indices)
+                   for idx, agent in enumerate(cpu_agents)]
+        for idx, futures in enumerate(pending):
+            outcomes = {}
+            counts = collect_round(futures, cpu_agents[idx], test_agents, wins,
+                                   search_stats, cache, outcomes)
+            total_timeouts += counts[0]
+            total_forfeits += counts[1]
+            for agent_idx in undecided:
+                for agent_won, baseline_won in zip(outcomes[agent_idx], outcomes[baseline]):
+                    tests[agent_idx].add(agent_won, baseline_won)
+        for agent_idx in agent_indices:
+            games[agent_idx] += round_games
+        match += 1
+        for agent_idx in undecided:
+            if tests[agent_idx].result is not None:
+                print("Match {}: {} is {} than {}".format(
+                    match, test_agents[agent_idx].name, tests[agent_idx].result,
+                    test_agents[baseline].name))
+
+    executor.shutdown()
+    if cache is not None:
+        cache.close()
+    close_record_writer()
+
+    print("\n{:^13}{:^9}{:^11}{:^13}{:^9}{:^12}".format(
+        "Agent", "Games", "Win Rate", "Pairs W/L", "LLR", "Result"))
+    results = {}
+    for idx, agent in enumerate(test_agents):
+        test = tests.get(idx)
+        results[agent.name] = test.result if test else None
+        print("{:^13}{:^9}{:^11}{:^13}{:^9}{:^12}".format(
+            agent.name, games[idx],
+            "{:.1f}%".format(100 * wins[agent.player] / max(games[idx], 1)),
+            "{}/{}".format(test.wins, test.losses) if test else "",
+            "{:.2f}".format(test.llr) if test else "",
+            "baseline" if test is None else test.result or "undecided"))
+    print("{} of {} games played".format(sum(games), budget))
+
+    if search_stats:
+        print_search_stats(search_stats, list(test_agents) + list(cpu_agents))
+    if total_timeouts:
+        print("\nThere were {} timeouts during the tournament.".format(total_timeouts))
+    if total_forfeits:
+        print("\nYour ID search forfeited {} games while there were still legal "
+              "moves available to play.".format(total_forfeits))
+    return results
+
+
 def main():
     start_time = time.time()
+    book = OpeningBook.load(OPENING_BOOK) if os.path.exists(OPENING_BOOK) else None
     # Define two agents to compare -- these agents will play from the same
     # starting position against the same adversaries in the tournament
     test_agents = [
-        Agent(AlphaBetaPlayer(score_fn=improved_score), "AB_Improved"),
-        Agent(AlphaBetaPlayer(score_fn=custom_score), "AB_Custom"),
-        Agent(AlphaBetaPlayer(score_fn=custom_score_2), "AB_Custom_2"),
-        Agent(AlphaBetaPlayer(score_fn=custom_score_3), "AB_Custom_3")
+        Agent(AlphaBetaPlayer(score_fn=improved_score, **AB_OPTIONS), "AB_Improved"),
+        Agent(AlphaBetaPlayer(score_fn=custom_score, opening_book=book, **AB_OPTIONS), "AB_Custom"),
+        Agent(AlphaBetaPlayer(score_fn=custom_score_2, **AB_OPTIONS), "AB_Custom_2"),
+        Agent(AlphaBetaPlayer(score_fn=custom_score_3, **AB_OPTIONS), "AB_Custom_3")
     ]
 
     # Define a collection of agents to compete against the test agents
     cpu_agents = [
         Agent(RandomPlayer(), "Random"),
-        Agent(MinimaxPlayer(score_fn=open_move_score), "MM_Open"),
-        Agent(MinimaxPlayer(score_fn=center_score), "MM_Center"),
-        Agent(MinimaxPlayer(score_fn=improved_score), "MM_Improved"),
-        Agent(AlphaBetaPlayer(score_fn=open_move_score), "AB_Open"),
-        Agent(AlphaBetaPlayer(score_fn=center_score), "AB_Center"),
-        Agent(AlphaBetaPlayer(score_fn=improved_score), "AB_Improved")
+        Agent(MinimaxPlayer(score_fn=open_move_score, **MM_OPTIONS), "MM_Open"),
+        Agent(MinimaxPlayer(score_fn=center_score, **MM_OPTIONS), "MM_Center"),
+        Agent(MinimaxPlayer(score_fn=improved_score, **MM_OPTIONS), "MM_Improved"),
+        Agent(AlphaBetaPlayer(score_fn=open_move_score, **AB_OPTIONS), "AB_Open"),
+        Agent(AlphaBetaPlayer(score_fn=center_score, **AB_OPTIONS), "AB_Center"),
+        Agent(AlphaBetaPlayer(score_fn=improved_score, **AB_OPTIONS), "AB_Improved")
     ]
 
     print(DESCRIPTION)
     print("{:^74}".format("*************************"))
     print("{:^74}".format("Playing Matches"))
     print("{:^74}".format("*************************"))
-    play_matches(cpu_agents, test_agents, NUM_MATCHES)
+    if USE_SPRT:
+        play_sprt(cpu_agents, test_agents, NUM_MATCHES)
+    else:
+        play_matches(cpu_agents, test_agents, NUM_MATCHES)
+    for agent in cpu_agents + test_agents:
+        if isinstance(agent.player, AlphaBetaPlayer):
+            agent.player.close()
     
     tournament_time=time.time()-start_time
     print("Tournament time time:{}s".format(round(tournament_time, 3) )) 